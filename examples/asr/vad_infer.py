@@ -0,0 +1,133 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from argparse import ArgumentParser
+
+from ruamel.yaml import YAML
+
+import nemo
+import nemo.collections.asr as nemo_asr
+from nemo.collections.asr.parts import vad
+from nemo.utils import logging
+from nemo.utils.helpers import get_checkpoint_from_dir
+
+"""
+This script detects speech in long recordings with a VAD segment classifier trained by quartznet_vad.py,
+see nemo.collections.asr.parts.vad. Recordings are classified in sliding windows, the window probabilities are
+merged into frame speech probabilities, smoothed, and the speech segments are written as a manifest.
+
+Args:
+    model_config : model configuration file the classifier was trained with, e.g. configs/quartznet_vad_3x1.yaml
+    load_dir : directory of the JasperEncoder and JasperDecoderForClassification checkpoints
+    dataset : manifest of the recordings, with audio_filepath and optional offset and duration
+    out_manifest : manifest of the detected speech segments
+"""
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--model_config", type=str, required=True, help="model configuration file: model.yaml")
+    parser.add_argument("--load_dir", type=str, required=True, help="directory with the classifier checkpoints")
+    parser.add_argument("--dataset", type=str, required=True, help="manifest of the recordings")
+    parser.add_argument("--out_manifest", type=str, required=True, help="manifest of the speech segments")
+    parser.add_argument("--batch_size", type=int, default=256, help="number of windows classified at once")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="number of audio reading workers")
+    parser.add_argument("--window_length_in_sec", type=float, default=0.63, help="training segment length")
+    parser.add_argument("--shift_length_in_sec", type=float, default=0.01, help="frame length")
+    parser.add_argument("--onset", type=float, default=0.5, help="speech starts at this probability")
+    parser.add_argument("--offset", type=float, default=0.3, help="speech ends below this probability")
+    parser.add_argument("--median_filter_in_sec", type=float, default=0.25)
+    parser.add_argument("--min_duration_on", type=float, default=0.1, help="shorter segments are dropped")
+    parser.add_argument("--min_duration_off", type=float, default=0.2, help="shorter gaps are bridged")
+    args = parser.parse_args()
+
+    nf = nemo.core.NeuralModuleFactory()
+
+    yaml = YAML(typ="safe")
+    with open(args.model_config) as f:
+        jasper_params = yaml.load(f)
+    labels = jasper_params['labels']
+    sample_rate = jasper_params['sample_rate']
+
+    data_preprocessor = nemo_asr.AudioToMFCCPreprocessor(
+        sample_rate=sample_rate, **jasper_params["AudioToMFCCPreprocessor"],
+    )
+    crop_pad_augmentation = nemo_asr.CropOrPadSpectrogramAugmentation(audio_length=128)
+    jasper_encoder = nemo_asr.JasperEncoder(**jasper_params["JasperEncoder"])
+    jasper_decoder = nemo_asr.JasperDecoderForClassification(
+        feat_in=jasper_params["JasperEncoder"]["jasper"][-1]["filters"],
+        num_classes=len(labels),
+        **jasper_params['JasperDecoderForClassification'],
+    )
+    encoder_checkpoint, decoder_checkpoint = get_checkpoint_from_dir(
+        ["JasperEncoder", "JasperDecoderForClassification"], args.load_dir
+    )
+    jasper_encoder.restore_from(encoder_checkpoint)
+    jasper_decoder.restore_from(decoder_checkpoint)
+
+    dataset = vad.SlidingWindowDataset(
+        args.dataset,
+        sample_rate=sample_rate,
+        window_length_in_sec=args.window_length_in_sec,
+        shift_length_in_sec=args.shift_length_in_sec,
+    )
+    inference = vad.VADInference(
+        data_preprocessor,
+        jasper_encoder,
+        jasper_decoder,
+        crop_pad=crop_pad_augmentation,
+        speech_index=labels.index('speech'),
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+    )
+    logging.info(f"Detecting speech in {len(dataset)} recordings on {nf.placement}")
+
+    total_duration = 0.0
+
+    def segments():
+        nonlocal total_duration
+        for item, window_probs in inference(dataset):
+            frame_probs = vad.merge_overlapping_windows(
+                window_probs, args.window_length_in_sec, args.shift_length_in_sec
+            )
+            # Frames cover the recording, up to one frame past its end
+            duration = len(frame_probs) * args.shift_length_in_sec
+            if dataset.items[item]['duration']:
+                duration = min(duration, dataset.items[item]['duration'])
+            total_duration += duration
+            yield dataset.items[item]['audio_file'], dataset.items[item]['offset'], vad.speech_segments(
+                frame_probs,
+                shift_length_in_sec=args.shift_length_in_sec,
+                onset=args.onset,
+                offset=args.offset,
+                median_filter_in_sec=args.median_filter_in_sec,
+                min_duration_on=args.min_duration_on,
+                min_duration_off=args.min_duration_off,
+                duration=duration,
+            )
+
+    start = time.time()
+    num_segments = vad.write_segments_manifest(args.out_manifest, segments())
+    elapsed = time.time() - start
+    logging.info(f"Wrote {num_segments} speech segments to {args.out_manifest}")
+    logging.info(
+        f"Processed {total_duration:.1f} s of audio in {elapsed:.1f} s, "
+        f"{total_duration / max(elapsed, 1e-9):.1f} s of audio per second"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -16,111 +16,62 @@ import argparse
 import os
 
 import numpy as np
-from scipy.interpolate import interp1d
-from scipy.optimize import brentq
-from sklearn.metrics import roc_curve
-from tqdm import tqdm
 
+from nemo.collections.asr.parts import speaker_scoring
 
 """
-This script faciliates to get EER % based on cosine-smilarity 
-for HI-MIA dataset.
+This script faciliates to get EER % and minDCF based on cosine-smilarity
+for HI-MIA dataset, see nemo.collections.asr.parts.speaker_scoring.
 
 Args:
     data_root str: Path to embeddings file and also make sure trails_1m file is also
     placed in this path
-    emb : test embedding file path 
-    emb_labels : embedding labels file path
-    emb_size :help="Embeddings size
+    emb : test embedding file path, as saved by spkr_get_emb.py
+    emb_labels : embedding labels file path, defaults to the <emb>_labels.npy file of spkr_get_emb.py
+    emb_size : Embeddings size, only checked against the embeddings
 """
 
 
-def get_acc(data_root='./myExps/hi-mia/', emb='', emb_labels='', emb_size=512):
+def get_acc(data_root='./myExps/hi-mia/', emb='', emb_labels=None, emb_size=None, chunk_size=65536):
     basename = os.path.dirname(emb)
-    X_test = np.load(emb)
-    label_files = np.load(emb_labels)
-
-    assert len(X_test) == len(label_files)
+    X_test, label_files = speaker_scoring.load_embeddings(emb, emb_labels)
+    if emb_size is not None and X_test.shape[1] != int(emb_size):
+        raise ValueError(f"Embeddings have size {X_test.shape[1]}, not {emb_size}")
     trail_file = os.path.join(data_root, 'trials_1m')
 
-    test_list = {}
-    speaker_list = {}
-
-    for idx, line in enumerate(label_files):
-        line = line.strip()
-        speaker = line.split('.')[0].split('_')[0]
-        test_list[line] = idx
-
-        if speaker in speaker_list:
-            speaker_list[speaker].append(idx)
-        else:
-            speaker_list[speaker] = [idx]
-
-    emb = int(emb_size)
-
-    tmp_file = open(trail_file, 'r').readlines()
-    trail_score = open('trial_score.txt', 'w')
-
-    trial_embs = []
-    keys = []
-    all_scores = []
-    all_keys = []
-
-    # for each of trails in trial file
-    for line in tqdm(tmp_file):
-        line = line.strip()
-        x_speaker = line.split(' ')[0]
-        y_speaker = line.split(' ')[1]
-
-        X = np.zeros(emb,)
-        for idx in speaker_list[x_speaker]:
-            X = X + X_test[idx]
-
-        X = X / len(speaker_list[x_speaker])
-
-        if x_speaker not in keys:
-            keys.append(x_speaker)
-            trial_embs.extend([X])
-
-        Y = np.zeros(emb,)
-        for idx in speaker_list[y_speaker]:
-            Y = Y + X_test[idx]
-
-        Y = Y / len(speaker_list[y_speaker])
-
-        if y_speaker not in keys:
-            keys.append(y_speaker)
-            trial_embs.extend([Y])
-
-        # X=Y
-        score = (X @ Y.T) / (((X @ X.T) * (Y @ Y.T)) ** 0.5)
-        score = (score + 1) / 2
-
-        all_scores.append(score)
-        truth = 0 if line.split(' ')[-1] == 'nontarget' else 1
-
-        all_keys.append(truth)
+    speaker_ids, centroids = speaker_scoring.speaker_centroids(X_test, label_files)
+    x, y, all_keys, lines = speaker_scoring.read_trials(trail_file, speaker_ids)
+    all_scores = speaker_scoring.score_trials(centroids, x, y, chunk_size=chunk_size)
 
-        trail_score.write(str(score) + "\t" + line.split(' ')[-1])
-        trail_score.write('\n')
+    with open('trial_score.txt', 'w') as trail_score:
+        for score, line in zip(all_scores, lines):
+            trail_score.write(str(score) + "\t" + line.split(' ')[-1])
+            trail_score.write('\n')
 
-    np.save(basename + '/all_embs_himia.npy', np.asarray(trial_embs))
-    np.save(basename + '/all_ids_himia.npy', np.asarray(keys))
+    # Speaker embeddings in order of first appearance in the trials
+    trial_speakers = np.stack([x, y], axis=1).reshape(-1)
+    _, first = np.unique(trial_speakers, return_index=True)
+    keys = trial_speakers[np.sort(first)]
+    np.save(basename + '/all_embs_himia.npy', centroids[keys])
+    np.save(basename + '/all_ids_himia.npy', speaker_ids[keys])
 
-    return np.asarray(all_scores), np.asarray(all_keys)
+    return all_scores, all_keys
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--data_root", help="directory of embeddings location", type=str, required=True)
     parser.add_argument("--emb", help="test embedding file path", type=str, required=True)
-    parser.add_argument("--emb_labels", help="embedding labels file path", type=str, required=True)
-    parser.add_argument("--emb_size", help="Embeddings size", type=int, required=True)
+    parser.add_argument("--emb_labels", help="embedding labels file path", type=str, default=None)
+    parser.add_argument("--emb_size", help="Embeddings size", type=int, default=None)
+    parser.add_argument("--chunk_size", help="number of trials scored at once", type=int, default=65536)
+    parser.add_argument("--p_target", help="prior of target trials for minDCF", type=float, default=0.01)
     args = parser.parse_args()
     root, emb, emb_labels, emb_size = args.data_root, args.emb, args.emb_labels, args.emb_size
 
-    y_score, y = get_acc(data_root=root, emb=emb, emb_labels=emb_labels, emb_size=emb_size)
-    fpr, tpr, thresholds = roc_curve(y, y_score, pos_label=1)
+    y_score, y = get_acc(data_root=root, emb=emb, emb_labels=emb_labels, emb_size=emb_size, chunk_size=args.chunk_size)
 
-    eer = brentq(lambda x: 1.0 - x - interp1d(fpr, tpr)(x), 0.0, 1.0)
+    eer, _ = speaker_scoring.equal_error_rate(y_score, y)
+    dcf, _ = speaker_scoring.min_dcf(y_score, y, p_target=args.p_target)
     print("EER: {:.2f}%".format(eer * 100))
+    print("minDCF(p_target={}): {:.4f}".format(args.p_target, dcf))
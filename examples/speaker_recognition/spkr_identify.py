@@ -0,0 +1,65 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+
+from nemo.collections.asr.parts import speaker_index, speaker_scoring
+
+"""
+This script identifies the speakers of test embeddings among enrolled embeddings
+with a nearest neighbour speaker index, see nemo.collections.asr.parts.speaker_index.
+
+Args:
+    enroll_emb : enrollment embedding file path, as saved by spkr_get_emb.py
+    test_emb : test embedding file path, as saved by spkr_get_emb.py
+    index_dir : directory of the speaker index, built from enroll_emb if given,
+        else the existing index is opened and enroll_emb is enrolled into it
+    nprobe : number of inverted lists searched, 0 for exact search
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--enroll_emb", help="enrollment embedding file path", type=str, default=None)
+    parser.add_argument("--test_emb", help="test embedding file path", type=str, required=True)
+    parser.add_argument("--index_dir", help="speaker index directory", type=str, required=True)
+    parser.add_argument("--append", help="enroll into the existing index", action='store_true')
+    parser.add_argument("--k", help="number of neighbours that vote for the speaker", type=int, default=1)
+    parser.add_argument("--num_lists", help="number of IVF lists, 0 for exact search only", type=int, default=0)
+    parser.add_argument("--num_subvectors", help="number of PQ subvectors", type=int, default=32)
+    parser.add_argument("--nprobe", help="number of IVF lists searched per query", type=int, default=0)
+    parser.add_argument("--rerank", help="number of PQ candidates rescored exactly", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.enroll_emb is not None:
+        embeddings, labels = speaker_scoring.load_embeddings(args.enroll_emb)
+        speakers = [speaker_scoring.speaker_from_filename(label) for label in labels]
+        if args.append:
+            index = speaker_index.SpeakerIndex(args.index_dir)
+            index.add(embeddings, speakers)
+        else:
+            index = speaker_index.build_speaker_index(args.index_dir, embeddings, speakers)
+            if args.num_lists > 0:
+                index.train_ivf(num_lists=args.num_lists, num_subvectors=args.num_subvectors)
+    else:
+        index = speaker_index.SpeakerIndex(args.index_dir)
+
+    test_embeddings, test_labels = speaker_scoring.load_embeddings(args.test_emb)
+    _, neighbours = index.search(test_embeddings, k=args.k, nprobe=args.nprobe, rerank=args.rerank)
+    correct = 0
+    for label, neighbour_speakers in zip(test_labels, index.labels(neighbours)):
+        votes = [speaker for speaker in neighbour_speakers if speaker is not None]
+        predicted = max(set(votes), key=votes.count) if votes else None
+        correct += predicted == speaker_scoring.speaker_from_filename(label)
+    print("Enrolled embeddings: {}".format(len(index)))
+    print("Identification accuracy: {:.2f}%".format(100.0 * correct / max(len(test_labels), 1)))
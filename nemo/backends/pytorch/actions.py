@@ -49,6 +49,57 @@ _float_2_half_req = {
 }
 
 
+def _create_dataloader(dl_nm, distributed):
+    """Builds a DataLoader for a data layer that exposes `dataset` instead of `data_iterator`.
+
+    Data layers may provide a `batch_sampler` attribute (e.g. a bucketing sampler), which then takes care of
+    batching, shuffling and distributed splitting by itself.
+    """
+    batch_sampler = getattr(dl_nm, 'batch_sampler', None)
+    if batch_sampler is not None:
+        dataloader_params = {
+            'dataset': dl_nm.dataset,
+            'batch_sampler': batch_sampler,
+            'num_workers': dl_nm.num_workers,
+            'pin_memory': dl_nm.pin_memory,
+        }
+    elif distributed:
+        sampler = None
+        if not isinstance(dl_nm.dataset, torch.utils.data.IterableDataset):
+            sampler = torch.utils.data.distributed.DistributedSampler(dataset=dl_nm.dataset, shuffle=dl_nm.shuffle)
+        dataloader_params = {
+            'dataset': dl_nm.dataset,
+            'sampler': sampler,
+            'num_workers': dl_nm.num_workers,
+            'batch_size': dl_nm.batch_size,
+            'shuffle': False,
+            'pin_memory': dl_nm.pin_memory,
+        }
+    else:
+        dataloader_params = {
+            'dataset': dl_nm.dataset,
+            'sampler': None,  # not distributed sampler
+            'num_workers': dl_nm.num_workers,
+            'batch_size': dl_nm.batch_size,
+            'shuffle': dl_nm.shuffle,
+            'pin_memory': dl_nm.pin_memory,
+        }
+    if hasattr(dl_nm, 'collate_fn'):
+        dataloader_params['collate_fn'] = dl_nm.collate_fn
+    return torch.utils.data.DataLoader(**dataloader_params)
+
+
+def _get_epoch_sampler(dataloader):
+    """Returns the (batch) sampler, or iterable dataset, of a DataLoader that has to be told about epoch changes,
+    or None.
+    """
+    candidates = ('batch_sampler', 'sampler', 'dataset')
+    for sampler in (getattr(dataloader, name, None) for name in candidates):
+        if hasattr(sampler, 'set_epoch'):
+            return sampler
+    return None
+
+
 class PtActions(Actions):
     def __init__(
         self, local_rank=None, global_rank=None, tb_writer=None, optimization_level=Optimization.mxprO0,
@@ -449,41 +500,16 @@ class PtActions(Actions):
                 world_size = torch.distributed.get_world_size()
 
                 if dl_nm.dataset is not None:
-                    sampler = None
-                    if not isinstance(dl_nm.dataset, torch.utils.data.IterableDataset):
-                        sampler = torch.utils.data.distributed.DistributedSampler(
-                            dataset=dl_nm.dataset, shuffle=dl_nm.shuffle
-                        )
-                    dataloader_params = {
-                        'dataset': dl_nm.dataset,
-                        'sampler': sampler,
-                        'num_workers': dl_nm.num_workers,
-                        'batch_size': dl_nm.batch_size,
-                        'shuffle': False,
-                        'pin_memory': dl_nm.pin_memory,
-                    }
-                    if hasattr(dl_nm, 'collate_fn'):
-                        dataloader_params['collate_fn'] = dl_nm.collate_fn
-                    eval_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                    eval_dataloader = _create_dataloader(dl_nm, distributed=True)
                 else:
                     eval_dataloader = dl_nm.data_iterator
 
-                if hasattr(eval_dataloader, 'sampler'):
-                    eval_dataloader.sampler.set_epoch(0)
+                eval_sampler = _get_epoch_sampler(eval_dataloader)
+                if eval_sampler is not None:
+                    eval_sampler.set_epoch(0)
             else:  # Not distributed
                 if dl_nm.dataset is not None:
-                    # Todo: remove local_parameters
-                    dataloader_params = {
-                        'dataset': dl_nm.dataset,
-                        'sampler': None,  # not distributed sampler
-                        'num_workers': dl_nm.num_workers,
-                        'batch_size': dl_nm.batch_size,
-                        'shuffle': dl_nm.shuffle,
-                        'pin_memory': dl_nm.pin_memory,
-                    }
-                    if hasattr(dl_nm, 'collate_fn'):
-                        dataloader_params['collate_fn'] = dl_nm.collate_fn
-                    eval_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                    eval_dataloader = _create_dataloader(dl_nm, distributed=False)
                 else:
                     eval_dataloader = dl_nm.data_iterator
             # after this eval_dataloader is ready to be used
@@ -635,41 +661,17 @@ class PtActions(Actions):
                 is_distributed = True
                 world_size = torch.distributed.get_world_size()
                 if dl_nm.dataset is not None:
-                    sampler = None
-                    if not isinstance(dl_nm.dataset, torch.utils.data.IterableDataset):
-                        sampler = torch.utils.data.distributed.DistributedSampler(
-                            dataset=dl_nm.dataset, shuffle=dl_nm.shuffle
-                        )
-                    dataloader_params = {
-                        'dataset': dl_nm.dataset,
-                        'sampler': sampler,
-                        'num_workers': dl_nm.num_workers,
-                        'batch_size': dl_nm.batch_size,
-                        'shuffle': False,
-                        'pin_memory': dl_nm.pin_memory,
-                    }
-                    if hasattr(dl_nm, 'collate_fn'):
-                        dataloader_params['collate_fn'] = dl_nm.collate_fn
-                    eval_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                    eval_dataloader = _create_dataloader(dl_nm, distributed=True)
                 else:
                     eval_dataloader = dl_nm.data_iterator
-                eval_dataloader.sampler.set_epoch(0)
+                eval_sampler = _get_epoch_sampler(eval_dataloader)
+                if eval_sampler is not None:
+                    eval_sampler.set_epoch(0)
             elif not use_cache:  # Not distributed and not using cache
                 # Dataloaders are only used if use_cache is False
                 # When caching, the DAG must cache all outputs from dataloader
                 if dl_nm.dataset is not None:
-                    # Todo: remove local_parameters
-                    dataloader_params = {
-                        'dataset': dl_nm.dataset,
-                        'sampler': None,  # not distributed sampler
-                        'num_workers': dl_nm.num_workers,
-                        'batch_size': dl_nm.batch_size,
-                        'shuffle': dl_nm.shuffle,
-                        'pin_memory': dl_nm.pin_memory,
-                    }
-                    if hasattr(dl_nm, 'collate_fn'):
-                        dataloader_params['collate_fn'] = dl_nm.collate_fn
-                    eval_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                    eval_dataloader = _create_dataloader(dl_nm, distributed=False)
                 else:
                     eval_dataloader = dl_nm.data_iterator
             # after this eval_dataloader is ready to be used
@@ -1317,28 +1319,10 @@ class PtActions(Actions):
         if placement_gpu:
             logging.info("Doing distributed training")
             if t_dataset is not None:
-                train_sampler = None
-                if not isinstance(t_dataset, torch.utils.data.IterableDataset):
-                    train_sampler = torch.utils.data.distributed.DistributedSampler(
-                        dataset=t_dataset, shuffle=dataNM.shuffle
-                    )
-                dataloader_params = {
-                    'dataset': t_dataset,
-                    'sampler': train_sampler,
-                    'num_workers': dataNM.num_workers,
-                    'batch_size': dataNM.batch_size,
-                    'shuffle': False,
-                    'pin_memory': dataNM.pin_memory,
-                }
-                if hasattr(dataNM, 'collate_fn'):
-                    dataloader_params['collate_fn'] = dataNM.collate_fn
-                train_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                train_dataloader = _create_dataloader(dataNM, distributed=True)
             else:
                 train_dataloader = dataNM.data_iterator
-                if hasattr(train_dataloader, 'sampler'):
-                    train_sampler = train_dataloader.sampler
-                else:
-                    train_sampler = None
+            train_sampler = _get_epoch_sampler(train_dataloader)
 
             self.ddp_initialized = True
             module_list = [mod.name for mod in AppState().modules]
@@ -1379,22 +1363,10 @@ class PtActions(Actions):
         # single GPU/CPU training
         else:
             if t_dataset is not None:
-                train_sampler = None
-                dataloader_params = {
-                    'dataset': t_dataset,
-                    'sampler': None,
-                    'num_workers': dataNM.num_workers,
-                    'batch_size': dataNM.batch_size,
-                    'shuffle': dataNM.shuffle,
-                    'pin_memory': dataNM.pin_memory,
-                }
-                if hasattr(dataNM, 'collate_fn'):
-                    dataloader_params['collate_fn'] = dataNM.collate_fn
-
-                train_dataloader = torch.utils.data.DataLoader(**dataloader_params)
+                train_dataloader = _create_dataloader(dataNM, distributed=False)
             else:
                 train_dataloader = dataNM.data_iterator
-                train_sampler = None
+            train_sampler = _get_epoch_sampler(train_dataloader)
 
         _init_callbacks(callbacks, self)
         # Do action start callbacks
@@ -16,7 +16,7 @@
 from nemo.backends.pytorch.common.losses import CrossEntropyLossNM
 from nemo.collections.asr import models
 from nemo.collections.asr.audio_preprocessing import *
-from nemo.collections.asr.beam_search_decoder import BeamSearchDecoderWithLM
+from nemo.collections.asr.beam_search_decoder import BeamSearchDecoderWithLM, CTCBeamSearchDecoder
 from nemo.collections.asr.contextnet import ContextNetDecoderForCTC, ContextNetEncoder
 from nemo.collections.asr.data_layer import (
     AudioToSpeechLabelDataLayer,
@@ -51,6 +51,7 @@ __all__ = [
     'TranscriptDataLayer',
     'GreedyCTCDecoder',
     'BeamSearchDecoderWithLM',
+    'CTCBeamSearchDecoder',
     'JasperEncoder',
     'JasperDecoderForCTC',
     'JasperDecoderForClassification',
@@ -25,6 +25,7 @@ __all__ = [
     'MultiplyBatch',
     'SpectrogramAugmentation',
     'TimeStretchAugmentation',
+    'WaveformAugmentation',
 ]
 
 import math
@@ -36,6 +37,7 @@ from packaging import version
 
 from .parts.features import FilterbankFeatures
 from .parts.spectr_augment import SpecAugment, SpecCutout
+from .parts.waveform_augment import WaveformAugment, load_impulse_bank, load_noise_bank
 from nemo.backends.pytorch import NonTrainableNM
 from nemo.core import Optimization
 from nemo.core.neural_types import *
@@ -560,6 +562,16 @@ class SpectrogramAugmentation(NonTrainableNM):
         rect_time (int): maximum size of cut rectangles along the time
             dimension
             Defaults to 25.
+        rng (random.Random): seeds the mask generators if seed is not given.
+            Defaults to None.
+        seed (int): seed of the mask generators. Masks are reproducible only
+            if seed or rng is given, else every instance seeds its generators
+            from OS entropy, so that distributed ranks draw different masks.
+            Defaults to None.
+
+    Masks are drawn on the device of the spectrogram for the whole batch at
+    once. If the optional `length` input is connected, masks stay within the
+    length of every utterance.
     """
 
     @property
@@ -570,7 +582,8 @@ class SpectrogramAugmentation(NonTrainableNM):
         return {
             # "input_spec": NeuralType({0: AxisType(BatchTag), 1: AxisType(SpectrogramSignalTag), 2: AxisType(
             # TimeTag),})
-            "input_spec": NeuralType(('B', 'D', 'T'), SpectrogramType())
+            "input_spec": NeuralType(('B', 'D', 'T'), SpectrogramType()),
+            "length": NeuralType(tuple('B'), LengthsType(), optional=True),
         }
 
     @property
@@ -595,26 +608,34 @@ class SpectrogramAugmentation(NonTrainableNM):
         rect_time=5,
         rect_freq=20,
         rng=None,
+        seed=None,
     ):
         super().__init__()
 
         if rect_masks > 0:
-            self.spec_cutout = SpecCutout(rect_masks=rect_masks, rect_time=rect_time, rect_freq=rect_freq, rng=rng,)
+            self.spec_cutout = SpecCutout(
+                rect_masks=rect_masks, rect_time=rect_time, rect_freq=rect_freq, rng=rng, seed=seed,
+            )
             self.spec_cutout.to(self._device)
         else:
-            self.spec_cutout = lambda x: x
+            self.spec_cutout = lambda x, length=None: x
 
         if freq_masks + time_masks > 0:
             self.spec_augment = SpecAugment(
-                freq_masks=freq_masks, time_masks=time_masks, freq_width=freq_width, time_width=time_width, rng=rng,
+                freq_masks=freq_masks,
+                time_masks=time_masks,
+                freq_width=freq_width,
+                time_width=time_width,
+                rng=rng,
+                seed=None if seed is None else seed + 1,
             )
             self.spec_augment.to(self._device)
         else:
-            self.spec_augment = lambda x: x
+            self.spec_augment = lambda x, length=None: x
 
-    def forward(self, input_spec):
-        augmented_spec = self.spec_cutout(input_spec)
-        augmented_spec = self.spec_augment(augmented_spec)
+    def forward(self, input_spec, length=None):
+        augmented_spec = self.spec_cutout(input_spec, length)
+        augmented_spec = self.spec_augment(augmented_spec, length)
         return augmented_spec
 
 
@@ -920,6 +941,138 @@ class TimeStretchAugmentation(NonTrainableNM):
         }
 
 
+class WaveformAugmentation(NonTrainableNM):
+    """
+    Batched, on-device counterpart of the AudioAugmentor perturbations gain, shift, white noise, noise and
+    impulse. It perturbs a padded (B, T) batch of waveforms at once, with random parameters drawn independently
+    for every sample, and keeps the padding of every sample zero. Perturbations are applied in the order:
+    impulse, shift, gain, noise, white noise.
+
+    Noise is added at an SNR measured over the length of every sample, from a bank of noise recordings that is
+    loaded onto the device once. RIRs are loaded the same way and normalized as in ImpulsePerturbation.
+
+    Args:
+        sample_rate (int): Sample rate of the audio.
+        gain_prob (float): Probability of applying gain to a sample.
+            Defaults to 0.
+        min_gain_dbfs (float): Minimum gain in dB.
+            Defaults to -10.
+        max_gain_dbfs (float): Maximum gain in dB.
+            Defaults to 10.
+        shift_prob (float): Probability of shifting a sample.
+            Defaults to 0.
+        min_shift_ms (float): Minimum shift in milliseconds.
+            Defaults to -5.
+        max_shift_ms (float): Maximum shift in milliseconds.
+            Defaults to 5.
+        white_noise_prob (float): Probability of adding white noise to a
+            sample.
+            Defaults to 0.
+        min_white_noise_level (float): Minimum level of white noise in dB.
+            Defaults to -90.
+        max_white_noise_level (float): Maximum level of white noise in dB.
+            Defaults to -46.
+        noise_prob (float): Probability of adding noise from the noise bank to
+            a sample.
+            Defaults to 0.
+        noise_manifest (str): Manifest of noise recordings for the noise bank.
+            Required if noise_prob > 0.
+        min_snr_db (float): Minimum signal to noise ratio in dB.
+            Defaults to 10.
+        max_snr_db (float): Maximum signal to noise ratio in dB.
+            Defaults to 50.
+        noise_bank_duration (float): Maximum duration of the noise bank in
+            seconds.
+            Defaults to 600.
+        impulse_prob (float): Probability of convolving a sample with a RIR.
+            Defaults to 0.
+        impulse_manifest (str): Manifest of RIRs. Required if
+            impulse_prob > 0.
+        max_impulse_duration (float): RIRs are truncated to this duration in
+            seconds.
+            Defaults to 1.
+        seed (int): Seed of the random number generator of the module. The
+            global torch generator is used if None.
+            Defaults to None.
+    """
+
+    @property
+    @add_port_docs()
+    def input_ports(self):
+        """Returns definitions of module input ports.
+        """
+        return {
+            "input_signal": NeuralType(('B', 'T'), AudioSignal(freq=self._sample_rate)),
+            "length": NeuralType(tuple('B'), LengthsType()),
+        }
+
+    @property
+    @add_port_docs()
+    def output_ports(self):
+        """Returns definitions of module output ports.
+        """
+        return {
+            "processed_signal": NeuralType(('B', 'T'), AudioSignal(freq=self._sample_rate)),
+            "processed_length": NeuralType(tuple('B'), LengthsType()),
+        }
+
+    def __init__(
+        self,
+        sample_rate=16000,
+        gain_prob=0.0,
+        min_gain_dbfs=-10.0,
+        max_gain_dbfs=10.0,
+        shift_prob=0.0,
+        min_shift_ms=-5.0,
+        max_shift_ms=5.0,
+        white_noise_prob=0.0,
+        min_white_noise_level=-90.0,
+        max_white_noise_level=-46.0,
+        noise_prob=0.0,
+        noise_manifest=None,
+        min_snr_db=10.0,
+        max_snr_db=50.0,
+        noise_bank_duration=600.0,
+        impulse_prob=0.0,
+        impulse_manifest=None,
+        max_impulse_duration=1.0,
+        seed=None,
+    ):
+        super().__init__()
+        self._sample_rate = sample_rate
+
+        noise_bank = None
+        if noise_manifest is not None:
+            noise_bank = load_noise_bank(noise_manifest, sample_rate, max_duration=noise_bank_duration)
+        impulse_bank = None
+        if impulse_manifest is not None:
+            impulse_bank = load_impulse_bank(impulse_manifest, sample_rate, max_duration=max_impulse_duration)
+
+        self.waveform_augment = WaveformAugment(
+            sample_rate,
+            gain_prob=gain_prob,
+            min_gain_dbfs=min_gain_dbfs,
+            max_gain_dbfs=max_gain_dbfs,
+            shift_prob=shift_prob,
+            min_shift_ms=min_shift_ms,
+            max_shift_ms=max_shift_ms,
+            white_noise_prob=white_noise_prob,
+            min_white_noise_level=min_white_noise_level,
+            max_white_noise_level=max_white_noise_level,
+            noise_prob=noise_prob,
+            min_snr_db=min_snr_db,
+            max_snr_db=max_snr_db,
+            noise_bank=noise_bank,
+            impulse_prob=impulse_prob,
+            impulse_bank=impulse_bank,
+            seed=seed,
+        )
+        self.waveform_augment.to(self._device)
+
+    def forward(self, input_signal, length):
+        return self.waveform_augment(input_signal, length), length
+
+
 def AudioPreprocessing(*args, **kwargs):
     raise NotImplementedError(
         "AudioPreprocessing has been deprecated and replaced by: "
@@ -5,6 +5,7 @@
 import torch
 
 from nemo.backends.pytorch.nm import NonTrainableNM
+from nemo.collections.asr.parts.ctc_beam_search import CTCPrefixBeamSearch, NGramLanguageModel
 from nemo.core import DeviceType
 from nemo.core.neural_types import *
 from nemo.utils.decorators import add_port_docs
@@ -107,3 +108,105 @@ class BeamSearchDecoderWithLM(NonTrainableNM):
             cutoff_top_n=self.cutoff_top_n,
         )
         return [res]
+
+
+class CTCBeamSearchDecoder(NonTrainableNM):
+    """Neural Module that does CTC prefix beam search with an optional
+    n-gram language model in ARPA format, without external decoder builds.
+
+    It takes a batch of log_probabilities and outputs a sequence of size
+    batch_size. Each element in the sequence is a list of size beam_width,
+    and each element in that list is a tuple of (score, hyp_string), as for
+    BeamSearchDecoderWithLM.
+
+    The sequence is a lazy BeamSearchResults rather than the tensor that the
+    PredictionsType port declares, so it can only be consumed by Python code,
+    e.g. the callbacks of nf.infer, not by other neural modules.
+
+    With num_workers > 0, utterances are decoded by a pool of worker processes
+    that is started on the first batch and stopped by `close`. With
+    asynchronous=True the output is then returned right away, and accessing
+    the hypotheses of an utterance waits for its decoding, so the acoustic
+    model can compute the next batch in the meantime.
+
+    Args:
+        vocab (list): List of characters that can be output by the ASR model. The CTC blank symbol is the class
+            after them. Words are delimited by the space character.
+        beam_width (int): Size of beams to keep and expand upon.
+        alpha (float): Weight of the n-gram language model.
+        beta (float): Bonus added for every word.
+        lm_path (str): Path to n-gram language model in ARPA format. Decodes without language model if None.
+        num_workers (int): Number of worker processes, default 0, decodes in the calling process. Workers
+            are forked on Linux, which is unsafe once the calling process has initialized CUDA.
+        cutoff_prob (float): Cutoff probability in vocabulary pruning, default 1.0, no pruning
+        cutoff_top_n (int): Cutoff number in pruning, only top cutoff_top_n characters with highest probs in
+            vocabulary will be used in beam search, default 40.
+        asynchronous (bool): Whether to return before the batch is decoded, default True.
+    """
+
+    @property
+    @add_port_docs()
+    def input_ports(self):
+        """Returns definitions of module input ports.
+        """
+        return {
+            "log_probs": NeuralType(('B', 'T', 'D'), LogprobsType()),
+            "log_probs_length": NeuralType(tuple('B'), LengthsType()),
+        }
+
+    @property
+    @add_port_docs()
+    def output_ports(self):
+        """Returns definitions of module output ports.
+
+        predictions:
+            BeamSearchResults of the hypotheses of every utterance, see the class docstring
+        """
+        return {"predictions": NeuralType(('B', 'T'), PredictionsType())}
+
+    def __init__(
+        self,
+        vocab,
+        beam_width,
+        alpha=0.0,
+        beta=0.0,
+        lm_path=None,
+        num_workers=0,
+        cutoff_prob=1.0,
+        cutoff_top_n=40,
+        asynchronous=True,
+    ):
+        super().__init__()
+        # Override the default placement from neural factory and set placement/device to be CPU.
+        self._placement = DeviceType.CPU
+        self._device = get_cuda_device(self._placement)
+
+        language_model = NGramLanguageModel(lm_path) if lm_path is not None else None
+        self.search = CTCPrefixBeamSearch(
+            vocab,
+            beam_width,
+            alpha=alpha,
+            beta=beta,
+            language_model=language_model,
+            cutoff_prob=cutoff_prob,
+            cutoff_top_n=cutoff_top_n,
+            num_workers=num_workers,
+        )
+        self.asynchronous = asynchronous
+
+    def forward(self, log_probs, log_probs_length):
+        log_probs = log_probs.detach().float().cpu().numpy()
+        lengths = log_probs_length.cpu().tolist()
+        res = self.search.decode_batch([log_prob[: int(length)] for log_prob, length in zip(log_probs, lengths)])
+        if not self.asynchronous:
+            res = list(res)
+        return [res]
+
+    def close(self):
+        """Shuts the worker processes down."""
+        self.search.close()
+
+    def __del__(self):
+        search = getattr(self, 'search', None)
+        if search is not None:
+            search.close()
@@ -24,18 +24,23 @@ import braceexpand
 import torch
 import webdataset as wd
 
-from .parts.collections import ASRAudioText
+from .parts.collections import ASRAudioText, IndexedASRAudioText
 from .parts.dataset import (
     AudioDataset,
     AudioLabelDataset,
     KaldiFeatureDataset,
+    TarredAudioDataset,
     TranscriptDataset,
+    feature_seq_collate_fn,
     fixed_seq_collate_fn,
     seq_collate_fn,
 )
+from .parts.feature_cache import build_feature_cache, open_feature_cache
 from .parts.features import WaveformFeaturizer
 from .parts.parsers import make_parser
 from .parts.perturb import AudioAugmentor, perturbation_types
+from .parts.samplers import DurationBucketingBatchSampler, TarredShardSampler
+from .parts.tar_index import load_tar_index, tar_index_path
 from nemo.backends.pytorch import DataLayerNM
 from nemo.core import DeviceType
 from nemo.core.neural_types import *
@@ -186,6 +191,36 @@ def _process_augmentations(augmenter) -> AudioAugmentor:
     return augmenter
 
 
+def _get_feature_cache(
+    manifest_filepath, cache_root, preprocessor_config, sample_rate, int_values, trim, resample_type='kaiser_best'
+):
+    """Opens the feature cache matching the manifests and configs, building it first if necessary.
+
+    In distributed runs the cache is built by rank 0, while the other ranks wait for it.
+    """
+    cache_params = {
+        'manifests_files': manifest_filepath,
+        'cache_root': cache_root,
+        'preprocessor_config': preprocessor_config,
+        'sample_rate': sample_rate,
+        'int_values': int_values,
+        'trim': trim,
+        'resample_type': resample_type,
+    }
+    cache = open_feature_cache(**cache_params)
+    if cache is not None:
+        return cache
+
+    distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+    if not distributed or torch.distributed.get_rank() == 0:
+        logging.info(f"Feature cache not found in {cache_root}, building it.")
+        cache = build_feature_cache(**cache_params)
+    if distributed:
+        torch.distributed.barrier()
+        cache = open_feature_cache(**cache_params)
+    return cache
+
+
 class AudioToTextDataLayer(DataLayerNM):
     """Data Layer for general ASR tasks.
 
@@ -256,6 +291,47 @@ transcript_n}
             the range [0, 1] of this augmentation being applied.
             If this keyword is not present, then the augmentation is
             disabled and a warning is logged.
+        manifest_index (str): Optional path to a manifest index directory
+            built from `manifest_filepath` with
+            `scripts/build_manifest_index.py`. If set, the memory-mapped index
+            is used instead of parsing the manifests.
+            Defaults to None.
+        max_batch_duration (float): If set, batches are built by a
+            DurationBucketingBatchSampler from utterances of similar duration,
+            with at most this many seconds of padded audio per batch, instead
+            of using a fixed batch_size. shuffle and drop_last are passed on to
+            the sampler.
+            Defaults to None.
+        max_batch_frames (int): Same as max_batch_duration, but the budget is
+            given in feature frames of 10 ms.
+            Defaults to None.
+        num_buckets (int): Number of duration buckets used when
+            max_batch_duration or max_batch_frames is set.
+            Defaults to 10.
+        feature_cache_dir (str): If set, log-mel features are computed once
+            with preprocessor_config, stored in a cache under this directory
+            and read from there. The data layer then outputs processed_signal
+            and processed_length instead of audio_signal and a_sig_length,
+            so AudioToMelSpectrogramPreprocessor must be skipped. The cache
+            is rebuilt whenever the preprocessor config, the audio loading
+            settings or the manifests change; it can be prebuilt with
+            `scripts/build_feature_cache.py`. Can't be used with augmentor.
+            Defaults to None.
+        preprocessor_config (dict): init_params of the
+            AudioToMelSpectrogramPreprocessor that the cached features
+            replace. Only used with feature_cache_dir.
+            Defaults to None, which means default preprocessor parameters.
+        audio_cache_max_bytes (int): If > 0, decoded and resampled audio of up
+            to this many bytes is cached in shared memory and read by all
+            DataLoader workers in the following epochs, evicting the oldest
+            entries first. Augmentation still runs on every epoch. Every
+            distributed rank creates a cache of its own, so the caches take
+            world_size times this many bytes in total.
+            Defaults to 0.
+        resample_type (str): Resampler of audio files at other sample rates
+            than sample_rate, 'polyphase' or a librosa res_type, see
+            `parts.resample.resample`.
+            Defaults to 'kaiser_best'.
     """
 
     @property
@@ -263,6 +339,13 @@ transcript_n}
     def output_ports(self):
         """Returns definitions of module output ports.
         """
+        if getattr(self, '_feature_cache', None) is not None:
+            return {
+                'processed_signal': NeuralType(('B', 'D', 'T'), MelSpectrogramType()),
+                'processed_length': NeuralType(tuple('B'), LengthsType()),
+                'transcripts': NeuralType(('B', 'T'), LabelsType()),
+                'transcript_length': NeuralType(tuple('B'), LengthsType()),
+            }
         return {
             # 'audio_signal': NeuralType({0: AxisType(BatchTag), 1: AxisType(TimeTag)}),
             # 'a_sig_length': NeuralType({0: AxisType(BatchTag)}),
@@ -298,15 +381,37 @@ transcript_n}
         shuffle=True,
         num_workers=0,
         augmentor: Optional[Union[AudioAugmentor, Dict[str, Dict[str, Any]]]] = None,
+        manifest_index: Optional[str] = None,
+        max_batch_duration: Optional[float] = None,
+        max_batch_frames: Optional[int] = None,
+        num_buckets: int = 10,
+        feature_cache_dir: Optional[str] = None,
+        preprocessor_config: Optional[Dict[str, Any]] = None,
+        audio_cache_max_bytes: int = 0,
+        resample_type: str = 'kaiser_best',
     ):
         super().__init__()
         self._sample_rate = sample_rate
 
         if augmentor is not None:
+            if feature_cache_dir is not None:
+                raise ValueError("Cached features can't be augmented, feature_cache_dir requires augmentor=None.")
             augmentor = _process_augmentations(augmentor)
 
+        self._feature_cache = None
+        if feature_cache_dir is not None:
+            self._feature_cache = _get_feature_cache(
+                manifest_filepath,
+                feature_cache_dir,
+                preprocessor_config or {},
+                sample_rate=sample_rate,
+                int_values=int_values,
+                trim=trim_silence,
+                resample_type=resample_type,
+            )
+
         self._featurizer = WaveformFeaturizer(
-            sample_rate=self._sample_rate, int_values=int_values, augmentor=augmentor
+            sample_rate=self._sample_rate, int_values=int_values, augmentor=augmentor, resample_type=resample_type
         )
 
         # Set up dataset
@@ -321,29 +426,61 @@ transcript_n}
             'bos_id': bos_id,
             'eos_id': eos_id,
             'load_audio': load_audio,
+            'manifest_index': manifest_index,
+            'feature_cache': self._feature_cache,
+            'audio_cache_max_bytes': audio_cache_max_bytes,
         }
         self._dataset = AudioDataset(**dataset_params)
         self._batch_size = batch_size
+        pad_id = 0 if pad_id is None else pad_id
 
-        # Set up data loader
-        if self._placement == DeviceType.AllGpu:
-            logging.info("Parallelizing Datalayer.")
-            sampler = torch.utils.data.distributed.DistributedSampler(self._dataset)
+        if self._feature_cache is not None:
+            collate_fn = partial(
+                feature_seq_collate_fn,
+                token_pad_value=pad_id,
+                pad_to=self._feature_cache.pad_to,
+                pad_value=self._feature_cache.pad_value,
+            )
         else:
-            sampler = None
+            collate_fn = partial(seq_collate_fn, token_pad_value=pad_id)
 
-        if batch_size == -1:
-            batch_size = len(self._dataset)
+        # Set up data loader
+        if max_batch_duration is not None or max_batch_frames is not None:
+            collection = self._dataset.collection
+            if isinstance(collection, IndexedASRAudioText):
+                durations = collection.durations
+            else:
+                durations = [sample.duration for sample in collection]
+
+            # Bucketing sampler is rank-aware by itself, so it replaces DistributedSampler as well
+            batch_sampler = DurationBucketingBatchSampler(
+                durations,
+                max_batch_duration=max_batch_duration,
+                max_batch_frames=max_batch_frames,
+                num_buckets=num_buckets,
+                shuffle=shuffle,
+                drop_last=drop_last,
+            )
+            loader_params = {'batch_sampler': batch_sampler}
+        else:
+            if self._placement == DeviceType.AllGpu:
+                logging.info("Parallelizing Datalayer.")
+                sampler = torch.utils.data.distributed.DistributedSampler(self._dataset)
+            else:
+                sampler = None
+
+            if batch_size == -1:
+                batch_size = len(self._dataset)
+
+            loader_params = {
+                'batch_size': batch_size,
+                'drop_last': drop_last,
+                'shuffle': shuffle if sampler is None else False,
+                'sampler': sampler,
+            }
 
-        pad_id = 0 if pad_id is None else pad_id
         self._dataloader = torch.utils.data.DataLoader(
-            dataset=self._dataset,
-            batch_size=batch_size,
-            collate_fn=partial(seq_collate_fn, token_pad_value=pad_id),
-            drop_last=drop_last,
-            shuffle=shuffle if sampler is None else False,
-            sampler=sampler,
-            num_workers=num_workers,
+            dataset=self._dataset, collate_fn=collate_fn, num_workers=num_workers, **loader_params,
         )
 
     def __len__(self):
@@ -358,6 +495,20 @@ transcript_n}
         return self._dataloader
 
 
+class _ShardedWebDataset(torch.utils.data.IterableDataset):
+    """Wraps a WebDataset pipeline, so that Actions can pass the epoch on to its TarredShardSampler."""
+
+    def __init__(self, dataset, shard_sampler):
+        self._dataset = dataset
+        self.shard_sampler = shard_sampler
+
+    def __iter__(self):
+        return iter(self._dataset)
+
+    def set_epoch(self, epoch):
+        self.shard_sampler.set_epoch(epoch)
+
+
 class TarredAudioToTextDataLayer(DataLayerNM):
     """Data Layer for general ASR tasks, where the audio files are tarred.
 
@@ -371,14 +522,24 @@ class TarredAudioToTextDataLayer(DataLayerNM):
     brace-expanded, e.g. ['audio_1.tar', 'audio_2.tar', ...]. See the WebDataset documentation for more information
     about accepted data and input formats.
 
-    If using torch.distributed, the number of shards should be divisible by the number of workers to ensure an
-    even split among workers. If it is not divisible, logging will give a warning but we will continue.
+    Shards are split among all (distributed rank, DataLoader worker) pairs, and their order is reshuffled every
+    epoch with a seed shared by all ranks (unless shuffle=False). If the number of shards is not divisible by the
+    total number of workers, some shards are read twice in an epoch rather than being dropped. Writing shards of
+    equal duration (see `scripts/convert_to_tarred_audio_dataset.py`) keeps the workers evenly loaded.
 
     Notice that a few arguments are different from the AudioToTextDataLayer; for example, shuffle (bool) has been
     replaced by shuffle_n (int).
 
-    Additionally, please note that the len() of this DataLayer is assumed to be the length of the manifest. Be aware
-    of this especially if the tarred audio is a subset of the samples represented in the manifest.
+    The len() of this DataLayer is the number of samples the current rank reads in the current epoch, counted with
+    the member indices of the tarballs. If some tarball has no index, it is estimated from the length of the
+    manifest instead. Be aware of this especially if the tarred audio is a subset of the samples represented in the
+    manifest.
+
+    With random_access=True, the tarballs (which must be uncompressed) are read through their member offset index
+    instead of being streamed. The data layer then is a regular map-style dataset: its len() is exact, samples are
+    shuffled globally and split among distributed workers by the sampler, batches can be bucketed by duration, and
+    an epoch can be resumed deterministically. The index files are written by
+    `scripts/convert_to_tarred_audio_dataset.py`; for tarballs without them the headers are scanned on startup.
 
     Args:
         audio_tar_filepaths: Either a list of audio tarball filepaths, or a
@@ -430,6 +591,26 @@ class TarredAudioToTextDataLayer(DataLayerNM):
             the range [0, 1] of this augmentation being applied.
             If this keyword is not present, then the augmentation is
             disabled and a warning is logged.
+        random_access (bool): Whether to read the tarballs through their
+            member offset index instead of streaming them with WebDataset.
+            Defaults to False.
+        shuffle (bool): Whether to shuffle the samples with random_access,
+            or the order of shards otherwise (see also shuffle_n).
+            Defaults to True.
+        max_batch_duration (float): If set, batches are built by a
+            DurationBucketingBatchSampler with at most this many seconds of
+            padded audio per batch. Requires random_access.
+            Defaults to None.
+        max_batch_frames (int): Same as max_batch_duration, but the budget is
+            given in feature frames of 10 ms. Requires random_access.
+            Defaults to None.
+        num_buckets (int): Number of duration buckets used when
+            max_batch_duration or max_batch_frames is set.
+            Defaults to 10.
+        resample_type (str): Resampler of audio files at other sample rates
+            than sample_rate, 'polyphase' or a librosa res_type, see
+            `parts.resample.resample`.
+            Defaults to 'kaiser_best'.
     """
 
     @property
@@ -467,6 +648,12 @@ class TarredAudioToTextDataLayer(DataLayerNM):
         shuffle_n=0,
         num_workers=0,
         augmentor: Optional[Union[AudioAugmentor, Dict[str, Dict[str, Any]]]] = None,
+        random_access: bool = False,
+        shuffle: bool = True,
+        max_batch_duration: Optional[float] = None,
+        max_batch_frames: Optional[int] = None,
+        num_buckets: int = 10,
+        resample_type: str = 'kaiser_best',
     ):
         super().__init__()
         self._sample_rate = sample_rate
@@ -482,7 +669,9 @@ class TarredAudioToTextDataLayer(DataLayerNM):
             index_by_file_id=True,  # Must set this so the manifest lines can be indexed by file ID
         )
 
-        self.featurizer = WaveformFeaturizer(sample_rate=self._sample_rate, int_values=int_values, augmentor=augmentor)
+        self.featurizer = WaveformFeaturizer(
+            sample_rate=self._sample_rate, int_values=int_values, augmentor=augmentor, resample_type=resample_type
+        )
 
         self.trim = trim_silence
         self.eos_id = eos_id
@@ -494,33 +683,65 @@ class TarredAudioToTextDataLayer(DataLayerNM):
         pad_id = 0 if pad_id is None else pad_id
         self.collate_fn = partial(seq_collate_fn, token_pad_value=pad_id)
 
-        # Check for distributed and partition shards accordingly
-        if torch.distributed.is_available() and torch.distributed.is_initialized():
-            global_rank = torch.distributed.get_rank()
-            world_size = torch.distributed.get_world_size()
+        if not random_access and (max_batch_duration is not None or max_batch_frames is not None):
+            raise ValueError("Duration bucketing of tarred datasets requires random_access=True.")
 
+        self.batch_sampler = None
+        if random_access:
             if isinstance(audio_tar_filepaths, str):
                 audio_tar_filepaths = list(braceexpand.braceexpand(audio_tar_filepaths))
 
-            if len(audio_tar_filepaths) % world_size != 0:
-                logging.warning(
-                    f"Number of shards in tarred dataset ({len(audio_tar_filepaths)}) is not divisible "
-                    f"by number of distributed workers ({world_size})."
+            # Samplers created in Actions take care of shuffling and of splitting among distributed workers
+            self._dataset = TarredAudioDataset(
+                audio_tar_filepaths,
+                collection=self.collection,
+                featurizer=self.featurizer,
+                trim=self.trim,
+                bos_id=self.bos_id,
+                eos_id=self.eos_id,
+            )
+            self._shuffle = shuffle
+            if max_batch_duration is not None or max_batch_frames is not None:
+                self.batch_sampler = DurationBucketingBatchSampler(
+                    self._dataset.durations,
+                    max_batch_duration=max_batch_duration,
+                    max_batch_frames=max_batch_frames,
+                    num_buckets=num_buckets,
+                    shuffle=shuffle,
                 )
+        else:
+            if isinstance(audio_tar_filepaths, str):
+                audio_tar_filepaths = list(braceexpand.braceexpand(audio_tar_filepaths))
 
-            begin_idx = (len(audio_tar_filepaths) // world_size) * global_rank
-            end_idx = begin_idx + (len(audio_tar_filepaths) // world_size)
-            audio_tar_filepaths = audio_tar_filepaths[begin_idx:end_idx]
-
-        # Put together WebDataset
-        self._dataset = (
-            wd.Dataset(audio_tar_filepaths)
-            .shuffle(shuffle_n)
-            .rename(audio='wav', key='__key__')
-            .to_tuple('audio', 'key')
-            .pipe(self._filter)
-            .map(f=self._build_sample)
-        )
+            # Every (rank, worker) pair reads its own shards, reshuffled every epoch
+            self.shard_sampler = TarredShardSampler(num_workers=num_workers, shuffle=shuffle)
+            self._num_shards = len(audio_tar_filepaths)
+            self._shard_sizes = self._count_shard_samples(audio_tar_filepaths)
+
+            # Put together WebDataset
+            self._dataset = _ShardedWebDataset(
+                wd.Dataset(audio_tar_filepaths, shard_selection=self.shard_sampler)
+                .shuffle(shuffle_n)
+                .rename(audio='wav', key='__key__')
+                .to_tuple('audio', 'key')
+                .pipe(self._filter)
+                .map(f=self._build_sample),
+                shard_sampler=self.shard_sampler,
+            )
+
+    def _count_shard_samples(self, audio_tar_filepaths):
+        """Counts the samples of every shard that are in the manifest, using the tar member indices.
+        Returns None if some shard has no index file.
+        """
+        if not all(os.path.exists(tar_index_path(path)) for path in audio_tar_filepaths):
+            logging.info("Not all tarballs have a member index, len() of the data layer is an estimate.")
+            return None
+
+        shard_sizes = []
+        for path in audio_tar_filepaths:
+            file_ids = (os.path.splitext(os.path.basename(name))[0] for name in load_tar_index(path))
+            shard_sizes.append(sum(file_id in self.collection.mapping for file_id in file_ids))
+        return shard_sizes
 
     def _filter(self, iterator):
         """Used to remove samples that have been filtered out by ASRAudioText already.
@@ -581,7 +802,14 @@ class TarredAudioToTextDataLayer(DataLayerNM):
         return f, fl, torch.tensor(t).long(), torch.tensor(tl).long()
 
     def __len__(self):
-        return len(self.collection)
+        """Number of samples this rank reads in the current epoch."""
+        if isinstance(self._dataset, TarredAudioDataset):
+            return len(self._dataset)
+
+        rank_shards = self.shard_sampler.rank_shards(self._num_shards)
+        if self._shard_sizes is None:
+            return len(self.collection) * len(rank_shards) // self._num_shards
+        return sum(self._shard_sizes[shard] for shard in rank_shards)
 
     @property
     def dataset(self):
@@ -624,6 +852,9 @@ class KaldiFeatureDataLayer(DataLayerNM):
         drop_last (bool): See PyTorch DataLoader. Defaults to False.
         shuffle (bool): See PyTorch DataLoader. Defaults to True.
         num_workers (int): See PyTorch DataLoader. Defaults to 0.
+        cache_max_bytes (int): Feature matrices are read from the .ark files
+            on demand. Up to this many bytes of them are cached per worker.
+            Defaults to 0, no cache.
     """
 
     @property
@@ -657,6 +888,7 @@ class KaldiFeatureDataLayer(DataLayerNM):
         drop_last=False,
         shuffle=True,
         num_workers=0,
+        cache_max_bytes=0,
     ):
         super().__init__()
 
@@ -667,6 +899,7 @@ class KaldiFeatureDataLayer(DataLayerNM):
             "min_duration": min_duration,
             "max_duration": max_duration,
             "normalize": normalize_transcripts,
+            "cache_max_bytes": cache_max_bytes,
         }
         self._dataset = KaldiFeatureDataset(**dataset_params)
 
@@ -904,6 +1137,17 @@ target_label_n, "offset": offset_in_sec_n}
             If this keyword is not present, then the augmentation is
             disabled and a warning is logged.
         time_length (int): max seconds to consider in a batch # Pass this only for speaker recognition task
+        audio_cache_max_bytes (int): If > 0, decoded and resampled audio of up
+            to this many bytes is cached in shared memory and read by all
+            DataLoader workers in the following epochs, evicting the oldest
+            entries first. Augmentation still runs on every epoch. Every
+            distributed rank creates a cache of its own, so the caches take
+            world_size times this many bytes in total.
+            Defaults to 0.
+        resample_type (str): Resampler of audio files at other sample rates
+            than sample_rate, 'polyphase' or a librosa res_type, see
+            `parts.resample.resample`.
+            Defaults to 'kaiser_best'.
     """
 
     @property
@@ -934,6 +1178,8 @@ target_label_n, "offset": offset_in_sec_n}
         load_audio: bool = True,
         augmentor: Optional[Union[AudioAugmentor, Dict[str, Dict[str, Any]]]] = None,
         time_length: int = 0,
+        audio_cache_max_bytes: int = 0,
+        resample_type: str = 'kaiser_best',
     ):
         super(AudioToSpeechLabelDataLayer, self).__init__()
 
@@ -944,7 +1190,9 @@ target_label_n, "offset": offset_in_sec_n}
         if augmentor is not None:
             augmentor = _process_augmentations(augmentor)
 
-        self._featurizer = WaveformFeaturizer(sample_rate=sample_rate, int_values=int_values, augmentor=augmentor)
+        self._featurizer = WaveformFeaturizer(
+            sample_rate=sample_rate, int_values=int_values, augmentor=augmentor, resample_type=resample_type
+        )
 
         dataset_params = {
             'manifest_filepath': manifest_filepath,
@@ -954,6 +1202,7 @@ target_label_n, "offset": offset_in_sec_n}
             'min_duration': min_duration,
             'trim': trim_silence,
             'load_audio': load_audio,
+            'audio_cache_max_bytes': audio_cache_max_bytes,
         }
         self._dataset = AudioLabelDataset(**dataset_params)
 
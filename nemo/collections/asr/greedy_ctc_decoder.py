@@ -16,14 +16,51 @@
 # limitations under the License.
 # =============================================================================
 
+import torch
+import torch.nn.functional as F
+
 from nemo.backends.pytorch.nm import NonTrainableNM
-from nemo.core.neural_types import LogprobsType, NeuralType, PredictionsType
+from nemo.core.neural_types import LengthsType, LogprobsType, NeuralType, PredictionsType
 from nemo.utils.decorators import add_port_docs
 
 
+def ctc_greedy_collapse(predictions, blank_id, lengths=None):
+    """
+    Collapses repeated tokens and removes blanks of greedy CTC predictions,
+    for the whole batch at once and on the device of the predictions.
+
+    Args:
+        predictions: argmax token ids (B, T)
+        blank_id: id of the CTC blank symbol
+        lengths: optional number of valid predictions of every utterance (B)
+
+    Returns:
+        Collapsed token ids (B, T), packed to the left and padded with
+        blank_id, and their lengths (B).
+    """
+    predictions = predictions.long()
+    previous = F.pad(predictions[:, :-1], (1, 0), value=blank_id)
+    keep = (predictions != blank_id) & (predictions != previous)
+    if lengths is not None:
+        keep &= torch.arange(predictions.shape[1], device=predictions.device)[None, :] < lengths[:, None]
+
+    # Kept tokens go to their position in the collapsed sequence, dropped ones
+    # to an extra column, which avoids a host sync for boolean indexing
+    positions = torch.where(keep, torch.cumsum(keep, dim=1) - 1, torch.full_like(predictions, predictions.shape[1]))
+    tokens = predictions.new_full((predictions.shape[0], predictions.shape[1] + 1), blank_id)
+    tokens.scatter_(1, positions, predictions)
+    return tokens[:, :-1], keep.sum(dim=1)
+
+
 class GreedyCTCDecoder(NonTrainableNM):
     """
     Greedy decoder that computes the argmax over a softmax distribution
+
+    Args:
+        collapse (bool): whether to collapse repeats and remove blanks of the
+            argmax (see ctc_greedy_collapse). The decoder then outputs the
+            collapsed token ids padded with the blank id and their lengths.
+            Defaults to False.
     """
 
     @property
@@ -40,11 +77,20 @@ class GreedyCTCDecoder(NonTrainableNM):
         """Returns:
             Definitions of module output ports.
         """
+        if self._collapse:
+            return {
+                "predictions": NeuralType(('B', 'T'), PredictionsType()),
+                "prediction_lengths": NeuralType(tuple('B'), LengthsType()),
+            }
         return {"predictions": NeuralType(('B', 'T'), PredictionsType())}
 
-    def __init__(self):
+    def __init__(self, collapse=False):
+        self._collapse = collapse
         super().__init__()
 
     def forward(self, log_probs):
         argmx = log_probs.argmax(dim=-1, keepdim=False)
+        if self._collapse:
+            # The blank symbol is the last class
+            return ctc_greedy_collapse(argmx, blank_id=log_probs.shape[-1] - 1)
         return argmx
@@ -1,32 +1,41 @@
 # Copyright (c) 2019 NVIDIA Corporation
+from functools import lru_cache
 
+import numpy as np
 import torch
 
-from .metrics import classification_accuracy, word_error_rate
+from .greedy_ctc_decoder import ctc_greedy_collapse
+from .metrics import WERAccumulator, classification_accuracy, word_error_rate
 from nemo.utils import logging
 
 
-def __ctc_decoder_predictions_tensor(tensor, labels):
+@lru_cache(maxsize=16)
+def __labels_table(labels: tuple):
+    # Lookup table from token ids to labels, the blank id maps to an empty string
+    return np.array(list(labels) + [''])
+
+
+def __decode_tokens(tokens, lengths, labels):
+    """
+    Joins the labels of the first `lengths` token ids of every row of `tokens`
+    """
+    table = __labels_table(tuple(labels))
+    tokens = tokens.long().cpu()
+    lengths = lengths.long().cpu()
+    # Padding past the lengths, e.g. a pad_id outside of the labels, is mapped to the blank id before the lookup
+    valid = torch.arange(tokens.shape[1]).unsqueeze(0) < lengths.unsqueeze(1)
+    chars = table[tokens.masked_fill(~valid, len(labels)).numpy()]
+    return [''.join(row[:length]) for row, length in zip(chars, lengths.tolist())]
+
+
+def __ctc_decoder_predictions_tensor(tensor, labels, lengths=None):
     """
-    Decodes a sequence of labels to words
+    Decodes a sequence of labels to words. If lengths are given, the
+    predictions are already collapsed (see GreedyCTCDecoder(collapse=True)).
     """
-    blank_id = len(labels)
-    hypotheses = []
-    labels_map = dict([(i, labels[i]) for i in range(len(labels))])
-    prediction_cpu_tensor = tensor.long().cpu()
-    # iterate over batch
-    for ind in range(prediction_cpu_tensor.shape[0]):
-        prediction = prediction_cpu_tensor[ind].numpy().tolist()
-        # CTC decoding procedure
-        decoded_prediction = []
-        previous = len(labels)  # id of a blank symbol
-        for p in prediction:
-            if (p != previous or previous == blank_id) and p != blank_id:
-                decoded_prediction.append(p)
-            previous = p
-        hypothesis = ''.join([labels_map[c] for c in decoded_prediction])
-        hypotheses.append(hypothesis)
-    return hypotheses
+    if lengths is None:
+        tensor, lengths = ctc_greedy_collapse(tensor, blank_id=len(labels))
+    return __decode_tokens(tensor, lengths, labels)
 
 
 def monitor_asr_train_progress(tensors: list, labels: list, eval_metric='WER', tb_logger=None):
@@ -35,28 +44,18 @@ def monitor_asr_train_progress(tensors: list, labels: list, eval_metric='WER', t
     remove duplicates and special symbol. Prints sample to screen, computes
     and logs AVG WER to console and (optionally) Tensorboard
     Args:
-      tensors: A list of 3 tensors (predictions, targets, target_lengths)
+      tensors: A list of 4 tensors (loss, predictions, targets, target_lengths),
+        optionally followed by the prediction lengths of collapsed predictions
       labels: A list of labels
       eval_metric: An optional string from 'WER', 'CER'. Defaults to 'WER'.
       tb_logger: Tensorboard logging object
     Returns:
       None
     """
-    references = []
-
-    labels_map = dict([(i, labels[i]) for i in range(len(labels))])
     with torch.no_grad():
-        # prediction_cpu_tensor = tensors[0].long().cpu()
-        targets_cpu_tensor = tensors[2].long().cpu()
-        tgt_lenths_cpu_tensor = tensors[3].long().cpu()
-
-        # iterate over batch
-        for ind in range(targets_cpu_tensor.shape[0]):
-            tgt_len = tgt_lenths_cpu_tensor[ind].item()
-            target = targets_cpu_tensor[ind][:tgt_len].numpy().tolist()
-            reference = ''.join([labels_map[c] for c in target])
-            references.append(reference)
-        hypotheses = __ctc_decoder_predictions_tensor(tensors[1], labels=labels)
+        references = __decode_tokens(tensors[2], tensors[3], labels)
+        prediction_lengths = tensors[4] if len(tensors) > 4 else None
+        hypotheses = __ctc_decoder_predictions_tensor(tensors[1], labels=labels, lengths=prediction_lengths)
 
     eval_metric = eval_metric.upper()
     if eval_metric not in {'WER', 'CER'}:
@@ -112,48 +111,55 @@ def __gather_losses(losses_list: list) -> list:
     return [torch.mean(torch.stack(losses_list))]
 
 
-def __gather_predictions(predictions_list: list, labels: list) -> list:
+def __gather_predictions(predictions_list: list, labels: list, prediction_len_list: list = None) -> list:
     results = []
-    for prediction in predictions_list:
-        results += __ctc_decoder_predictions_tensor(prediction, labels=labels)
+    if prediction_len_list is None:
+        prediction_len_list = [None] * len(predictions_list)
+    for prediction, ln in zip(predictions_list, prediction_len_list):
+        results += __ctc_decoder_predictions_tensor(prediction, labels=labels, lengths=ln)
     return results
 
 
 def __gather_transcripts(transcript_list: list, transcript_len_list: list, labels: list) -> list:
     results = []
-    labels_map = dict([(i, labels[i]) for i in range(len(labels))])
     # iterate over workers
     for t, ln in zip(transcript_list, transcript_len_list):
-        # iterate over batch
-        t_lc = t.long().cpu()
-        ln_lc = ln.long().cpu()
-        for ind in range(t.shape[0]):
-            tgt_len = ln_lc[ind].item()
-            target = t_lc[ind][:tgt_len].numpy().tolist()
-            reference = ''.join([labels_map[c] for c in target])
-            results.append(reference)
+        results += __decode_tokens(t, ln, labels)
     return results
 
 
-def process_evaluation_batch(tensors: dict, global_vars: dict, labels: list):
+def process_evaluation_batch(
+    tensors: dict, global_vars: dict, labels: list, num_workers: int = 0, max_examples: int = 0,
+):
     """
-    Creates a dictionary holding the results from a batch of audio
+    Accumulates the loss and the error counts of a batch of audio
+
+    Args:
+      tensors: Evaluated tensors of the batch
+      global_vars: Dictionary holding the results of the evaluation so far
+      labels: A list of labels
+      num_workers: Number of worker processes computing edit distances in
+        the background. Defaults to 0.
+      max_examples: Number of (hypothesis, reference) pairs sampled from the
+        evaluation set into global_vars['error_counts'].examples.
+        Defaults to 0.
     """
     if 'EvalLoss' not in global_vars.keys():
         global_vars['EvalLoss'] = []
-    if 'predictions' not in global_vars.keys():
-        global_vars['predictions'] = []
-    if 'transcripts' not in global_vars.keys():
-        global_vars['transcripts'] = []
+    if 'error_counts' not in global_vars.keys():
+        global_vars['error_counts'] = WERAccumulator(num_workers=num_workers, max_examples=max_examples)
     if 'logits' not in global_vars.keys():
         global_vars['logits'] = []
     # if not 'transcript_lengths' in global_vars.keys():
     #  global_vars['transcript_lengths'] = []
+    prediction_list, prediction_len_list = [], None
     for kv, v in tensors.items():
         if kv.startswith('loss'):
             global_vars['EvalLoss'] += __gather_losses(v)
         elif kv.startswith('predictions'):
-            global_vars['predictions'] += __gather_predictions(v, labels=labels)
+            prediction_list = v
+        elif kv.startswith('prediction_lengths'):
+            prediction_len_list = v
         elif kv.startswith('transcript_length'):
             transcript_len_list = v
         elif kv.startswith('transcript'):
@@ -161,7 +167,10 @@ def process_evaluation_batch(tensors: dict, global_vars: dict, labels: list):
         elif kv.startswith('output'):
             global_vars['logits'] += v
 
-    global_vars['transcripts'] += __gather_transcripts(transcript_list, transcript_len_list, labels=labels)
+    global_vars['error_counts'].update(
+        __gather_predictions(prediction_list, labels=labels, prediction_len_list=prediction_len_list),
+        __gather_transcripts(transcript_list, transcript_len_list, labels=labels),
+    )
 
 
 def process_evaluation_epoch(global_vars: dict, eval_metric='WER', tag=None):
@@ -169,15 +178,15 @@ def process_evaluation_epoch(global_vars: dict, eval_metric='WER', tag=None):
     Calculates the aggregated loss and WER across the entire evaluation dataset
     """
     eloss = torch.mean(torch.stack(global_vars['EvalLoss'])).item()
-    hypotheses = global_vars['predictions']
-    references = global_vars['transcripts']
 
     eval_metric = eval_metric.upper()
     if eval_metric not in {'WER', 'CER'}:
         raise ValueError('eval_metric must be \'WER\' or \'CER\'')
     use_cer = True if eval_metric == 'CER' else False
 
-    wer = word_error_rate(hypotheses=hypotheses, references=references, use_cer=use_cer)
+    error_counts = global_vars['error_counts']
+    error_counts.close()
+    wer = error_counts.cer if use_cer else error_counts.wer
 
     if tag is None:
         logging.info(f"==========>>>>>>Evaluation Loss: {eloss}")
@@ -192,8 +201,8 @@ def process_evaluation_epoch(global_vars: dict, eval_metric='WER', tag=None):
         }
 
 
-def post_process_predictions(predictions, labels):
-    return __gather_predictions(predictions, labels=labels)
+def post_process_predictions(predictions, labels, prediction_lengths=None):
+    return __gather_predictions(predictions, labels=labels, prediction_len_list=prediction_lengths)
 
 
 def post_process_transcripts(transcript_list, transcript_len_list, labels):
@@ -99,6 +99,11 @@ class JasperEncoder(TrainableNM):
             initialized. Options are ['xavier_uniform', 'xavier_normal',
             'kaiming_uniform','kaiming_normal'].
             Defaults to "xavier_uniform".
+        skip_equal_length_masks (bool): In eval mode, skips the masking of
+            batches in which all inputs have the full length, whose masks
+            are empty. Checking the lengths synchronizes with the device once
+            per forward.
+            Defaults to False.
     """
 
     length: Optional[torch.Tensor]
@@ -151,6 +156,19 @@ class JasperEncoder(TrainableNM):
             input_example = input_example.cuda()
         return input_example, None
 
+    def optimize_for_inference(self):
+        """Turns the encoder into a frozen, faster encoder for inference, e.g. for serving on CPU.
+
+        Batch norms are folded into the convolutions before them, dropouts are removed and masking is skipped for
+        batches of equal-length inputs (see skip_equal_length_masks). The encoder is switched to eval mode and can't
+        be trained anymore. Checkpoints must be restored before, as the folded encoder has different weights.
+        """
+        self.eval()
+        for block in self.encoder:
+            block.fold_for_inference()
+        self._skip_equal_length_masks = True
+        self.freeze()
+
     def __init__(
         self,
         jasper,
@@ -162,9 +180,11 @@ class JasperEncoder(TrainableNM):
         conv_mask=True,
         frame_splicing=1,
         init_mode='xavier_uniform',
+        skip_equal_length_masks=False,
     ):
         super().__init__()
 
+        self._skip_equal_length_masks = skip_equal_length_masks
         activation = jasper_activations[activation]()
         feat_in = feat_in * frame_splicing
 
@@ -225,7 +245,16 @@ class JasperEncoder(TrainableNM):
     def forward(self, audio_signal, length=None):
         # type: (Tensor, Optional[Tensor]) -> Tensor, Optional[Tensor]
 
-        s_input, length = self.encoder(([audio_signal], length))
+        skip_masks = (
+            self._skip_equal_length_masks
+            and not self.training
+            and length is not None
+            and bool((length >= audio_signal.size(2)).all())
+        )
+        s_input = ([audio_signal], length)
+        for block in self.encoder:
+            s_input = block(s_input, skip_masks=skip_masks)
+        s_input, length = s_input
         if length is None:
             return s_input[-1]
 
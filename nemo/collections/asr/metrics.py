@@ -1,4 +1,7 @@
 # Copyright (c) 2019 NVIDIA Corporation
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Optional
 
 import editdistance
@@ -47,6 +50,141 @@ def word_error_rate(hypotheses: List[str], references: List[str], use_cer=False)
     return wer
 
 
+def _error_counts(hypotheses: List[str], references: List[str]) -> List[int]:
+    """Returns word errors, reference words, character errors and reference characters of pairs of texts."""
+    counts = [0, 0, 0, 0]
+    for h, r in zip(hypotheses, references):
+        h_list, r_list = h.split(), r.split()
+        counts[0] += editdistance.eval(h_list, r_list)
+        counts[1] += len(r_list)
+        counts[2] += editdistance.eval(h, r)
+        counts[3] += len(r)
+    return counts
+
+
+class WERAccumulator(object):
+    """
+    Accumulates word and character error counts batch by batch, so that the
+    error rates of a dataset are available without keeping its texts.
+
+    Edit distances are computed in `update`, or by a pool of worker processes
+    in the background if num_workers > 0. Besides the counts, only a uniform
+    random sample of at most max_examples (hypothesis, reference) pairs is
+    kept. Accumulators of different data loaders or distributed ranks are
+    combined with `merge` or `all_reduce`.
+
+    Args:
+        num_workers: Number of worker processes computing edit distances.
+            Defaults to 0.
+        max_examples: Maximum number of sampled example pairs. Defaults to 0.
+        seed: Seed of the example sampling. Defaults to None.
+    """
+
+    def __init__(self, num_workers: int = 0, max_examples: int = 0, seed: Optional[int] = None):
+        self.max_examples = max_examples
+        self._rng = random.Random(seed)
+        self._pool = ProcessPoolExecutor(num_workers) if num_workers > 0 else None
+        # Bounds the number of batches waiting for the pool, and with it the memory held by their texts
+        self._max_pending = 2 * num_workers
+        self._pending = deque()
+        self.reset()
+
+    def reset(self):
+        self._wait()
+        self.word_errors = self.words = self.char_errors = self.chars = 0
+        self.num_utterances = 0
+        self.examples = []
+
+    def update(self, hypotheses: List[str], references: List[str]):
+        """Adds the errors of a batch of hypotheses and their references."""
+        if len(hypotheses) != len(references):
+            raise ValueError(
+                "In word error rate calculation, hypotheses and reference"
+                " lists must have the same number of elements. But I got:"
+                "{0} and {1} correspondingly".format(len(hypotheses), len(references))
+            )
+        for pair in zip(hypotheses, references):
+            # Reservoir sampling
+            self.num_utterances += 1
+            if len(self.examples) < self.max_examples:
+                self.examples.append(pair)
+            elif self.max_examples > 0:
+                index = self._rng.randrange(self.num_utterances)
+                if index < self.max_examples:
+                    self.examples[index] = pair
+
+        if self._pool is None:
+            self._add(_error_counts(hypotheses, references))
+            return
+        self._pending.append(self._pool.submit(_error_counts, list(hypotheses), list(references)))
+        while self._pending and (self._pending[0].done() or len(self._pending) > self._max_pending):
+            self._add(self._pending.popleft().result())
+
+    def merge(self, other: 'WERAccumulator'):
+        """Adds the errors and examples of another accumulator."""
+        self._wait()
+        other._wait()
+        self._add(other._counts())
+
+        # Merges both samples into a uniform sample of the union, drawing from each with the probability of its
+        # remaining share of utterances
+        mine, theirs = self.examples.copy(), other.examples.copy()
+        self._rng.shuffle(mine)
+        self._rng.shuffle(theirs)
+        remaining_mine, remaining_theirs = self.num_utterances, other.num_utterances
+        self.examples = []
+        for _ in range(min(self.max_examples, len(mine) + len(theirs))):
+            if mine and (not theirs or self._rng.random() * (remaining_mine + remaining_theirs) < remaining_mine):
+                self.examples.append(mine.pop())
+                remaining_mine -= 1
+            else:
+                self.examples.append(theirs.pop())
+                remaining_theirs -= 1
+        self.num_utterances += other.num_utterances
+
+    def all_reduce(self):
+        """Sums the error counts of all torch.distributed ranks. Examples stay local to every rank."""
+        self._wait()
+        if not (torch.distributed.is_available() and torch.distributed.is_initialized()):
+            return
+        device = torch.device("cuda") if torch.distributed.get_backend() == "nccl" else torch.device("cpu")
+        counts = torch.tensor(self._counts() + [self.num_utterances], dtype=torch.long, device=device)
+        torch.distributed.all_reduce(counts)
+        counts = counts.tolist()
+        self.word_errors, self.words, self.char_errors, self.chars = counts[:4]
+        self.num_utterances = counts[4]
+
+    @property
+    def wer(self) -> float:
+        self._wait()
+        return 1.0 * self.word_errors / self.words if self.words != 0 else float('inf')
+
+    @property
+    def cer(self) -> float:
+        self._wait()
+        return 1.0 * self.char_errors / self.chars if self.chars != 0 else float('inf')
+
+    def close(self):
+        """Waits for pending batches and shuts the worker processes down."""
+        self._wait()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _counts(self):
+        return [self.word_errors, self.words, self.char_errors, self.chars]
+
+    def _add(self, counts):
+        self.word_errors += counts[0]
+        self.words += counts[1]
+        self.char_errors += counts[2]
+        self.chars += counts[3]
+
+    def _wait(self):
+        while self._pending:
+            self._add(self._pending.popleft().result())
+
+
 def classification_accuracy(
     logits: torch.Tensor, targets: torch.Tensor, top_k: Optional[List[int]] = None
 ) -> List[float]:
@@ -0,0 +1,154 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Decoded audio cache shared by all DataLoader workers.
+
+Decoding and resampling an audio file usually costs more than the augmentations applied to it, and every epoch
+repeats it for the same files. `SharedAudioCache` keeps the decoded, resampled float32 samples of dataset entries
+in a memory-mapped file (in /dev/shm when available), so that an entry decoded by one worker can be read by all
+others in the following epochs. Augmentations are applied to a copy of the cached samples and still differ from
+epoch to epoch.
+
+The file holds a header followed by a ring buffer of samples::
+
+    int64           # head, total number of bytes ever reserved in the ring buffer
+    int64[N, 2]     # per entry: 1 + absolute start of its samples (0 if not cached), number of bytes
+    uint8[max_bytes]  # ring buffer
+
+New samples are written at the head, wrapping around to the start of the ring buffer, which evicts the oldest
+entries first. An entry is valid as long as the head has not moved more than `max_bytes` past its start, so readers
+check it again after copying the samples and drop entries that were overwritten in the meantime. Only reserving
+space and publishing entries take the lock, reads and writes of samples run concurrently.
+"""
+import mmap
+import multiprocessing
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+from nemo.utils import logging
+
+__all__ = ['SharedAudioCache']
+
+
+def _free_bytes(directory):
+    stats = os.statvfs(directory)
+    return stats.f_bavail * stats.f_frsize
+
+
+def _remove_file(path, pid):
+    # Only the process that created the cache removes its file, not the workers it was copied to
+    if os.getpid() == pid and os.path.exists(path):
+        os.remove(path)
+
+
+class SharedAudioCache(object):
+    """Byte bounded cache of decoded float32 samples of dataset entries, shared across processes.
+
+    The cache must be created in the main process, before the DataLoader workers are started.
+
+    Args:
+        num_entries: Number of entries of the dataset, keys are integers in [0, num_entries).
+        max_bytes: Size of the ring buffer of samples in bytes.
+        directory: Directory of the memory-mapped file. Defaults to /dev/shm if it exists and has room for the
+            whole cache, otherwise to the temporary directory.
+
+    Raises:
+        ValueError: If the directory does not have room for the whole cache. Writing to a memory-mapped file past
+            the free space of its file system kills the process with SIGBUS.
+    """
+
+    def __init__(self, num_entries, max_bytes, directory=None):
+        self.num_entries = num_entries
+        self.max_bytes = max_bytes
+        size = 8 * (1 + 2 * num_entries) + max_bytes
+        if directory is None:
+            directory = tempfile.gettempdir()
+            if os.path.isdir('/dev/shm'):
+                if _free_bytes('/dev/shm') >= size:
+                    directory = '/dev/shm'
+                else:
+                    logging.warning(
+                        f"/dev/shm has {_free_bytes('/dev/shm')} free bytes, less than the {size} bytes of the audio "
+                        f"cache, the cache is created in {directory} instead."
+                    )
+        if _free_bytes(directory) < size:
+            raise ValueError(
+                f"The audio cache needs {size} bytes but {directory} only has {_free_bytes(directory)} free bytes. "
+                f"Lower the cache size or pass a directory with more space."
+            )
+
+        fd, self.path = tempfile.mkstemp(prefix='nemo_audio_cache_', dir=directory)
+        try:
+            # Pages of the sparse file are only allocated once they are written
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.path, os.getpid())
+        self._lock = multiprocessing.Lock()
+        self._open()
+
+    def _open(self):
+        with open(self.path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        header = np.frombuffer(self._mmap, dtype=np.int64, count=1 + 2 * self.num_entries)
+        self._head = header[:1]
+        self._entries = header[1:].reshape(self.num_entries, 2)
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8, count=self.max_bytes, offset=header.nbytes)
+
+    def __getstate__(self):
+        # Workers map the file again by its path
+        state = self.__dict__.copy()
+        for name in ('_finalizer', '_mmap', '_head', '_entries', '_buffer'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._finalizer = None
+        self._open()
+
+    @property
+    def num_bytes(self):
+        """Number of bytes of samples written to the cache so far, including evicted ones."""
+        return int(self._head[0])
+
+    def get(self, key):
+        """Returns a copy of the cached samples of entry `key`, or None if they are not cached."""
+        with self._lock:
+            start, num_bytes = self._entries[key].tolist()
+        if start == 0:
+            return None
+        start -= 1
+        offset = start % self.max_bytes
+        samples = self._buffer[offset : offset + num_bytes].copy()
+        with self._lock:
+            head = int(self._head[0])
+        # Samples were overwritten if the ring buffer wrapped around past them
+        if head - self.max_bytes > start:
+            return None
+        return samples.view(np.float32)
+
+    def put(self, key, samples):
+        """Caches the samples of entry `key`. Samples larger than the whole cache are not cached."""
+        data = np.ascontiguousarray(samples, dtype=np.float32).reshape(-1).view(np.uint8)
+        if data.nbytes == 0 or data.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            start = int(self._head[0])
+            # Samples are contiguous, skip the end of the ring buffer if they don't fit there
+            if start % self.max_bytes + data.nbytes > self.max_bytes:
+                start += self.max_bytes - start % self.max_bytes
+            self._head[0] = start + data.nbytes
+        offset = start % self.max_bytes
+        self._buffer[offset : offset + data.nbytes] = data
+        with self._lock:
+            if self._head[0] - self.max_bytes <= start:
+                self._entries[key] = (start + 1, data.nbytes)
+
+    def close(self):
+        """Unmaps the cache and removes its file if this process created it."""
+        del self._head, self._entries, self._buffer
+        self._mmap.close()
+        if self._finalizer is not None:
+            self._finalizer()
@@ -1,12 +1,14 @@
 # Copyright (c) 2019 NVIDIA Corporation
 import collections
+import collections.abc
 import json
 import os
 from typing import Any, Dict, List, Optional, Union
 
+import numpy as np
 import pandas as pd
 
-from nemo.collections.asr.parts import manifest, parsers
+from nemo.collections.asr.parts import manifest, manifest_index, parsers
 from nemo.utils import logging
 
 
@@ -186,6 +188,96 @@ class ASRAudioText(AudioText):
         super().__init__(ids, audio_files, durations, texts, offsets, speakers, *args, **kwargs)
 
 
+class IndexedASRAudioText(collections.abc.Sequence):
+    """`ASRAudioText` counterpart backed by a compiled, memory-mapped `ManifestIndex`.
+
+    Filtering and sorting are done with vectorized operations over the mapped arrays and entities are only
+    materialized on access, so the collection costs a few bytes per kept entry and is shared copy-on-write between
+    DataLoader workers.
+    """
+
+    OUTPUT_TYPE = AudioText.OUTPUT_TYPE
+
+    def __init__(
+        self,
+        index_dir: str,
+        parser: Optional[parsers.CharParser] = None,
+        min_duration: Optional[float] = None,
+        max_duration: Optional[float] = None,
+        max_number: Optional[int] = None,
+        do_sort_by_duration: bool = False,
+        index_by_file_id: bool = False,
+    ):
+        """Opens manifest index and selects entries to keep.
+
+        Args:
+            index_dir: Directory with an index built by `manifest_index.build_manifest_index`.
+            parser: Instance of `CharParser` the index is checked to be built with.
+            min_duration: Minimum duration to keep entry with (default: None).
+            max_duration: Maximum duration to keep entry with (default: None).
+            max_number: Maximum number of samples to collect.
+            do_sort_by_duration: True if sort samples list by duration. Not compatible with index_by_file_id.
+            index_by_file_id: If True, saves a mapping from filename base (ID) to index in data.
+        """
+
+        self.index = manifest_index.ManifestIndex(index_dir, parser=parser)
+
+        durations = self.index.durations
+        keep = np.array(self.index.parsed, dtype=bool)
+        if min_duration is not None:
+            keep &= durations >= min_duration
+        if max_duration is not None:
+            keep &= durations <= max_duration
+
+        selected = np.flatnonzero(keep)
+        if max_number:
+            selected = selected[:max_number]
+        num_filtered = len(self.index) - len(selected)
+        duration_filtered = durations.sum() - durations[selected].sum()
+
+        if do_sort_by_duration:
+            if index_by_file_id:
+                logging.warning("Tried to sort dataset by duration, but cannot since index_by_file_id is set.")
+            else:
+                selected = selected[np.argsort(durations[selected], kind='stable')]
+
+        self._selected = selected
+
+        if index_by_file_id:
+            self.mapping = {}
+            for i in range(len(selected)):
+                file_id, _ = os.path.splitext(os.path.basename(self.index.audio_file(selected[i])))
+                self.mapping[file_id] = i
+
+        logging.info(
+            "Dataset loaded with %d files totalling %.2f hours", len(selected), durations[selected].sum() / 3600
+        )
+        logging.info("%d files were filtered totalling %.2f hours", num_filtered, duration_filtered / 3600)
+
+    @property
+    def durations(self) -> np.ndarray:
+        """Durations of the kept entries, in collection order."""
+        return self.index.durations[self._selected]
+
+    def __len__(self):
+        return len(self._selected)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        j = self._selected[i]
+        return self.OUTPUT_TYPE(
+            int(self.index.ids[j]),
+            self.index.audio_file(j),
+            float(self.index.durations[j]),
+            self.index.tokens(j),
+            self.index.offset(j),
+            self.index.text(j),
+            self.index.speaker(j),
+        )
+
+
 class SpeechLabel(_Collection):
     """List of audio-label correspondence with preprocessing."""
 
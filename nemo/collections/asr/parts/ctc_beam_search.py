@@ -0,0 +1,294 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""CTC prefix beam search with n-gram language model scoring, without an external decoder build.
+
+`NGramLanguageModel` reads a backoff n-gram model in ARPA format. `CTCPrefixBeamSearch` runs a character level
+prefix beam search over the log-probs of one utterance and scores every completed word (delimited by the space
+label) with `alpha * log P(word | history) + beta`, as Baidu's ctc_decoders do. `decode_batch` spreads the
+utterances of a batch over a pool of worker processes and returns without waiting for them, so that the next
+acoustic batch can be computed while the previous one is decoded.
+"""
+import math
+from collections.abc import Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+NEG_INF = float('-inf')
+LN_10 = math.log(10.0)
+
+
+def _logaddexp(a, b):
+    if a < b:
+        a, b = b, a
+    if b == NEG_INF:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+class NGramLanguageModel(object):
+    """Backoff n-gram language model read from an ARPA file.
+
+    The n-grams form a trie of integer nodes. A single dict maps (parent node, word id), packed into one integer,
+    to the child node, and float32 arrays hold the log-probability and backoff weight of every node. Scores are
+    natural log-probabilities.
+
+    Args:
+        path: Path to the ARPA file.
+        unk_log_prob: log10-probability of words that are not in the model, if it has no <unk> unigram.
+    """
+
+    def __init__(self, path, unk_log_prob=-100.0):
+        counts, sections = {}, []
+        with open(path, encoding='utf-8') as f:
+            order = 0
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('ngram '):
+                    n, count = line[len('ngram ') :].split('=')
+                    counts[int(n)] = int(count)
+                elif line.startswith('\\') and line.endswith('-grams:'):
+                    order = int(line[1 : -len('-grams:')])
+                    sections.append(order)
+                    if order == 1:
+                        self._allocate(counts)
+                elif line == '\\end\\':
+                    break
+                elif order > 0:
+                    self._add(order, line.split())
+        if not sections:
+            raise ValueError(f"{path} does not contain any n-grams.")
+
+        self.order = max(sections)
+        unk = self.word_ids.get('<unk>')
+        self.unk_log_prob = float(self.log_probs[self._children[unk]]) if unk is not None else unk_log_prob * LN_10
+        bos = self.word_ids.get('<s>')
+        self.start_state = (bos,) if bos is not None and self.order > 1 else ()
+
+    def _allocate(self, counts):
+        num_nodes = 1 + sum(counts.values())
+        self.word_ids = {}
+        self.num_words = counts[1]
+        self._children = {}
+        self.log_probs = np.zeros(num_nodes, dtype=np.float32)
+        self.backoffs = np.zeros(num_nodes, dtype=np.float32)
+        self._num_nodes = 1
+
+    def _add(self, order, fields):
+        words = fields[1 : 1 + order]
+        if order == 1:
+            word_ids = [self.word_ids.setdefault(words[0], len(self.word_ids))]
+        else:
+            word_ids = [self.word_ids.get(word) for word in words]
+            if None in word_ids:
+                return
+        parent = self.find(word_ids[:-1])
+        if parent is None:
+            return
+        node = self._num_nodes
+        self._num_nodes += 1
+        self._children[parent * self.num_words + word_ids[-1]] = node
+        self.log_probs[node] = float(fields[0]) * LN_10
+        if len(fields) > 1 + order:
+            self.backoffs[node] = float(fields[1 + order]) * LN_10
+
+    def find(self, word_ids):
+        """Returns the trie node of a sequence of word ids, or None if the model does not contain it."""
+        node = 0
+        for word_id in word_ids:
+            node = self._children.get(node * self.num_words + word_id)
+            if node is None:
+                return None
+        return node
+
+    def score(self, state, word_id):
+        """Log-probability of a word after the history `state`, a tuple of the last word ids.
+
+        Returns:
+            The log-probability and the history after the word.
+        """
+        if word_id is None:
+            return self.unk_log_prob, ()
+        backoff = 0.0
+        for start in range(len(state) + 1):
+            context = self.find(state[start:])
+            if context is None:
+                continue
+            node = self._children.get(context * self.num_words + word_id)
+            if node is not None:
+                history = state[start:] + (word_id,)
+                return backoff + float(self.log_probs[node]), history[max(len(history) - self.order + 1, 0) :]
+            backoff += float(self.backoffs[context])
+        return self.unk_log_prob, ()
+
+
+class BeamSearchResults(Sequence):
+    """Beam search results of a batch that are computed in the background. Indexing waits for the utterance."""
+
+    def __init__(self, futures):
+        self._futures = futures
+
+    def __len__(self):
+        return len(self._futures)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [future.result() for future in self._futures[index]]
+        return self._futures[index].result()
+
+
+_worker_search = None
+
+
+def _init_worker(search):
+    global _worker_search
+    _worker_search = search
+
+
+def _decode_in_worker(log_probs):
+    return _worker_search.decode(log_probs)
+
+
+class CTCPrefixBeamSearch(object):
+    """CTC prefix beam search over the labels of an acoustic model, with optional n-gram language model scoring.
+
+    Args:
+        vocab: Labels of the acoustic model without the blank, which is the last class.
+        beam_width: Number of prefixes kept after every frame.
+        alpha: Weight of the language model log-probability of a word.
+        beta: Bonus added for every word.
+        language_model: NGramLanguageModel, or None to decode without one.
+        cutoff_prob: Only the most probable labels with this cumulative probability are expanded at every frame.
+        cutoff_top_n: At most this many labels are expanded at every frame.
+        num_workers: Number of worker processes of `decode_batch`, 0 decodes in the calling process.
+    """
+
+    def __init__(
+        self,
+        vocab,
+        beam_width,
+        alpha=0.0,
+        beta=0.0,
+        language_model=None,
+        cutoff_prob=1.0,
+        cutoff_top_n=40,
+        num_workers=0,
+    ):
+        self.vocab = list(vocab)
+        self.blank_id = len(self.vocab)
+        self.space_id = self.vocab.index(' ') if ' ' in self.vocab else -1
+        self.beam_width = beam_width
+        self.alpha = alpha
+        self.beta = beta
+        self.language_model = language_model
+        self.cutoff_prob = cutoff_prob
+        self.cutoff_top_n = cutoff_top_n
+        self.num_workers = num_workers
+        self._lm_cache = {}
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_lm_cache'] = {}
+        return state
+
+    def _candidates(self, log_probs):
+        if self.cutoff_prob >= 1.0 and self.cutoff_top_n >= len(log_probs):
+            return range(len(log_probs))
+        order = np.argsort(log_probs)[::-1][: self.cutoff_top_n]
+        if self.cutoff_prob < 1.0:
+            cumulative = np.cumsum(np.exp(log_probs[order]))
+            order = order[: np.searchsorted(cumulative, self.cutoff_prob) + 1]
+        return order.tolist()
+
+    def _score_word(self, lm_info, prefix, end):
+        # Adds the language model score of the word between the last space and `end` to the prefix score
+        bonus, lm_state, word_start = lm_info
+        if self.language_model is None or end == word_start:
+            return bonus, lm_state, end + 1
+        word = ''.join(self.vocab[c] for c in prefix[word_start:end])
+        key = (lm_state, word)
+        if key not in self._lm_cache:
+            if len(self._lm_cache) > 1000000:
+                self._lm_cache.clear()
+            self._lm_cache[key] = self.language_model.score(lm_state, self.language_model.word_ids.get(word))
+        log_prob, lm_state = self._lm_cache[key]
+        return bonus + self.alpha * log_prob + self.beta, lm_state, end + 1
+
+    def decode(self, log_probs):
+        """Decodes the log-probs (T, C) of one utterance.
+
+        Returns:
+            List of at most beam_width (score, text) tuples, best first.
+        """
+        log_probs = np.asarray(log_probs, dtype=np.float32)
+        start_state = self.language_model.start_state if self.language_model is not None else ()
+        # prefix -> [log-prob of ending in blank, log-prob of ending in a label]
+        beams = {(): [0.0, NEG_INF]}
+        # prefix -> (language model score, language model state, start of the current word)
+        lm_infos = {(): (0.0, start_state, 0)}
+
+        for frame in log_probs:
+            frame_list = frame.tolist()
+            next_beams = {}
+            for prefix, (p_blank, p_label) in beams.items():
+                p_total = _logaddexp(p_blank, p_label)
+                last = prefix[-1] if prefix else None
+                for c in self._candidates(frame):
+                    p = frame_list[c]
+                    if c == self.blank_id:
+                        entry = next_beams.setdefault(prefix, [NEG_INF, NEG_INF])
+                        entry[0] = _logaddexp(entry[0], p_total + p)
+                        continue
+                    new_prefix = prefix + (c,)
+                    entry = next_beams.setdefault(new_prefix, [NEG_INF, NEG_INF])
+                    if c == last:
+                        # Repeated labels only extend the prefix after a blank, otherwise they collapse
+                        entry[1] = _logaddexp(entry[1], p_blank + p)
+                        entry = next_beams.setdefault(prefix, [NEG_INF, NEG_INF])
+                        entry[1] = _logaddexp(entry[1], p_label + p)
+                    else:
+                        entry[1] = _logaddexp(entry[1], p_total + p)
+                    if new_prefix not in lm_infos:
+                        lm_info = lm_infos[prefix]
+                        if c == self.space_id:
+                            lm_info = self._score_word(lm_info, new_prefix, len(prefix))
+                        lm_infos[new_prefix] = lm_info
+
+            best = sorted(
+                next_beams.items(), key=lambda kv: _logaddexp(*kv[1]) + lm_infos[kv[0]][0], reverse=True,
+            )
+            beams = dict(best[: self.beam_width])
+            lm_infos = {prefix: lm_infos[prefix] for prefix in beams}
+
+        results = []
+        for prefix, (p_blank, p_label) in beams.items():
+            # Scores the last word if the prefix does not end with a space
+            bonus = self._score_word(lm_infos[prefix], prefix, len(prefix))[0]
+            results.append((_logaddexp(p_blank, p_label) + bonus, ''.join(self.vocab[c] for c in prefix)))
+        return sorted(results, key=lambda result: result[0], reverse=True)
+
+    def decode_batch(self, log_probs_list):
+        """Decodes the log-probs (T, C) of every utterance of a batch, in the worker processes if num_workers > 0.
+
+        Returns:
+            BeamSearchResults, a sequence of the results of `decode` for every utterance. With worker processes,
+            it is returned right away and indexing it waits for the decoding of the utterance.
+        """
+        if self.num_workers == 0:
+            futures = []
+            for log_probs in log_probs_list:
+                futures.append(Future())
+                futures[-1].set_result(self.decode(log_probs))
+            return BeamSearchResults(futures)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.num_workers, initializer=_init_worker, initargs=(self,))
+        return BeamSearchResults([self._pool.submit(_decode_in_worker, log_probs) for log_probs in log_probs_list])
+
+    def close(self):
+        """Shuts the worker processes down."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
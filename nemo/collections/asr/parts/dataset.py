@@ -1,17 +1,47 @@
 # Audio dataset and corresponding functions taken from Patter
 # https://github.com/ryanleary/patter
 # TODO: review, and copyright and fix/add comments
+import io
 import os
+import re
 
 import kaldi_io
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 
 from nemo import logging
-from nemo.collections.asr.parts import collections, parsers
+from nemo.collections.asr.parts import collections, parsers, tar_index
+from nemo.collections.asr.parts.audio_cache import SharedAudioCache
+from nemo.collections.asr.parts.perturb import _AudioCache
 
 
-def seq_collate_fn(batch, token_pad_value=0):
+def _new_batch_tensor(shape, dtype, pin_memory=False):
+    """Allocates a whole batch tensor at once, in page-locked memory if requested and CUDA is available."""
+    return torch.empty(shape, dtype=dtype, pin_memory=pin_memory and torch.cuda.is_available())
+
+
+def _stack(tensors, pin_memory=False):
+    out = torch.stack(tensors)
+    if pin_memory and torch.cuda.is_available():
+        out = out.pin_memory()
+    return out
+
+
+def _pad_batch(tensors, lengths, max_len, pad_value, pin_memory=False):
+    """Copies 1d tensors into a single preallocated (batch, max_len) tensor, padding with pad_value."""
+    if tensors[0].dim() == 0:
+        # Scalar labels, e.g. from AudioLabelDataset
+        return _stack(tensors, pin_memory)
+    out = _new_batch_tensor((len(tensors), max_len), tensors[0].dtype, pin_memory)
+    for i, (t, length) in enumerate(zip(tensors, lengths)):
+        out[i, :length] = t[:length]
+        if length < max_len:
+            out[i, length:] = pad_value
+    return out
+
+
+def seq_collate_fn(batch, token_pad_value=0, pin_memory=False):
     """collate batch of audio sig, audio len, tokens, tokens len
 
     Args:
@@ -19,41 +49,29 @@ def seq_collate_fn(batch, token_pad_value=0):
                LongTensor):  A tuple of tuples of signal, signal lengths,
                encoded tokens, and encoded tokens length.  This collate func
                assumes the signals are 1d torch tensors (i.e. mono audio).
+        token_pad_value (int): value to pad tokens with.
+        pin_memory (bool): whether to allocate the returned tensors in
+            pinned memory. Only takes effect if CUDA is available. Prefer
+            the DataLoader's own pin_memory when using worker processes.
 
     """
-    _, audio_lengths, _, tokens_lengths = zip(*batch)
-    max_audio_len = 0
-    has_audio = audio_lengths[0] is not None
-    if has_audio:
-        max_audio_len = max(audio_lengths).item()
-    max_tokens_len = max(tokens_lengths).item()
-
-    audio_signal, tokens = [], []
-    for sig, sig_len, tokens_i, tokens_i_len in batch:
-        if has_audio:
-            sig_len = sig_len.item()
-            if sig_len < max_audio_len:
-                pad = (0, max_audio_len - sig_len)
-                sig = torch.nn.functional.pad(sig, pad)
-            audio_signal.append(sig)
-        tokens_i_len = tokens_i_len.item()
-        if tokens_i_len < max_tokens_len:
-            pad = (0, max_tokens_len - tokens_i_len)
-            tokens_i = torch.nn.functional.pad(tokens_i, pad, value=token_pad_value)
-        tokens.append(tokens_i)
-
-    if has_audio:
-        audio_signal = torch.stack(audio_signal)
-        audio_lengths = torch.stack(audio_lengths)
+    audio_signal, audio_lengths, tokens, tokens_lengths = zip(*batch)
+
+    tokens_lengths = _stack(tokens_lengths, pin_memory)
+    token_lens = tokens_lengths.tolist()
+    tokens = _pad_batch(tokens, token_lens, max(token_lens), token_pad_value, pin_memory)
+
+    if audio_lengths[0] is not None:
+        audio_lengths = _stack(audio_lengths, pin_memory)
+        audio_lens = audio_lengths.tolist()
+        audio_signal = _pad_batch(audio_signal, audio_lens, max(audio_lens), 0, pin_memory)
     else:
         audio_signal, audio_lengths = None, None
-    tokens = torch.stack(tokens)
-    tokens_lengths = torch.stack(tokens_lengths)
 
     return audio_signal, audio_lengths, tokens, tokens_lengths
 
 
-def fixed_seq_collate_fn(batch, fixed_length=16000):
+def fixed_seq_collate_fn(batch, fixed_length=16000, pin_memory=False):
     """collate batch of audio sig, audio len, tokens, tokens len
 
     Args:
@@ -62,75 +80,100 @@ def fixed_seq_collate_fn(batch, fixed_length=16000):
                encoded tokens, and encoded tokens length.  This collate func
                assumes the signals are 1d torch tensors (i.e. mono audio).
         fixed_length (Optional[int]): length of input signal to be considered
+        pin_memory (bool): whether to allocate the returned tensors in
+            pinned memory. Only takes effect if CUDA is available.
 
     """
-    _, audio_lengths, _, tokens_lengths = zip(*batch)
-
-    has_audio = audio_lengths[0] is not None
-    fixed_length = min(fixed_length, max(audio_lengths))
-
-    audio_signal, tokens = [], []
-    for sig, sig_len, tokens_i, _ in batch:
-        if has_audio:
-            sig_len = sig_len.item()
-            chunck_len = sig_len - fixed_length
-            if chunck_len < 0:
-                # pad = (0,fixed_length-sig_len)
-                # signal = torch.nn.functional.pad(sig,pad)
-                repeat = fixed_length // sig_len
-                rem = fixed_length % sig_len
-                sub = sig[-rem:] if rem > 0 else torch.tensor([])
-                rep_sig = torch.cat(repeat * [sig])
-                signal = torch.cat((rep_sig, sub))
-                # print(sig_len,repeat,rem,len(sub),len(rep_sig),len(signal))
-            else:
-                start_idx = torch.randint(0, chunck_len, (1,)) if chunck_len else torch.tensor(0)
-                end_idx = start_idx + fixed_length
-                signal = sig[start_idx:end_idx]
-
-            audio_signal.append(signal)
-        tokens.append(tokens_i)
-
-    if has_audio:
-        audio_signal = torch.stack(audio_signal)
-        audio_lengths = torch.stack(audio_lengths)
-    else:
-        audio_signal, audio_lengths = None, None
-    tokens = torch.stack(tokens)
-    tokens_lengths = torch.stack(tokens_lengths)
+    signals, audio_lengths, tokens, tokens_lengths = zip(*batch)
+
+    tokens_lengths = _stack(tokens_lengths, pin_memory)
+    token_lens = tokens_lengths.tolist()
+    tokens = _pad_batch(tokens, token_lens, max(token_lens), 0, pin_memory)
+
+    if audio_lengths[0] is None:
+        return None, None, tokens, tokens_lengths
+
+    audio_lengths = _stack(audio_lengths, pin_memory)
+    audio_lens = audio_lengths.tolist()
+    fixed_length = int(min(fixed_length, max(audio_lens)))
+
+    audio_signal = []
+    for sig, sig_len in zip(signals, audio_lens):
+        chunck_len = sig_len - fixed_length
+        if chunck_len < 0:
+            # Repeat short signals and fill the remainder with their last samples
+            repeat, rem = divmod(fixed_length, sig_len)
+            signal = torch.cat(repeat * [sig[:sig_len]] + [sig[sig_len - rem : sig_len]])
+        else:
+            start_idx = torch.randint(0, chunck_len, (1,)).item() if chunck_len else 0
+            signal = sig[start_idx : start_idx + fixed_length]
+        audio_signal.append(signal)
 
-    return audio_signal, audio_lengths, tokens, tokens_lengths
+    out = _new_batch_tensor((len(batch), fixed_length), audio_signal[0].dtype, pin_memory)
+    torch.stack(audio_signal, out=out)
+
+    return out, audio_lengths, tokens, tokens_lengths
 
 
-def audio_seq_collate_fn(batch):
+def feature_seq_collate_fn(batch, token_pad_value=0, pad_to=0, pad_value=0.0, pin_memory=False):
+    """collate batch of features, features len, tokens, tokens len
+
+    Args:
+        batch (FloatTensor, LongTensor, LongTensor, LongTensor): A tuple of
+            tuples of (features, frames) spectrograms, their lengths,
+            encoded tokens, and encoded tokens length.
+        token_pad_value (int): value to pad tokens with.
+        pad_to (int): pad the time dimension of the features to a multiple
+            of pad_to, as FilterbankFeatures does. Disabled if not positive.
+        pad_value (float): value to pad features with.
+        pin_memory (bool): whether to allocate the returned tensors in
+            pinned memory. Only takes effect if CUDA is available.
+
+    """
+    features, features_lengths, tokens, tokens_lengths = zip(*batch)
+
+    tokens_lengths = _stack(tokens_lengths, pin_memory)
+    token_lens = tokens_lengths.tolist()
+    tokens = _pad_batch(tokens, token_lens, max(token_lens), token_pad_value, pin_memory)
+
+    features_lengths = _stack(features_lengths, pin_memory)
+    max_len = max(features_lengths.tolist())
+    if isinstance(pad_to, int) and pad_to > 0 and max_len % pad_to:
+        max_len += pad_to - max_len % pad_to
+
+    out = _new_batch_tensor((len(batch), features[0].size(0), max_len), features[0].dtype, pin_memory)
+    out.fill_(pad_value)
+    for i, f in enumerate(features):
+        out[i, :, : f.size(1)] = f
+
+    return out, features_lengths, tokens, tokens_lengths
+
+
+def audio_seq_collate_fn(batch, pin_memory=False):
     """
     Collate a batch (iterable of (sample tensor, label tensor) tuples) into
     properly shaped data tensors
     :param batch:
-    :return: inputs (batch_size, num_features, seq_length), targets,
-    input_lengths, target_sizes
+    :param pin_memory: whether to allocate the returned tensors in pinned
+    memory. Only takes effect if CUDA is available.
+    :return: inputs (batch_size, seq_length), targets, input_lengths,
+    target_sizes, metadata
     """
     # sort batch by descending sequence length (for packed sequences later)
-    batch.sort(key=lambda x: x[0].size(0), reverse=True)
-
-    # init tensors we need to return
-    inputs = []
-    input_lengths = []
-    target_sizes = []
-    targets = []
-    metadata = []
-
-    # iterate over minibatch to fill in tensors appropriately
-    for i, sample in enumerate(batch):
-        input_lengths.append(sample[0].size(0))
-        inputs.append(sample[0])
-        target_sizes.append(len(sample[1]))
-        targets.extend(sample[1])
-        metadata.append(sample[2])
-    targets = torch.tensor(targets, dtype=torch.long)
-    inputs = torch.stack(inputs)
-    input_lengths = torch.stack(input_lengths)
-    target_sizes = torch.stack(target_sizes)
+    batch = sorted(batch, key=lambda x: x[0].size(0), reverse=True)
+
+    input_lens = [sample[0].size(0) for sample in batch]
+    target_lens = [len(sample[1]) for sample in batch]
+    metadata = [sample[2] for sample in batch]
+
+    inputs = _pad_batch([sample[0] for sample in batch], input_lens, input_lens[0], 0, pin_memory)
+    targets = _new_batch_tensor((sum(target_lens),), torch.long, pin_memory)
+    if len(targets) > 0:
+        torch.cat([torch.as_tensor(sample[1], dtype=torch.long) for sample in batch], out=targets)
+    input_lengths = torch.tensor(input_lens, dtype=torch.long)
+    target_sizes = torch.tensor(target_lens, dtype=torch.long)
+    if pin_memory and torch.cuda.is_available():
+        input_lengths, target_sizes = input_lengths.pin_memory(), target_sizes.pin_memory()
 
     return inputs, targets, input_lengths, target_sizes, metadata
 
@@ -165,6 +208,18 @@ class AudioDataset(Dataset):
         eos_id: Id of end of sequence symbol to append if not None
         load_audio: Boolean flag indicate whether do or not load audio
         add_misc: True if add adiditional info dict.
+        manifest_index: Optional path to a manifest index built with
+            `manifest_index.build_manifest_index` from the same manifests. If
+            set, manifests are not parsed and the memory-mapped index is used
+            instead.
+        feature_cache: Optional `feature_cache.FeatureCache` built from the
+            same manifests. If set, cached (features, frames) spectrograms
+            and their lengths are returned instead of audio signals.
+        audio_cache_max_bytes: If > 0, decoded audio of up to this many bytes
+            is kept in a `audio_cache.SharedAudioCache` shared by all
+            DataLoader workers. Augmentation is applied on top of the cached
+            samples. Every dataset, e.g. on every distributed rank, has a
+            cache of its own.
     """
 
     def __init__(
@@ -184,16 +239,29 @@ class AudioDataset(Dataset):
         load_audio=True,
         parser='en',
         add_misc=False,
+        manifest_index=None,
+        feature_cache=None,
+        audio_cache_max_bytes=0,
     ):
-        self.collection = collections.ASRAudioText(
-            manifests_files=manifest_filepath.split(','),
-            parser=parsers.make_parser(
-                labels=labels, name=parser, unk_id=unk_index, blank_id=blank_index, do_normalize=normalize,
-            ),
-            min_duration=min_duration,
-            max_duration=max_duration,
-            max_number=max_utts,
+        parser = parsers.make_parser(
+            labels=labels, name=parser, unk_id=unk_index, blank_id=blank_index, do_normalize=normalize,
         )
+        if manifest_index is not None:
+            self.collection = collections.IndexedASRAudioText(
+                index_dir=manifest_index,
+                parser=parser,
+                min_duration=min_duration,
+                max_duration=max_duration,
+                max_number=max_utts,
+            )
+        else:
+            self.collection = collections.ASRAudioText(
+                manifests_files=manifest_filepath.split(','),
+                parser=parser,
+                min_duration=min_duration,
+                max_duration=max_duration,
+                max_number=max_utts,
+            )
 
         self.featurizer = featurizer
         self.trim = trim
@@ -201,17 +269,29 @@ class AudioDataset(Dataset):
         self.bos_id = bos_id
         self.load_audio = load_audio
         self._add_misc = add_misc
+        self.feature_cache = feature_cache
+        self.audio_cache = None
+        if audio_cache_max_bytes > 0 and load_audio and feature_cache is None:
+            self.audio_cache = SharedAudioCache(len(self.collection), audio_cache_max_bytes)
 
     def __getitem__(self, index):
         sample = self.collection[index]
-        if self.load_audio:
+        if self.feature_cache is not None:
+            features = torch.from_numpy(self.feature_cache.features(sample.id).astype(np.float32))
+            f, fl = features, torch.tensor(features.shape[1]).long()
+        elif self.load_audio:
             offset = sample.offset
 
             if offset is None:
                 offset = 0
 
             features = self.featurizer.process(
-                sample.audio_file, offset=offset, duration=sample.duration, trim=self.trim,
+                sample.audio_file,
+                offset=offset,
+                duration=sample.duration,
+                trim=self.trim,
+                cache=self.audio_cache,
+                cache_key=index,
             )
             f, fl = features, torch.tensor(features.shape[0]).long()
         else:
@@ -240,12 +320,111 @@ class AudioDataset(Dataset):
         return len(self.collection)
 
 
+class TarredAudioDataset(Dataset):
+    """
+    Map-style dataset over audio stored in uncompressed tarballs, as created
+    by `scripts/convert_to_tarred_audio_dataset.py`. Members are located with
+    the per-shard offset index (see `tar_index`) and read with a single
+    `os.pread` each, so samples can be accessed in any order while keeping
+    the small number of files of a tarred dataset.
+
+    Only samples that are present both in the tarballs and in the (filtered)
+    manifest are part of the dataset, so its length is exact.
+
+    Args:
+        audio_tar_filepaths: List of paths to the tarballs.
+        collection: `collections.ASRAudioText` created with
+            `index_by_file_id=True` from the tarred dataset manifest.
+        featurizer: Initialized featurizer class that converts audio bytes to
+            feature tensors
+        trim: whether to trim silence from the audio
+        bos_id: Id of beginning of sequence symbol to append if not None
+        eos_id: Id of end of sequence symbol to append if not None
+    """
+
+    def __init__(
+        self, audio_tar_filepaths, collection, featurizer, trim=False, bos_id=None, eos_id=None,
+    ):
+        self.audio_tar_filepaths = list(audio_tar_filepaths)
+        self.collection = collection
+        self.featurizer = featurizer
+        self.trim = trim
+        self.bos_id = bos_id
+        self.eos_id = eos_id
+
+        shards, offsets, sizes, manifest_idxs = [], [], [], []
+        for shard, tar_path in enumerate(self.audio_tar_filepaths):
+            for name, (offset, size) in sorted(tar_index.load_tar_index(tar_path).items(), key=lambda x: x[1]):
+                file_id, _ = os.path.splitext(os.path.basename(name))
+                if file_id in collection.mapping:
+                    shards.append(shard)
+                    offsets.append(offset)
+                    sizes.append(size)
+                    manifest_idxs.append(collection.mapping[file_id])
+
+        self._shards = np.array(shards, dtype=np.int32)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._sizes = np.array(sizes, dtype=np.int64)
+        self._manifest_idxs = np.array(manifest_idxs, dtype=np.int64)
+        self._fds = {}
+
+    def __getstate__(self):
+        # File descriptors are opened separately by every DataLoader worker
+        state = self.__dict__.copy()
+        state['_fds'] = {}
+        return state
+
+    def __del__(self):
+        for fd in getattr(self, '_fds', {}).values():
+            os.close(fd)
+
+    def _read(self, index):
+        shard = int(self._shards[index])
+        if shard not in self._fds:
+            self._fds[shard] = os.open(self.audio_tar_filepaths[shard], os.O_RDONLY)
+        return os.pread(self._fds[shard], int(self._sizes[index]), int(self._offsets[index]))
+
+    @property
+    def durations(self):
+        """Durations of the samples in dataset order, e.g. for duration bucketing."""
+        return [self.collection[i].duration for i in self._manifest_idxs]
+
+    def __getitem__(self, index):
+        sample = self.collection[int(self._manifest_idxs[index])]
+
+        offset = sample.offset
+        if offset is None:
+            offset = 0
+
+        audio_filestream = io.BytesIO(self._read(index))
+        features = self.featurizer.process(audio_filestream, offset=offset, duration=sample.duration, trim=self.trim,)
+        audio_filestream.close()
+        f, fl = features, torch.tensor(features.shape[0]).long()
+
+        t, tl = sample.text_tokens, len(sample.text_tokens)
+        if self.bos_id is not None:
+            t = [self.bos_id] + t
+            tl += 1
+        if self.eos_id is not None:
+            t = t + [self.eos_id]
+            tl += 1
+
+        return f, fl, torch.tensor(t).long(), torch.tensor(tl).long()
+
+    def __len__(self):
+        return len(self._manifest_idxs)
+
+
 class KaldiFeatureDataset(Dataset):
     """
     Dataset that provides basic Kaldi-compatible dataset loading. Assumes that
     the files `feats.scp`, `text`, and (optionally) `utt2dur` exist, as well
     as the .ark files that `feats.scp` points to.
 
+    Only the location of every matrix is read from `feats.scp` up front.
+    Matrices are read from their .ark file on demand in `__getitem__`, and
+    optionally kept in a per-worker LRU cache.
+
     Args:
         kaldi_dir: Path to directory containing the aforementioned files.
         labels: All possible characters to map to.
@@ -258,6 +437,8 @@ class KaldiFeatureDataset(Dataset):
         blank_index: blank character index, default = -1
         normalize: whether to normalize transcript text. Defaults to True.
         eos_id: Id of end of sequence symbol to append if not None.
+        cache_max_bytes: Maximum number of bytes of cached feature matrices
+            per worker. Defaults to 0, no cache.
     """
 
     def __init__(
@@ -271,19 +452,26 @@ class KaldiFeatureDataset(Dataset):
         blank_index=-1,
         normalize=True,
         eos_id=None,
+        cache_max_bytes=0,
     ):
         self.eos_id = eos_id
         self.unk_index = unk_index
         self.blank_index = blank_index
         self.labels_map = {label: i for i, label in enumerate(labels)}
+        self._cache = _AudioCache(cache_max_bytes) if cache_max_bytes > 0 else None
+        self._files = {}
 
         data = []
         duration = 0.0
         filtered_duration = 0.0
 
-        # Read Kaldi features (MFCC, PLP) using feats.scp
+        # Locate Kaldi features (MFCC, PLP) using feats.scp
         feats_path = os.path.join(kaldi_dir, 'feats.scp')
-        id2feats = {utt_id: torch.from_numpy(feats) for utt_id, feats in kaldi_io.read_mat_scp(feats_path)}
+        id2feats = {}
+        with open(feats_path, 'r') as f:
+            for line in f:
+                utt_id, rxfile = line.strip().split(None, 1)
+                id2feats[utt_id] = self._parse_rxfile(rxfile)
 
         # Get durations, if utt2dur exists
         utt2dur_path = os.path.join(kaldi_dir, 'utt2dur')
@@ -311,9 +499,9 @@ class KaldiFeatureDataset(Dataset):
                 split_idx = line.find(' ')
                 utt_id = line[:split_idx]
 
-                audio_features = id2feats.get(utt_id)
+                audio_location = id2feats.get(utt_id)
 
-                if audio_features is not None:
+                if audio_location is not None:
 
                     text = line[split_idx:].strip()
                     if normalize:
@@ -334,12 +522,13 @@ class KaldiFeatureDataset(Dataset):
                         'utt_id': utt_id,
                         'text': text,
                         'tokens': parser(text),
-                        'audio': audio_features.t(),
+                        'audio': audio_location,
                         'duration': dur,
                     }
 
                     data.append(sample)
-                    duration += dur
+                    if dur is not None:
+                        duration += dur
 
                     if max_utts > 0 and len(data) >= max_utts:
                         logging.warning(f"Stop parsing due to max_utts ({max_utts})")
@@ -354,9 +543,41 @@ class KaldiFeatureDataset(Dataset):
 
         self.data = data
 
+    @staticmethod
+    def _parse_rxfile(rxfile):
+        """Splits an extended filename of feats.scp into (ark path, byte offset).
+        The offset is None for other rxfiles, e.g. pipes, which are read by kaldi_io as they are.
+        """
+        match = re.match(r'^(.*):([0-9]+)$', rxfile)
+        if match is None or match.group(1).endswith('|'):
+            return rxfile, None
+        return match.group(1), int(match.group(2))
+
+    def _read_mat(self, location):
+        path, offset = location
+        if offset is None:
+            return kaldi_io.read_mat(path)
+        # Keep one open handle per ark file in every worker, instead of opening it for every utterance
+        fd = self._files.get(path)
+        if fd is None:
+            fd = self._files[path] = open(path, 'rb')
+        fd.seek(offset)
+        return kaldi_io.read_mat(fd)
+
+    def _load_features(self, location):
+        if self._cache is None:
+            return self._read_mat(location)
+        return self._cache.get(location, lambda: {'feats': self._read_mat(location)})['feats']
+
+    def __getstate__(self):
+        # Open files are not shared with DataLoader workers
+        state = self.__dict__.copy()
+        state['_files'] = {}
+        return state
+
     def __getitem__(self, index):
         sample = self.data[index]
-        f = sample['audio']
+        f = torch.from_numpy(self._load_features(sample['audio'])).t()
         fl = torch.tensor(f.shape[1]).long()
         t, tl = sample['tokens'], len(sample['tokens'])
 
@@ -425,6 +646,11 @@ class AudioLabelDataset(Dataset):
             in dataset
         trim: Boolean flag whether to trim the audio
         load_audio: Boolean flag indicate whether do or not load audio
+        audio_cache_max_bytes: If > 0, decoded audio of up to this many bytes
+            is kept in a `audio_cache.SharedAudioCache` shared by all
+            DataLoader workers. Augmentation is applied on top of the cached
+            samples. Every dataset, e.g. on every distributed rank, has a
+            cache of its own.
     """
 
     def __init__(
@@ -436,6 +662,7 @@ class AudioLabelDataset(Dataset):
         min_duration=None,
         trim=False,
         load_audio=True,
+        audio_cache_max_bytes=0,
     ):
         self.collection = collections.ASRSpeechLabel(
             manifests_files=manifest_filepath.split(','), min_duration=min_duration, max_duration=max_duration,
@@ -444,6 +671,9 @@ class AudioLabelDataset(Dataset):
         self.featurizer = featurizer
         self.trim = trim
         self.load_audio = load_audio
+        self.audio_cache = None
+        if audio_cache_max_bytes > 0 and load_audio:
+            self.audio_cache = SharedAudioCache(len(self.collection), audio_cache_max_bytes)
 
         self.labels = labels if labels else self.collection.uniq_labels
         self.num_commands = len(self.labels)
@@ -465,7 +695,12 @@ class AudioLabelDataset(Dataset):
                 offset = 0
 
             features = self.featurizer.process(
-                sample.audio_file, offset=offset, duration=sample.duration, trim=self.trim
+                sample.audio_file,
+                offset=offset,
+                duration=sample.duration,
+                trim=self.trim,
+                cache=self.audio_cache,
+                cache_key=index,
             )
             f, fl = features, torch.tensor(features.shape[0]).long()
         else:
@@ -0,0 +1,366 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""On-disk cache of log-mel features.
+
+Without augmentation, every epoch decodes the same audio and computes the same spectrograms again.
+`build_feature_cache` runs the featurizer pipeline of `AudioToMelSpectrogramPreprocessor` once over all entries of
+the manifests and stores the unpadded features as float16 into memory-mapped shards. `FeatureCache` gives access to
+the features of an entry by its manifest id.
+
+The cache directory is named after a hash of the preprocessor config, the audio loading settings and the contents
+of the manifests, so any change to them makes the data layer look for (and build) a new cache instead of reading
+stale features.
+
+Cache directory layout::
+
+    meta.json           # format version, key, canonical config, number of entries and features, dtypes
+    shard_{k}.bin       # float16 blobs of (features, frames) arrays
+    entry_shards.bin    # int32[N], shard of entry
+    entry_offsets.bin   # int64[N], offset of entry inside of its shard, in elements
+    entry_frames.bin    # int64[N], number of frames of entry
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import torch
+
+from nemo.collections.asr.parts import manifest
+from nemo.collections.asr.parts.features import FilterbankFeatures, WaveformFeaturizer
+from nemo.utils import logging
+
+__all__ = ['feature_cache_key', 'build_feature_cache', 'open_feature_cache', 'FeatureCache']
+
+CACHE_VERSION = 1
+META_FILE = 'meta.json'
+DEFAULT_SHARD_SIZE = 2 ** 30
+
+_DTYPES = {
+    'entry_shards': 'int32',
+    'entry_offsets': 'int64',
+    'entry_frames': 'int64',
+}
+
+
+def _canonical_config(preprocessor_config: Dict[str, Any], sample_rate: int) -> Dict[str, Any]:
+    """Fills in defaults of AudioToMelSpectrogramPreprocessor, so that equivalent configs hash the same."""
+    # Imported here, as audio_preprocessing imports the parts package itself
+    from nemo.collections.asr.audio_preprocessing import AudioToMelSpectrogramPreprocessor
+
+    params = inspect.signature(AudioToMelSpectrogramPreprocessor.__init__).parameters
+    config = {name: p.default for name, p in params.items() if name != 'self'}
+
+    unknown = set(preprocessor_config) - set(config)
+    if unknown:
+        raise ValueError(f"Unknown AudioToMelSpectrogramPreprocessor parameters: {sorted(unknown)}.")
+    config.update(preprocessor_config)
+
+    if config['sample_rate'] != sample_rate:
+        raise ValueError(
+            f"Preprocessor sample_rate {config['sample_rate']} does not match the data sample_rate {sample_rate}."
+        )
+    if config['window_size'] and config['n_window_size']:
+        raise ValueError("Only one of window_size and n_window_size should be specified.")
+    if config['window_stride'] and config['n_window_stride']:
+        raise ValueError("Only one of window_stride and n_window_stride should be specified.")
+    if config['window_size']:
+        config['n_window_size'] = int(config['window_size'] * sample_rate)
+    if config['window_stride']:
+        config['n_window_stride'] = int(config['window_stride'] * sample_rate)
+    config['window_size'], config['window_stride'] = None, None
+
+    return config
+
+
+def _filterbank_features(config: Dict[str, Any]) -> FilterbankFeatures:
+    return FilterbankFeatures(
+        sample_rate=config['sample_rate'],
+        n_window_size=config['n_window_size'],
+        n_window_stride=config['n_window_stride'],
+        window=config['window'],
+        normalize=config['normalize'],
+        n_fft=config['n_fft'],
+        preemph=config['preemph'],
+        nfilt=config['features'],
+        lowfreq=config['lowfreq'],
+        highfreq=config['highfreq'],
+        log=config['log'],
+        log_zero_guard_type=config['log_zero_guard_type'],
+        log_zero_guard_value=config['log_zero_guard_value'],
+        dither=config['dither'],
+        pad_to=config['pad_to'],
+        frame_splicing=config['frame_splicing'],
+        stft_conv=config['stft_conv'],
+        pad_value=config['pad_value'],
+        mag_power=config['mag_power'],
+    )
+
+
+def feature_cache_key(
+    manifests_files: Union[str, List[str]],
+    preprocessor_config: Dict[str, Any],
+    sample_rate: int = 16000,
+    int_values: bool = False,
+    trim: bool = False,
+    resample_type: str = 'kaiser_best',
+) -> str:
+    """Hashes everything that affects the cached features.
+
+    Args:
+        manifests_files: Either single string file or list of such - manifests to cache the features of.
+        preprocessor_config: `init_params` of AudioToMelSpectrogramPreprocessor, missing ones take the defaults.
+        sample_rate: Sample rate audio is loaded with.
+        int_values: Whether audio is loaded as int values.
+        trim: Whether silence is trimmed from the audio.
+        resample_type: Resampler of audio at other sample rates, see `resample.resample`.
+
+    Returns:
+        Hex digest used as name of the cache directory.
+    """
+    if isinstance(manifests_files, str):
+        manifests_files = manifests_files.split(',')
+
+    h = hashlib.sha1()
+    settings = dict(
+        version=CACHE_VERSION,
+        config=_canonical_config(preprocessor_config, sample_rate),
+        int_values=int_values,
+        trim=trim,
+        resample_type=resample_type,
+    )
+    h.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for manifest_file in manifests_files:
+        with open(os.path.expanduser(manifest_file), 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class _ShardWriter:
+    """Appends float16 arrays to shards of bounded size."""
+
+    def __init__(self, cache_dir: str, shard_size: int):
+        self._cache_dir = cache_dir
+        self._shard_size = shard_size
+        self._shard = -1
+        self._f = None
+        self._offset = 0
+
+    def append(self, features: np.ndarray):
+        features = np.ascontiguousarray(features, dtype=np.float16)
+        if self._f is None or (self._offset > 0 and (self._offset + features.size) * 2 > self._shard_size):
+            self.close()
+            self._shard += 1
+            self._f = open(os.path.join(self._cache_dir, f'shard_{self._shard}.bin'), 'wb')
+            self._offset = 0
+
+        position = (self._shard, self._offset)
+        features.tofile(self._f)
+        self._offset += features.size
+        return position
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    @property
+    def num_shards(self):
+        return self._shard + 1
+
+
+def build_feature_cache(
+    manifests_files: Union[str, List[str]],
+    cache_root: str,
+    preprocessor_config: Dict[str, Any],
+    sample_rate: int = 16000,
+    int_values: bool = False,
+    trim: bool = False,
+    resample_type: str = 'kaiser_best',
+    batch_size: int = 32,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    device: str = 'cpu',
+) -> 'FeatureCache':
+    """Computes features of all manifest entries and writes them into `cache_root/<key>`.
+
+    Features are computed in batches of consecutive entries exactly like AudioToMelSpectrogramPreprocessor does at
+    training time, and are stored without padding. Note that if the config has dither enabled, the dither noise is
+    drawn once and becomes a part of the cached features.
+
+    Args:
+        manifests_files: Either single string file or list of such - manifests to cache the features of.
+        cache_root: Directory to create the cache directory in.
+        preprocessor_config: `init_params` of AudioToMelSpectrogramPreprocessor, missing ones take the defaults.
+        sample_rate: Sample rate to load audio with.
+        int_values: Whether to load audio as int values.
+        trim: Whether to trim silence from the audio.
+        resample_type: Resampler of audio at other sample rates, see `resample.resample`.
+        batch_size: Number of utterances to featurize at once.
+        shard_size: Maximum size of a single shard file in bytes.
+        device: Device to compute the features on.
+
+    Returns:
+        Opened `FeatureCache`.
+    """
+    if isinstance(manifests_files, str):
+        manifests_files = manifests_files.split(',')
+
+    key = feature_cache_key(manifests_files, preprocessor_config, sample_rate, int_values, trim, resample_type)
+    config = _canonical_config(preprocessor_config, sample_rate)
+    cache_dir = os.path.join(cache_root, key)
+
+    os.makedirs(cache_root, exist_ok=True)
+    # Write into a temporary directory first, so that an interrupted build is never mistaken for a valid cache
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{key}.', dir=cache_root)
+
+    featurizer = WaveformFeaturizer(sample_rate=sample_rate, int_values=int_values, resample_type=resample_type)
+    filterbank = _filterbank_features(config).to(device)
+    filterbank.eval()
+    writer = _ShardWriter(tmp_dir, shard_size)
+    shards, offsets, frames = [], [], []
+
+    def flush(signals):
+        lengths = torch.tensor([len(s) for s in signals], dtype=torch.long)
+        audio = torch.zeros(len(signals), int(lengths.max()))
+        for i, s in enumerate(signals):
+            audio[i, : len(s)] = s
+        with torch.no_grad():
+            features = filterbank(audio.to(device), lengths.to(device)).cpu().numpy()
+        for i, num_frames in enumerate(filterbank.get_seq_len(lengths.float()).tolist()):
+            shard, offset = writer.append(features[i, :, :num_frames])
+            shards.append(shard)
+            offsets.append(offset)
+            frames.append(num_frames)
+        signals.clear()
+
+    signals = []
+    for item in manifest.item_iter(manifests_files):
+        if item['id'] != len(frames) + len(signals):
+            raise ValueError("Manifest ids are expected to be consecutive.")
+        offset = item['offset'] if item['offset'] is not None else 0
+        signals.append(featurizer.process(item['audio_file'], offset=offset, duration=item['duration'], trim=trim))
+        if len(signals) == batch_size:
+            flush(signals)
+    if signals:
+        flush(signals)
+    writer.close()
+
+    for name, values in (('entry_shards', shards), ('entry_offsets', offsets), ('entry_frames', frames)):
+        np.asarray(values, dtype=_DTYPES[name]).tofile(os.path.join(tmp_dir, name + '.bin'))
+
+    meta = dict(
+        version=CACHE_VERSION,
+        key=key,
+        config=config,
+        int_values=int_values,
+        trim=trim,
+        resample_type=resample_type,
+        manifests=[os.path.abspath(os.path.expanduser(m)) for m in manifests_files],
+        num_entries=len(frames),
+        num_features=config['features'] * config['frame_splicing'],
+        num_shards=writer.num_shards,
+        dtypes=_DTYPES,
+    )
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+
+    logging.info("Cached features of %d entries in %s", len(frames), cache_dir)
+
+    return FeatureCache(cache_dir)
+
+
+def open_feature_cache(
+    manifests_files: Union[str, List[str]],
+    cache_root: str,
+    preprocessor_config: Dict[str, Any],
+    sample_rate: int = 16000,
+    int_values: bool = False,
+    trim: bool = False,
+    resample_type: str = 'kaiser_best',
+) -> Optional['FeatureCache']:
+    """Opens the cache matching the manifests and configs, returns None if it has not been built yet."""
+    key = feature_cache_key(manifests_files, preprocessor_config, sample_rate, int_values, trim, resample_type)
+    cache_dir = os.path.join(cache_root, key)
+    if not os.path.exists(os.path.join(cache_dir, META_FILE)):
+        return None
+    return FeatureCache(cache_dir)
+
+
+class FeatureCache:
+    """Read-only access to features written by `build_feature_cache`.
+
+    Shards are memory-mapped, so the object is cheap to pickle into DataLoader workers.
+    """
+
+    def __init__(self, cache_dir: str):
+        """Opens the cache.
+
+        Args:
+            cache_dir: Cache directory, i.e. `cache_root/<key>`.
+
+        Raises:
+            ValueError: If the cache is missing or of a different version.
+        """
+        meta_path = os.path.join(cache_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise ValueError(f"{cache_dir} does not contain a feature cache, build it with `build_feature_cache`.")
+
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+
+        if self.meta['version'] != CACHE_VERSION:
+            raise ValueError(
+                f"Feature cache in {cache_dir} has version {self.meta['version']}, expected {CACHE_VERSION}. "
+                f"Rebuild the cache."
+            )
+
+        self.cache_dir = cache_dir
+        for name, dtype in self.meta['dtypes'].items():
+            setattr(self, '_' + name, np.fromfile(os.path.join(cache_dir, name + '.bin'), dtype=dtype))
+        self._shards = [None] * self.meta['num_shards']
+
+    def _shard(self, shard: int) -> np.ndarray:
+        # Opened lazily, so that every DataLoader worker maps the shards itself
+        if self._shards[shard] is None:
+            self._shards[shard] = np.memmap(
+                os.path.join(self.cache_dir, f'shard_{shard}.bin'), dtype=np.float16, mode='r'
+            )
+        return self._shards[shard]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = [None] * len(self._shards)
+        return state
+
+    def __len__(self):
+        return self.meta['num_entries']
+
+    @property
+    def num_features(self) -> int:
+        return self.meta['num_features']
+
+    @property
+    def pad_to(self) -> int:
+        return self.meta['config']['pad_to']
+
+    @property
+    def pad_value(self) -> float:
+        return self.meta['config']['pad_value']
+
+    def num_frames(self, entry_id: int) -> int:
+        return int(self._entry_frames[entry_id])
+
+    def features(self, entry_id: int) -> np.ndarray:
+        """Returns float16 (features, frames) array of the manifest entry with id `entry_id`."""
+        num_frames = int(self._entry_frames[entry_id])
+        offset = int(self._entry_offsets[entry_id])
+        shard = self._shard(int(self._entry_shards[entry_id]))
+        return shard[offset : offset + self.num_features * num_frames].reshape(self.num_features, num_frames)
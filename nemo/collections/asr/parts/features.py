@@ -14,22 +14,90 @@ from nemo.collections.asr.parts.segment import AudioSegment
 CONSTANT = 1e-5
 
 
-def normalize_batch(x, seq_len, normalize_type):
+def _masked_mean_std(x, seq_len, dims):
+    """Mean and unbiased std of `x` (B, D, T) over `dims`, using only the first `seq_len` frames of every
+    utterance, computed for the whole batch at once.
+    """
+    mask = (torch.arange(x.shape[2], device=x.device)[None, :] < seq_len[:, None]).to(x.dtype)
+    count = seq_len.to(x.dtype)
+    # Masked sums over time as a batched matrix-vector product, without a masked copy of x
+    x_sum = torch.bmm(x, mask.unsqueeze(2)).squeeze(2)
+    if dims == (1, 2):
+        count = count * x.shape[1]
+        x_sum = x_sum.sum(dim=1)
+    else:
+        count = count.unsqueeze(1)
+
+    x_mean = x_sum / count
+    x_centered = x - x_mean.view(*x_mean.shape, *([1] * len(dims)))
+    x_centered.mul_(mask.unsqueeze(1))
+    x_std = x_centered.pow(2).sum(dim=dims).sqrt() / torch.sqrt(count - 1)
+    return x_mean, x_std
+
+
+class RunningFeatureStats(object):
+    """Running per-utterance statistics for normalizing features of streams that arrive in chunks.
+
+    Every call of `normalize` adds the valid frames of a chunk to the statistics of its stream, and normalizes the
+    chunk with the mean and std of all frames of the stream seen so far. For the last chunk of a stream these are
+    the statistics `normalize_batch` computes offline over the whole utterance.
+
+    Args:
+        normalize_type: "per_feature" or "all_features".
+    """
+
+    def __init__(self, normalize_type):
+        if normalize_type not in ("per_feature", "all_features"):
+            raise ValueError(f"Running statistics are not supported for normalize={normalize_type}.")
+        self.normalize_type = normalize_type
+        self.reset()
+
+    def reset(self):
+        self.count = self.sum = self.sum_squares = None
+
+    def normalize(self, x, seq_len):
+        if self.normalize_type == "per_feature":
+            dims, shape, count = (2,), (-1, x.shape[1], 1), seq_len.double().view(-1, 1)
+        else:
+            dims, shape, count = (1, 2), (-1, 1, 1), seq_len.double() * x.shape[1]
+        mask = (torch.arange(x.shape[2], device=x.device)[None, :] < seq_len[:, None]).unsqueeze(1)
+        x_valid = (x * mask).double()
+        chunk_sum, chunk_sum_squares = x_valid.sum(dim=dims), (x_valid * x_valid).sum(dim=dims)
+
+        if self.count is None:
+            self.count, self.sum, self.sum_squares = count, chunk_sum, chunk_sum_squares
+        else:
+            self.count, self.sum, self.sum_squares = (
+                self.count + count,
+                self.sum + chunk_sum,
+                self.sum_squares + chunk_sum_squares,
+            )
+
+        x_mean = self.sum / self.count
+        x_var = (self.sum_squares - self.sum * x_mean) / (self.count - 1)
+        x_std = torch.sqrt(x_var.clamp(min=0)) + CONSTANT
+        return (x - x_mean.view(shape).to(x.dtype)) / x_std.view(shape).to(x.dtype)
+
+
+def normalize_batch(x, seq_len, normalize_type, running_stats=None):
+    """Normalizes features `x` (B, D, T) with statistics over the first `seq_len` frames of every utterance.
+
+    Args:
+        x: Features.
+        seq_len: Number of valid frames of every utterance.
+        normalize_type: "per_feature", "all_features", or a dict with "fixed_mean" and "fixed_std".
+        running_stats: Optional RunningFeatureStats, to normalize with statistics accumulated over the chunks of
+            a stream instead.
+    """
+    if running_stats is not None:
+        return running_stats.normalize(x, seq_len)
     if normalize_type == "per_feature":
-        x_mean = torch.zeros((seq_len.shape[0], x.shape[1]), dtype=x.dtype, device=x.device)
-        x_std = torch.zeros((seq_len.shape[0], x.shape[1]), dtype=x.dtype, device=x.device)
-        for i in range(x.shape[0]):
-            x_mean[i, :] = x[i, :, : seq_len[i]].mean(dim=1)
-            x_std[i, :] = x[i, :, : seq_len[i]].std(dim=1)
+        x_mean, x_std = _masked_mean_std(x, seq_len, dims=(2,))
         # make sure x_std is not zero
         x_std += CONSTANT
         return (x - x_mean.unsqueeze(2)) / x_std.unsqueeze(2)
     elif normalize_type == "all_features":
-        x_mean = torch.zeros(seq_len.shape, dtype=x.dtype, device=x.device)
-        x_std = torch.zeros(seq_len.shape, dtype=x.dtype, device=x.device)
-        for i in range(x.shape[0]):
-            x_mean[i] = x[i, :, : seq_len[i].item()].mean()
-            x_std[i] = x[i, :, : seq_len[i].item()].std()
+        x_mean, x_std = _masked_mean_std(x, seq_len, dims=(1, 2))
         # make sure x_std is not zero
         x_std += CONSTANT
         return (x - x_mean.view(-1, 1, 1)) / x_std.view(-1, 1, 1)
@@ -55,15 +123,23 @@ def splice_frames(x, frame_splicing):
 
 
 class WaveformFeaturizer(object):
-    def __init__(self, sample_rate=16000, int_values=False, augmentor=None):
+    def __init__(self, sample_rate=16000, int_values=False, augmentor=None, resample_type='kaiser_best'):
         self.augmentor = augmentor if augmentor is not None else AudioAugmentor()
         self.sample_rate = sample_rate
         self.int_values = int_values
+        self.resample_type = resample_type
 
     def max_augmentation_length(self, length):
         return self.augmentor.max_augmentation_length(length)
 
-    def process(self, file_path, offset=0, duration=0, trim=False):
+    def process(self, file_path, offset=0, duration=0, trim=False, cache=None, cache_key=None):
+        """Loads and augments audio. With a `audio_cache.SharedAudioCache`, the decoded samples of `cache_key` are
+        read from the cache, or stored into it after decoding, and only the augmentation runs on every call.
+        """
+        samples = cache.get(cache_key) if cache is not None else None
+        if samples is not None:
+            return self.process_segment(AudioSegment(samples, self.sample_rate))
+
         audio = AudioSegment.from_file(
             file_path,
             target_sr=self.sample_rate,
@@ -71,7 +147,10 @@ class WaveformFeaturizer(object):
             offset=offset,
             duration=duration,
             trim=trim,
+            resample_type=self.resample_type,
         )
+        if cache is not None:
+            cache.put(cache_key, audio.samples)
         return self.process_segment(audio)
 
     def process_segment(self, audio_segment):
@@ -87,8 +166,9 @@ class WaveformFeaturizer(object):
 
         sample_rate = input_config.get("sample_rate", 16000)
         int_values = input_config.get("int_values", False)
+        resample_type = input_config.get("resample_type", "kaiser_best")
 
-        return cls(sample_rate=sample_rate, int_values=int_values, augmentor=aa)
+        return cls(sample_rate=sample_rate, int_values=int_values, augmentor=aa, resample_type=resample_type)
 
 
 class FeaturizerFactory(object):
@@ -183,6 +263,7 @@ class FilterbankFeatures(nn.Module):
             )
 
         self.normalize = normalize
+        self.running_stats = None
         self.log = log
         self.dither = dither
         self.frame_splicing = frame_splicing
@@ -233,12 +314,18 @@ class FilterbankFeatures(nn.Module):
     def get_seq_len(self, seq_len):
         return torch.ceil(seq_len / self.hop_length).to(dtype=torch.long)
 
+    def stream(self, enable=True):
+        """Switches normalization to running statistics, accumulated over successive calls with consecutive
+        chunks of the same batch of streams (see RunningFeatureStats). Calling it again starts new streams.
+        """
+        self.running_stats = RunningFeatureStats(self.normalize) if enable else None
+
     @property
     def filter_banks(self):
         return self.fb
 
     @torch.no_grad()
-    def forward(self, x, seq_len):
+    def forward(self, x, seq_len, normalize=True):
         seq_len = self.get_seq_len(seq_len.float())
 
         # dither
@@ -274,8 +361,8 @@ class FilterbankFeatures(nn.Module):
             x = splice_frames(x, self.frame_splicing)
 
         # normalize if required
-        if self.normalize:
-            x = normalize_batch(x, seq_len, normalize_type=self.normalize)
+        if self.normalize and normalize:
+            x = normalize_batch(x, seq_len, normalize_type=self.normalize, running_stats=self.running_stats)
 
         # mask to zero any values beyond seq_len in batch, pad to multiple of
         # `pad_to` (for efficiency)
@@ -93,6 +93,57 @@ class StatsPoolLayer(nn.Module):
         return pooled
 
 
+def make_seq_mask(lens, max_len):
+    """Padding mask (B, max_len) of sequences of lengths `lens`, True after the end of every sequence."""
+    lens = lens.to(dtype=torch.long)
+    return torch.arange(max_len, device=lens.device).expand(len(lens), max_len) >= lens.unsqueeze(1)
+
+
+def fold_batch_norm(conv, bn):
+    """Returns a Conv1d with a bias that computes `bn(conv(x))` of a Conv1d followed by a BatchNorm1d in eval mode."""
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        scale = scale * bn.weight
+        shift = shift * bn.weight + bn.bias
+    if conv.bias is not None:
+        shift = shift + conv.bias * scale
+
+    folded = nn.Conv1d(
+        conv.in_channels,
+        conv.out_channels,
+        conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True,
+    ).to(device=conv.weight.device, dtype=conv.weight.dtype)
+    with torch.no_grad():
+        folded.weight.copy_(conv.weight * scale.view(-1, 1, 1))
+        folded.bias.copy_(shift)
+    return folded
+
+
+def _fold_layers(layers):
+    # Folds batch norms into the convolutions before them and drops dropouts of a list of sub-block layers
+    folded = []
+    for layer in layers:
+        if isinstance(layer, nn.Dropout):
+            continue
+        if isinstance(layer, nn.BatchNorm1d) and folded:
+            previous = folded[-1]
+            # Convolutions with heads share weights between output channels, which batch norm scales differently
+            if isinstance(previous, MaskedConv1d) and previous.heads == -1:
+                previous.conv = fold_batch_norm(previous.conv, layer)
+                continue
+            if isinstance(previous, nn.Conv1d):
+                folded[-1] = fold_batch_norm(previous, layer)
+                continue
+        folded.append(layer)
+    return folded
+
+
 class MaskedConv1d(nn.Module):
     __constants__ = ["use_conv_mask", "real_out_channels", "heads"]
 
@@ -138,13 +189,26 @@ class MaskedConv1d(nn.Module):
             lens + 2 * self.conv.padding[0] - self.conv.dilation[0] * (self.conv.kernel_size[0] - 1) - 1
         ) / self.conv.stride[0] + 1
 
-    def forward(self, x, lens):
+    @property
+    def preserves_length(self):
+        """Whether output sequences have the lengths of the input sequences, so that they share padding masks."""
+        conv = self.conv
+        return conv.stride[0] == 1 and 2 * conv.padding[0] == conv.dilation[0] * (conv.kernel_size[0] - 1)
+
+    def forward(self, x, lens, mask: Optional[Tensor] = None, skip_mask: bool = False):
+        """
+        Args:
+            x: Input sequences (B, C, T).
+            lens: Lengths of the input sequences (B).
+            mask: Optional padding mask of x, see `make_seq_mask`. Computed from lens if None.
+            skip_mask: Whether to skip masking of inputs that are known to have no padding.
+        """
         if self.use_mask:
             lens = lens.to(dtype=torch.long)
-            max_len = x.size(2)
-            mask = torch.arange(max_len).to(lens.device).expand(len(lens), max_len) >= lens.unsqueeze(1)
-            x = x.masked_fill(mask.unsqueeze(1).to(device=x.device), 0)
-            # del mask
+            if not skip_mask:
+                if mask is None:
+                    mask = make_seq_mask(lens, x.size(2))
+                x = x.masked_fill(mask.unsqueeze(1).to(device=x.device), 0)
             lens = self.get_seq_len(lens)
 
         sh = x.shape
@@ -499,8 +563,17 @@ class JasperBlock(nn.Module):
         layers = [activation, nn.Dropout(p=drop_prob)]
         return layers
 
-    def forward(self, input_: Tuple[List[Tensor], Optional[Tensor]]):
-        # type: (Tuple[List[Tensor], Optional[Tensor]]) -> Tuple[List[Tensor], Optional[Tensor]] # nopep8
+    def fold_for_inference(self):
+        """Folds batch norms into the convolutions before them and removes dropouts, in place.
+        Only for inference, the block can't be trained anymore.
+        """
+        self.mconv = nn.ModuleList(_fold_layers(self.mconv))
+        if self.res is not None:
+            self.res = nn.ModuleList(nn.ModuleList(_fold_layers(layer)) for layer in self.res)
+        self.mout = nn.Sequential(*_fold_layers(self.mout))
+
+    def forward(self, input_: Tuple[List[Tensor], Optional[Tensor]], skip_masks: bool = False):
+        # type: (Tuple[List[Tensor], Optional[Tensor]], bool) -> Tuple[List[Tensor], Optional[Tensor]] # nopep8
         lens_orig = None
         xs = input_[0]
         if len(input_) == 2:
@@ -509,13 +582,22 @@ class JasperBlock(nn.Module):
         # compute forward convolutions
         out = xs[-1]
 
+        # padding masks of the block inputs by their length, shared by the residual convolutions
+        input_masks = {}
         lens = lens_orig
+        mask = None
         for i, l in enumerate(self.mconv):
             # if we're doing masked convolutions, we need to pass in and
             # possibly update the sequence lengths
-            # if (i % 4) == 0 and self.conv_mask:
             if isinstance(l, MaskedConv1d):
-                out, lens = l(out, lens)
+                # the mask is computed once and reused until a convolution changes the lengths
+                if l.use_mask and not skip_masks and mask is None:
+                    mask = make_seq_mask(lens, out.size(2))
+                    if lens is lens_orig:
+                        input_masks[out.size(2)] = mask
+                out, lens = l(out, lens, mask=mask, skip_mask=skip_masks)
+                if not l.preserves_length:
+                    mask = None
             else:
                 out = l(out)
 
@@ -525,7 +607,12 @@ class JasperBlock(nn.Module):
                 res_out = xs[i]
                 for j, res_layer in enumerate(layer):
                     if isinstance(res_layer, MaskedConv1d):
-                        res_out, _ = res_layer(res_out, lens_orig)
+                        res_mask = None
+                        if res_layer.use_mask and not skip_masks:
+                            if res_out.size(2) not in input_masks:
+                                input_masks[res_out.size(2)] = make_seq_mask(lens_orig, res_out.size(2))
+                            res_mask = input_masks[res_out.size(2)]
+                        res_out, _ = res_layer(res_out, lens_orig, mask=res_mask, skip_mask=skip_masks)
                     else:
                         res_out = res_layer(res_out)
 
@@ -0,0 +1,251 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Compiled, memory-mapped manifest index.
+
+Parsing a json manifest line by line and keeping every entry as a python object is slow and memory hungry for large
+corpora. `build_manifest_index` performs the parsing and tokenization once and writes flat binary arrays to a
+directory; `ManifestIndex` opens these arrays with `np.memmap`, so that opening is instant and the pages are shared
+copy-on-write between DataLoader workers.
+
+Index directory layout (all arrays are raw little-endian binaries, dtypes are kept in `meta.json`)::
+
+    meta.json            # format version, number of entries, parser fingerprint, dtypes
+    ids.bin              # int64[N], position of entry across all manifests
+    durations.bin        # float64[N]
+    offsets.bin          # float64[N], NaN if offset is not set
+    audio_files.bin      # uint8 blob with utf-8 encoded audio file paths
+    audio_files_idx.bin  # int64[N + 1], start of each path in the blob
+    texts.bin            # uint8 blob with utf-8 encoded raw transcripts
+    texts_idx.bin        # int64[N + 1]
+    speakers.bin         # uint8 blob with json encoded speakers
+    speakers_idx.bin     # int64[N + 1]
+    tokens.bin           # int32 blob with tokenized transcripts
+    tokens_idx.bin       # int64[N + 1]
+    parsed.bin           # bool[N], False if parser failed on the transcript
+"""
+import array
+import json
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from nemo.collections.asr.parts import manifest, parsers
+from nemo.utils import logging
+
+__all__ = ['build_manifest_index', 'ManifestIndex', 'parser_fingerprint']
+
+INDEX_VERSION = 1
+META_FILE = 'meta.json'
+
+_DTYPES = {
+    'ids': 'int64',
+    'durations': 'float64',
+    'offsets': 'float64',
+    'audio_files': 'uint8',
+    'audio_files_idx': 'int64',
+    'texts': 'uint8',
+    'texts_idx': 'int64',
+    'speakers': 'uint8',
+    'speakers_idx': 'int64',
+    'tokens': 'int32',
+    'tokens_idx': 'int64',
+    'parsed': 'bool',
+}
+
+
+def parser_fingerprint(parser: parsers.CharParser) -> Dict[str, Any]:
+    """Summarizes everything about a parser that affects the produced tokens."""
+    return dict(
+        type=type(parser).__name__,
+        labels=list(parser._labels),
+        unk_id=parser._unk_id,
+        blank_id=parser._blank_id,
+        do_normalize=parser._do_normalize,
+        do_lowercase=parser._do_lowercase,
+    )
+
+
+class _BlobWriter:
+    """Appends variable length records to a binary file and tracks their start positions."""
+
+    def __init__(self, path: str, typecode: str):
+        self._f = open(path, 'wb')
+        self._typecode = typecode
+        self._index = array.array('q', [0])
+
+    def append(self, values):
+        values = array.array(self._typecode, values)
+        values.tofile(self._f)
+        self._index.append(self._index[-1] + len(values))
+
+    def close(self, index_path: str):
+        self._f.close()
+        with open(index_path, 'wb') as f:
+            self._index.tofile(f)
+
+
+def build_manifest_index(
+    manifests_files: Union[str, List[str]], index_dir: str, parser: parsers.CharParser,
+) -> 'ManifestIndex':
+    """Parses and tokenizes manifests once, writing the result as flat arrays into `index_dir`.
+
+    Args:
+        manifests_files: Either single string file or list of such - manifests to index.
+        index_dir: Directory to write index to. Created if it does not exist.
+        parser: Instance of `CharParser` to convert transcripts to tokens. The index can only be opened with a parser
+            producing the same tokens.
+
+    Returns:
+        Opened `ManifestIndex`.
+    """
+    if isinstance(manifests_files, str):
+        manifests_files = manifests_files.split(',')
+
+    os.makedirs(index_dir, exist_ok=True)
+
+    def path(name):
+        return os.path.join(index_dir, name + '.bin')
+
+    # Remove a stale meta file first, so an interrupted build is never mistaken for a valid index.
+    if os.path.exists(os.path.join(index_dir, META_FILE)):
+        os.remove(os.path.join(index_dir, META_FILE))
+
+    ids, durations, offsets, parsed = array.array('q'), array.array('d'), array.array('d'), array.array('b')
+    audio_files = _BlobWriter(path('audio_files'), 'B')
+    texts = _BlobWriter(path('texts'), 'B')
+    speakers = _BlobWriter(path('speakers'), 'B')
+    tokens = _BlobWriter(path('tokens'), 'i')
+
+    for item in manifest.item_iter(manifests_files):
+        text_tokens = parser(item['text'])
+
+        ids.append(item['id'])
+        durations.append(item['duration'])
+        offsets.append(float('nan') if item['offset'] is None else item['offset'])
+        parsed.append(text_tokens is not None)
+        audio_files.append(item['audio_file'].encode('utf-8'))
+        texts.append(item['text'].encode('utf-8'))
+        speakers.append(json.dumps(item['speaker']).encode('utf-8'))
+        tokens.append(text_tokens or [])
+
+    for name, values in (('ids', ids), ('durations', durations), ('offsets', offsets), ('parsed', parsed)):
+        with open(path(name), 'wb') as f:
+            values.tofile(f)
+    audio_files.close(path('audio_files_idx'))
+    texts.close(path('texts_idx'))
+    speakers.close(path('speakers_idx'))
+    tokens.close(path('tokens_idx'))
+
+    meta = dict(
+        version=INDEX_VERSION,
+        num_entries=len(ids),
+        manifests=[os.path.abspath(os.path.expanduser(m)) for m in manifests_files],
+        parser=parser_fingerprint(parser),
+        dtypes=_DTYPES,
+    )
+    with open(os.path.join(index_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    logging.info("Built manifest index with %d entries in %s", len(ids), index_dir)
+
+    return ManifestIndex(index_dir, parser=parser)
+
+
+class ManifestIndex:
+    """Read-only view over an index built with `build_manifest_index`.
+
+    All arrays are memory-mapped, so the object is cheap to create. Only the index directory and metadata are
+    pickled, every DataLoader worker maps the arrays again, whatever the multiprocessing start method.
+    """
+
+    def __init__(self, index_dir: str, parser: Optional[parsers.CharParser] = None):
+        """Opens the index.
+
+        Args:
+            index_dir: Directory the index was written to.
+            parser: If provided, checked to tokenize the same way as the parser the index was built with.
+
+        Raises:
+            ValueError: If index is missing, of a different version or was built with a different parser.
+        """
+        meta_path = os.path.join(index_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise ValueError(f"{index_dir} does not contain a manifest index, build it with `build_manifest_index`.")
+
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(
+                f"Manifest index in {index_dir} has version {self.meta['version']}, expected {INDEX_VERSION}. "
+                f"Rebuild the index."
+            )
+
+        if parser is not None and parser_fingerprint(parser) != self.meta['parser']:
+            raise ValueError(
+                f"Manifest index in {index_dir} was built with a different parser ({self.meta['parser']}). "
+                f"Rebuild the index with the current labels and parser settings."
+            )
+
+        self.index_dir = index_dir
+        self._num_entries = self.meta['num_entries']
+        self._open_arrays()
+
+    def _open_arrays(self):
+        for name, dtype in self.meta['dtypes'].items():
+            setattr(self, '_' + name, self._open(name, dtype))
+
+    def __getstate__(self):
+        # Pickled memmaps are full in-memory copies, workers map the arrays again by their paths
+        state = self.__dict__.copy()
+        for name in self.meta['dtypes']:
+            del state['_' + name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_arrays()
+
+    def _open(self, name, dtype):
+        path = os.path.join(self.index_dir, name + '.bin')
+        # np.memmap cannot map empty files
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return self._num_entries
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self._durations
+
+    @property
+    def parsed(self) -> np.ndarray:
+        return self._parsed
+
+    @staticmethod
+    def _blob(blob, idx, i):
+        return blob[idx[i] : idx[i + 1]]
+
+    def audio_file(self, i: int) -> str:
+        return self._blob(self._audio_files, self._audio_files_idx, i).tobytes().decode('utf-8')
+
+    def text(self, i: int) -> str:
+        return self._blob(self._texts, self._texts_idx, i).tobytes().decode('utf-8')
+
+    def speaker(self, i: int) -> Any:
+        return json.loads(self._blob(self._speakers, self._speakers_idx, i).tobytes().decode('utf-8'))
+
+    def offset(self, i: int) -> Optional[float]:
+        offset = float(self._offsets[i])
+        return None if np.isnan(offset) else offset
+
+    def tokens(self, i: int) -> Optional[List[int]]:
+        if not self._parsed[i]:
+            return None
+        return self._blob(self._tokens, self._tokens_idx, i).tolist()
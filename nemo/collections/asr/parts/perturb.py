@@ -1,13 +1,15 @@
 # Taken straight from Patter https://github.com/ryanleary/patter
 # TODO: review, and copyright and fix/add comments
 import random
+from collections import OrderedDict
 
 import librosa
 import numpy as np
-from scipy import signal
+from scipy import fft, signal
 
 from nemo import logging
 from nemo.collections.asr.parts import collections, parsers
+from nemo.collections.asr.parts.resample import RESAMPLE_TYPES, resample
 from nemo.collections.asr.parts.segment import AudioSegment
 
 try:
@@ -41,6 +43,8 @@ class SpeedPerturbation(Perturbation):
                 For better speed using `resampy`'s fast resampling method, use `resample_type='kaiser_fast'`.
                 For high-quality resampling, set `resample_type='kaiser_best'`.
                 To use `scipy.signal.resample`, set `resample_type='fft'` or `resample_type='scipy'`
+                For the fastest resampling with filters cached per rate, set `resample_type='polyphase'`
+                (see `resample.polyphase_resample`). Speed rates are then rounded to multiples of 0.01.
             min_speed_rate: Minimum sampling rate modifier.
             max_speed_rate: Maximum sampling rate modifier.
             num_rates: Number of discrete rates to allow. Can be a positive or negative
@@ -61,8 +65,8 @@ class SpeedPerturbation(Perturbation):
         if min_rate < 0.0:
             raise ValueError("Minimum sampling rate modifier must be > 0.")
 
-        if resample_type not in ('kaiser_best', 'kaiser_fast', 'fft', 'scipy'):
-            raise ValueError("Supported `resample_type` values are ('kaiser_best', 'kaiser_fast', 'fft', 'scipy')")
+        if resample_type not in RESAMPLE_TYPES:
+            raise ValueError(f"Supported `resample_type` values are {RESAMPLE_TYPES}")
 
         self._sr = sr
         self._min_rate = min_speed_rate
@@ -88,7 +92,10 @@ class SpeedPerturbation(Perturbation):
             return
 
         new_sr = int(self._sr * speed_rate)
-        data._samples = librosa.core.resample(data._samples, self._sr, new_sr, res_type=self._res_type)
+        if self._res_type == 'polyphase':
+            # Rounds the rate to 1% steps, which keeps the number of cached polyphase filters small
+            new_sr = int(round(speed_rate * 100)) * self._sr // 100
+        data._samples = resample(data._samples, self._sr, new_sr, resample_type=self._res_type)
 
 
 class TimeStretchPerturbation(Perturbation):
@@ -209,17 +216,99 @@ class GainPerturbation(Perturbation):
         data._samples = data._samples * (10.0 ** (gain / 20.0))
 
 
+class _AudioCache(object):
+    """Least recently used cache of decoded audio, bounded by the number of bytes of the cached arrays.
+
+    Perturbations are copied into every DataLoader worker, so each worker fills its own cache.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def num_bytes(self):
+        return self._num_bytes
+
+    def get(self, key, load):
+        """Returns the cached value of `key`, calling `load()` to create it on a miss.
+        Values are dicts of numpy arrays, more arrays can be added to a cached value with `add`.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        value = load()
+        self._entries[key] = value
+        self._num_bytes += sum(array.nbytes for array in value.values())
+        self._evict()
+        return value
+
+    def add(self, key, name, array):
+        """Adds `array` to the cached value of `key` under `name`, if the value is still cached."""
+        if key in self._entries:
+            self._entries[key][name] = array
+            self._num_bytes += array.nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._num_bytes > self.max_bytes and self._entries:
+            _, value = self._entries.popitem(last=False)
+            self._num_bytes -= sum(array.nbytes for array in value.values())
+
+    def __getstate__(self):
+        # Don't ship cached audio to DataLoader workers
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict()
+        state['_num_bytes'] = 0
+        return state
+
+
 class ImpulsePerturbation(Perturbation):
-    def __init__(self, manifest_path=None, rng=None):
+    def __init__(self, manifest_path=None, rng=None, cache_max_bytes=256 * 2 ** 20):
+        """
+        Convolves the audio with a room impulse response (RIR) drawn from a manifest.
+
+        Normalized RIRs and their FFTs are kept in a per-worker LRU cache, so that a RIR file is read and
+        transformed once rather than for every sample. FFT sizes are rounded up to powers of two to limit
+        the number of transforms cached per RIR.
+
+        Args:
+            manifest_path: Manifest of RIR files.
+            rng: Random number generator.
+            cache_max_bytes: Maximum number of bytes of cached RIRs and RIR FFTs per worker.
+                0 disables the cache.
+        """
         self._manifest = collections.ASRAudioText(manifest_path, parser=parsers.make_parser([]))
         self._rng = random.Random() if rng is None else rng
+        self._cache = _AudioCache(cache_max_bytes)
+
+    def _load_impulse(self, audio_file, sample_rate):
+        impulse = AudioSegment.from_file(audio_file, target_sr=sample_rate)
+        impulse_norm = (impulse.samples - min(impulse.samples)) / (max(impulse.samples) - min(impulse.samples))
+        return {'samples': impulse_norm}
 
     def perturb(self, data):
         impulse_record = self._rng.sample(self._manifest.data, 1)[0]
-        impulse = AudioSegment.from_file(impulse_record.audio_file, target_sr=data.sample_rate)
+        key = (impulse_record.audio_file, data.sample_rate)
+        impulse = self._cache.get(key, lambda: self._load_impulse(*key))
+        impulse_norm = impulse['samples']
         # logging.debug("impulse: %s", impulse_record['audio_filepath'])
-        impulse_norm = (impulse.samples - min(impulse.samples)) / (max(impulse.samples) - min(impulse.samples))
-        data._samples = signal.fftconvolve(data._samples, impulse_norm, "same")
+
+        # Same as signal.fftconvolve(data._samples, impulse_norm, "same"), reusing the FFT of the RIR
+        num_samples = data._samples.shape[0]
+        n_fft = 1 << (num_samples + impulse_norm.shape[0] - 2).bit_length()
+        impulse_fft = impulse.get(n_fft)
+        if impulse_fft is None:
+            impulse_fft = fft.rfft(impulse_norm, n_fft)
+            self._cache.add(key, n_fft, impulse_fft)
+        convolved = fft.irfft(fft.rfft(data._samples, n_fft) * impulse_fft, n_fft)
+        start = (impulse_norm.shape[0] - 1) // 2
+        data._samples = convolved[start : start + num_samples]
 
 
 class ShiftPerturbation(Perturbation):
@@ -245,25 +334,71 @@ class ShiftPerturbation(Perturbation):
 
 class NoisePerturbation(Perturbation):
     def __init__(
-        self, manifest_path=None, min_snr_db=40, max_snr_db=50, max_gain_db=300.0, rng=None,
+        self,
+        manifest_path=None,
+        min_snr_db=40,
+        max_snr_db=50,
+        max_gain_db=300.0,
+        rng=None,
+        cache_max_duration=30.0,
+        cache_max_bytes=256 * 2 ** 20,
     ):
+        """
+        Adds a noise segment drawn from a manifest to the audio, at a random SNR.
+
+        Only the segment of the noise recording that is added is read from disk, seeking to an offset drawn
+        from the duration given in the manifest. Noise recordings no longer than `cache_max_duration` are
+        read whole instead and kept in a per-worker LRU cache. The noise gain is computed from the RMS of
+        the added segment.
+
+        Args:
+            manifest_path: Manifest of noise files, with their durations.
+            min_snr_db: Minimum signal to noise ratio in dB.
+            max_snr_db: Maximum signal to noise ratio in dB.
+            max_gain_db: Maximum gain applied to the noise in dB.
+            rng: Random number generator.
+            cache_max_duration: Noise recordings up to this duration in seconds are cached whole.
+            cache_max_bytes: Maximum number of bytes of cached noise per worker. 0 disables the cache.
+        """
         self._manifest = collections.ASRAudioText(manifest_path, parser=parsers.make_parser([]))
         self._rng = random.Random() if rng is None else rng
         self._min_snr_db = min_snr_db
         self._max_snr_db = max_snr_db
         self._max_gain_db = max_gain_db
+        self._cache_max_duration = cache_max_duration
+        self._cache = _AudioCache(cache_max_bytes)
+
+    def _read_noise(self, noise_record, sample_rate, duration):
+        """Reads the noise to add to `duration` seconds of audio, either a random segment or the whole
+        (cached) recording.
+        """
+        if noise_record.duration <= self._cache_max_duration and self._cache.max_bytes > 0:
+            key = (noise_record.audio_file, sample_rate)
+            noise = self._cache.get(
+                key,
+                lambda: {'samples': AudioSegment.from_file(noise_record.audio_file, target_sr=sample_rate)._samples},
+            )
+            return AudioSegment(noise['samples'], sample_rate)
+
+        start_time = self._rng.uniform(0.0, max(noise_record.duration - duration, 0.0))
+        return AudioSegment.from_file(
+            noise_record.audio_file, target_sr=sample_rate, offset=start_time, duration=duration
+        )
 
     def perturb(self, data):
         snr_db = self._rng.uniform(self._min_snr_db, self._max_snr_db)
         noise_record = self._rng.sample(self._manifest.data, 1)[0]
-        noise = AudioSegment.from_file(noise_record.audio_file, target_sr=data.sample_rate)
-        noise_gain_db = min(data.rms_db - noise.rms_db - snr_db, self._max_gain_db)
-        # logging.debug("noise: %s %s %s", snr_db, noise_gain_db, noise_record.audio_file)
+        noise = self._read_noise(noise_record, data.sample_rate, data.duration)
 
-        # calculate noise segment to use
-        start_time = self._rng.uniform(0.0, noise.duration - data.duration)
-        if noise.duration > (start_time + data.duration):
+        # calculate noise segment to use, if the whole recording was read
+        if noise.duration > data.duration:
+            start_time = self._rng.uniform(0.0, noise.duration - data.duration)
             noise.subsegment(start_time=start_time, end_time=start_time + data.duration)
+        # rounding of the segment boundaries can leave a sample too much
+        noise._samples = noise._samples[: data._samples.shape[0]]
+
+        noise_gain_db = min(data.rms_db - noise.rms_db - snr_db, self._max_gain_db)
+        # logging.debug("noise: %s %s %s", snr_db, noise_gain_db, noise_record.audio_file)
 
         # adjust gain for snr purposes and superimpose
         noise.gain_db(noise_gain_db)
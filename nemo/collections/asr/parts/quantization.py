@@ -0,0 +1,101 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Post-training int8 quantization of ASR neural modules for CPU inference.
+
+Linear layers are quantized dynamically: their weights are int8 and their inputs are quantized on the fly with the
+range of every batch. PyTorch has no dynamic quantized 1-D convolution with usable accuracy, so 1-D convolutions are
+quantized statically instead: every convolution is wrapped between a quantization and a dequantization of its input
+and output, with ranges collected by observers while calibration data runs through the module. Only dense
+convolutions (groups == 1, e.g. the pointwise convolutions of QuartzNet and the CTC decoder) are quantized, as int8
+grouped and depthwise convolutions with long kernels are slower than fp32 ones on CPU.
+
+The workflow is::
+
+    quantization.prepare_int8(encoder)
+    ...  # run calibration batches through the module, e.g. with NeuralModuleFactory.infer
+    quantization.convert_int8(encoder)
+    encoder.save_to('JasperEncoder-int8.pt')
+
+Quantized checkpoints are restored into modules that went through the same steps, without calibration::
+
+    quantization.convert_int8(quantization.prepare_int8(encoder))
+    encoder.restore_from('JasperEncoder-int8.pt')
+
+Quantized modules run on CPU only. Batch norms should be folded first, e.g. with
+`JasperEncoder.optimize_for_inference`.
+"""
+import torch
+import torch.nn as nn
+
+__all__ = ['Int8Conv1d', 'prepare_int8', 'convert_int8', 'is_int8']
+
+
+class Int8Conv1d(nn.Module):
+    """Conv1d with quantization of its input and dequantization of its output, so that it runs in int8 between
+    fp32 layers after `torch.quantization.convert`. Exposes the geometry of the convolution like nn.Conv1d, for
+    length computations such as `MaskedConv1d.get_seq_len`.
+    """
+
+    def __init__(self, conv: nn.Conv1d):
+        super().__init__()
+        self.quant = torch.quantization.QuantStub()
+        self.conv = conv
+        self.dequant = torch.quantization.DeQuantStub()
+        self.in_channels = conv.in_channels
+        self.out_channels = conv.out_channels
+        self.kernel_size = conv.kernel_size
+        self.stride = conv.stride
+        self.padding = conv.padding
+        self.dilation = conv.dilation
+        self.groups = conv.groups
+
+    def forward(self, x):
+        return self.dequant(self.conv(self.quant(x)))
+
+
+def _wrap_convs(module, qconfig):
+    for name, child in module.named_children():
+        if type(child) == nn.Conv1d and child.groups == 1 and child.padding_mode == 'zeros':
+            wrapped = Int8Conv1d(child)
+            wrapped.qconfig = qconfig
+            setattr(module, name, wrapped)
+        elif not isinstance(child, Int8Conv1d):
+            _wrap_convs(child, qconfig)
+
+
+def prepare_int8(module, backend='fbgemm'):
+    """Prepares a module for int8 quantization in place: dense Conv1d layers are wrapped in Int8Conv1d with
+    observers of their activation ranges.
+
+    Args:
+        module: Module to quantize, e.g. a JasperEncoder or JasperDecoderForCTC. Must be on CPU.
+        backend: Quantized engine, 'fbgemm' for x86 servers or 'qnnpack' for ARM.
+
+    Returns:
+        The module, in eval mode, to run calibration data through.
+    """
+    if is_int8(module):
+        raise ValueError("Module is already prepared for int8 quantization")
+    torch.backends.quantized.engine = backend
+    module.eval()
+    _wrap_convs(module, torch.quantization.get_default_qconfig(backend))
+    torch.quantization.prepare(module, inplace=True)
+    return module
+
+
+def convert_int8(module):
+    """Replaces the observed convolutions of a module prepared by `prepare_int8` with int8 ones, using the collected
+    activation ranges, and quantizes its Linear layers dynamically. Works in place.
+
+    Returns:
+        The module, which can then be saved with `save_to` or restored with `restore_from`.
+    """
+    if not is_int8(module):
+        raise ValueError("Module must be prepared with prepare_int8 first")
+    torch.quantization.convert(module, inplace=True)
+    torch.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return module
+
+
+def is_int8(module):
+    """Whether `prepare_int8` was applied to the module."""
+    return any(isinstance(m, Int8Conv1d) for m in module.modules())
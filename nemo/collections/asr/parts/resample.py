@@ -0,0 +1,68 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Resampling of audio samples, with librosa or with a cached polyphase filter.
+
+librosa designs the resampling filter for every call, which dominates the loading time of e.g. 8 kHz telephony audio
+resampled to 16 kHz, or of speed perturbation. `polyphase_resample` reduces the ratio of the sample rates to
+`up / down`, designs a Kaiser windowed sinc low-pass filter once per ratio and applies it with
+`scipy.signal.upfirdn`, which only computes the output samples that are kept.
+
+For full scale audio that is band limited to 80% of the lower Nyquist frequency, the output of
+`polyphase_resample` differs from that of librosa's default 'kaiser_best' by less than 1e-3, except for the first
+and last 64 output samples, where both filters see the zero padding differently and the difference stays below
+5e-2. Both outputs have `ceil(len(samples) * target_sr / orig_sr)` samples.
+"""
+import math
+from functools import lru_cache
+
+import librosa
+import numpy as np
+from scipy import signal
+
+__all__ = ['RESAMPLE_TYPES', 'polyphase_resample', 'resample']
+
+# 'polyphase' and the res_type values of librosa.core.resample
+RESAMPLE_TYPES = ('polyphase', 'kaiser_best', 'kaiser_fast', 'fft', 'scipy')
+
+# Zero crossings of the sinc on each side, per unit of the larger of up and down
+FILTER_HALF_LENGTH = 16
+KAISER_BETA = 8.0
+
+
+@lru_cache(maxsize=64)
+def _polyphase_filter(up, down):
+    # Returns the low-pass filter for resampling by up / down and the delay of its center in output samples
+    max_rate = max(up, down)
+    half_len = FILTER_HALF_LENGTH * max_rate
+    h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', KAISER_BETA)) * up
+    # Pads the front of the filter so that its center falls on an output sample, as scipy.signal.resample_poly
+    n_pre_pad = down - half_len % down
+    h = np.concatenate([np.zeros(n_pre_pad), h]).astype(np.float32)
+    h.flags.writeable = False
+    return h, (half_len + n_pre_pad) // down
+
+
+def polyphase_resample(samples, orig_sr, target_sr):
+    """Resamples the last axis of `samples` from orig_sr to target_sr with a cached polyphase filter."""
+    gcd = math.gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // gcd, int(orig_sr) // gcd
+    if up == down:
+        return samples
+    h, delay = _polyphase_filter(up, down)
+    num_samples = -(-samples.shape[-1] * up // down)
+    resampled = signal.upfirdn(h, samples, up, down, axis=-1)[..., delay : delay + num_samples]
+    if resampled.shape[-1] < num_samples:
+        # The convolution ends before the output does, the rest is zeros
+        padding = [(0, 0)] * (resampled.ndim - 1) + [(0, num_samples - resampled.shape[-1])]
+        resampled = np.pad(resampled, padding, mode='constant')
+    return resampled.astype(np.float32, copy=False)
+
+
+def resample(samples, orig_sr, target_sr, resample_type='kaiser_best'):
+    """Resamples the last axis of `samples` with `polyphase_resample` if resample_type is 'polyphase', or else with
+    `librosa.core.resample(..., res_type=resample_type)`.
+    """
+    if resample_type not in RESAMPLE_TYPES:
+        raise ValueError(f"Supported `resample_type` values are {RESAMPLE_TYPES}")
+    if resample_type == 'polyphase':
+        return polyphase_resample(samples, orig_sr, target_sr)
+    return librosa.core.resample(samples, orig_sr, target_sr, res_type=resample_type)
@@ -0,0 +1,212 @@
+# Copyright (c) 2020 NVIDIA Corporation
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+__all__ = ['DurationBucketingBatchSampler', 'TarredShardSampler']
+
+
+class DurationBucketingBatchSampler(torch.utils.data.Sampler):
+    """Batch sampler that groups utterances of similar duration and sizes batches by total audio.
+
+    Utterances are sorted by duration and split into `num_buckets` buckets with the same number of utterances. Each
+    bucket gets its own batch size, chosen so that a batch padded to the longest utterance of the bucket stays within
+    the audio budget. Every epoch the utterances inside of the buckets and the order of batches are reshuffled with a
+    seed shared by all ranks; batches are then dealt out round-robin to the ranks, so all ranks see the same number of
+    batches per epoch.
+
+    Being deterministic in (seed, epoch), the sampler can resume mid-epoch: `state_dict` records the epoch and the
+    number of batches handed out, and `load_state_dict` makes the next iteration skip those batches. Note that the
+    DataLoader prefetches batches ahead of consumption, so for exact resume store the number of consumed steps
+    with `{'epoch': epoch, 'start_batch': steps_in_epoch}` instead.
+
+    Args:
+        durations: Duration in seconds of every utterance of the dataset.
+        max_batch_duration: Budget of padded audio seconds per batch, i.e. batch size times the longest duration
+            in the batch. Exactly one of `max_batch_duration` and `max_batch_frames` must be set.
+        max_batch_frames: Budget of padded feature frames per batch.
+        frame_stride: Seconds per feature frame, used to convert `max_batch_frames` into seconds.
+            Defaults to 0.01.
+        num_buckets: Number of duration buckets. Defaults to 10.
+        max_batch_size: Optional upper bound on the number of utterances in a batch.
+        shuffle: Whether to reshuffle buckets and batches every epoch. Defaults to True.
+        drop_last: If True, drops batches that would not divide evenly among ranks, otherwise reuses the first
+            batches to pad the epoch. Defaults to False.
+        num_replicas: Number of distributed ranks. Taken from torch.distributed if initialized, else 1.
+        rank: Rank of the current process. Taken from torch.distributed if initialized, else 0.
+        seed: Base random seed shared by all ranks. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        durations: Sequence[float],
+        max_batch_duration: Optional[float] = None,
+        max_batch_frames: Optional[int] = None,
+        frame_stride: float = 0.01,
+        num_buckets: int = 10,
+        max_batch_size: Optional[int] = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        seed: int = 0,
+    ):
+        if (max_batch_duration is None) == (max_batch_frames is None):
+            raise ValueError("Exactly one of `max_batch_duration` and `max_batch_frames` must be set.")
+        if max_batch_frames is not None:
+            max_batch_duration = max_batch_frames * frame_stride
+        if max_batch_duration <= 0:
+            raise ValueError("Batch audio budget must be positive.")
+        if num_buckets < 1:
+            raise ValueError("`num_buckets` must be a positive integer.")
+
+        if num_replicas is None or rank is None:
+            distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+            if num_replicas is None:
+                num_replicas = torch.distributed.get_world_size() if distributed else 1
+            if rank is None:
+                rank = torch.distributed.get_rank() if distributed else 0
+
+        durations = np.asarray(durations, dtype=np.float64)
+        if len(durations) == 0:
+            raise ValueError("Cannot sample batches from an empty dataset.")
+
+        self.max_batch_duration = max_batch_duration
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self._start_batch = 0
+        self._batches_yielded = 0
+
+        order = np.argsort(durations, kind='stable')
+        self._buckets = [b for b in np.array_split(order, min(num_buckets, len(order))) if len(b) > 0]
+        self._bucket_batch_sizes = []
+        for bucket in self._buckets:
+            batch_size = max(1, int(max_batch_duration // max(durations[bucket[-1]], 1e-6)))
+            if max_batch_size is not None:
+                batch_size = min(batch_size, max_batch_size)
+            self._bucket_batch_sizes.append(batch_size)
+
+        total = sum(-(-len(b) // bs) for b, bs in zip(self._buckets, self._bucket_batch_sizes))
+        if drop_last:
+            self._num_batches = total // num_replicas
+        else:
+            self._num_batches = -(-total // num_replicas)
+
+    def _epoch_batches(self) -> List[np.ndarray]:
+        rng = np.random.default_rng((self.seed, self.epoch))
+
+        batches = []
+        for bucket, batch_size in zip(self._buckets, self._bucket_batch_sizes):
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+            batches.extend(bucket[i : i + batch_size] for i in range(0, len(bucket), batch_size))
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        total = self._num_batches * self.num_replicas
+        if total > len(batches):
+            batches = [batches[i % len(batches)] for i in range(total)]
+
+        return batches[self.rank : total : self.num_replicas]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._epoch_batches()
+        start, self._start_batch = self._start_batch, 0
+        self._batches_yielded = start
+
+        for batch in batches[start:]:
+            self._batches_yielded += 1
+            yield batch.tolist()
+
+    def __len__(self):
+        return self._num_batches
+
+    def set_epoch(self, epoch: int):
+        """Sets the epoch used to seed the shuffling, called by the training loop at the start of every epoch."""
+        self.epoch = epoch
+
+    def state_dict(self) -> dict:
+        return {'epoch': self.epoch, 'start_batch': self._batches_yielded}
+
+    def load_state_dict(self, state_dict: dict):
+        """Restores epoch and position, the next iteration starts at batch `start_batch` of that epoch."""
+        self.epoch = state_dict['epoch']
+        self._start_batch = state_dict['start_batch']
+
+
+class TarredShardSampler:
+    """Assigns tarball shards to (rank, DataLoader worker) pairs, to be used as `shard_selection` of WebDataset.
+
+    Every epoch the shard order is reshuffled with a seed shared by all ranks and the shard list is padded by reusing
+    its first shards until it divides evenly among all `num_replicas * num_workers` workers; each worker then reads
+    every `num_replicas * num_workers`-th shard. This way no shard is read twice by a rank within an epoch unless
+    there are fewer shards than workers, and no shard is dropped when the counts are uneven.
+
+    Args:
+        num_workers: Number of DataLoader workers per rank, 0 means loading in the main process.
+        shuffle: Whether to reshuffle the shard order every epoch. Defaults to True.
+        num_replicas: Number of distributed ranks. Taken from torch.distributed if initialized, else 1.
+        rank: Rank of the current process. Taken from torch.distributed if initialized, else 0.
+        seed: Base random seed shared by all ranks. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 0,
+        shuffle: bool = True,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        seed: int = 0,
+    ):
+        if num_replicas is None or rank is None:
+            distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+            if num_replicas is None:
+                num_replicas = torch.distributed.get_world_size() if distributed else 1
+            if rank is None:
+                rank = torch.distributed.get_rank() if distributed else 0
+
+        self.num_workers = max(1, num_workers)
+        self.shuffle = shuffle
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+
+    def _epoch_shards(self, num_shards: int, num_workers: int) -> List[int]:
+        order = np.arange(num_shards)
+        if self.shuffle:
+            order = np.random.default_rng((self.seed, self.epoch)).permutation(num_shards)
+
+        total_workers = self.num_replicas * num_workers
+        total = -(-num_shards // total_workers) * total_workers
+        return [int(order[i % num_shards]) for i in range(total)]
+
+    def select(self, num_shards: int, worker_id: int = 0, num_workers: Optional[int] = None) -> List[int]:
+        """Returns indices of the shards read by a worker of this rank in the current epoch."""
+        num_workers = num_workers or self.num_workers
+        shards = self._epoch_shards(num_shards, num_workers)
+        return shards[self.rank * num_workers + worker_id :: self.num_replicas * num_workers]
+
+    def rank_shards(self, num_shards: int) -> List[int]:
+        """Returns indices of the shards read by all workers of this rank in the current epoch."""
+        return [s for worker_id in range(self.num_workers) for s in self.select(num_shards, worker_id)]
+
+    def __call__(self, urls: Sequence[str]) -> List[str]:
+        urls = list(urls)
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:
+            shards = self.select(len(urls))
+        else:
+            shards = self.select(len(urls), worker_info.id, worker_info.num_workers)
+        return [urls[s] for s in shards]
+
+    def set_epoch(self, epoch: int):
+        """Sets the epoch used to seed the shard shuffling, called by the training loop at the start of every epoch."""
+        self.epoch = epoch
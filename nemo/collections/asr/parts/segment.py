@@ -2,10 +2,12 @@
 # TODO: review, and copyright and fix/add comments
 import random
 
-import librosa
 import numpy as np
 import soundfile as sf
 
+from nemo.collections.asr.parts.resample import resample
+from nemo.collections.asr.parts.silence import silence_trim_offsets
+
 
 class AudioSegment(object):
     """Monaural audio segment abstraction.
@@ -13,19 +15,25 @@ class AudioSegment(object):
     :type samples: ndarray.float32
     :param sample_rate: Audio sample rate.
     :type sample_rate: int
+    :param resample_type: 'polyphase' or a librosa res_type, see resample.resample.
+    :type resample_type: str
     :raises TypeError: If the sample data type is not float or int.
     """
 
-    def __init__(self, samples, sample_rate, target_sr=None, trim=False, trim_db=60):
+    def __init__(self, samples, sample_rate, target_sr=None, trim=False, trim_db=60, resample_type='kaiser_best'):
         """Create audio segment from samples.
         Samples are convert float32 internally, with int scaled to [-1, 1].
         """
         samples = self._convert_samples_to_float32(samples)
         if target_sr is not None and target_sr != sample_rate:
-            samples = librosa.core.resample(samples, sample_rate, target_sr)
+            samples = resample(samples, sample_rate, target_sr, resample_type=resample_type)
             sample_rate = target_sr
+        self._trim_offsets = None
         if trim:
-            samples, _ = librosa.effects.trim(samples, trim_db)
+            # librosa.effects.trim semantics, see silence.silence_trim_offsets
+            start, end = silence_trim_offsets(samples if samples.ndim == 1 else samples.mean(axis=0), top_db=trim_db)
+            samples = samples[..., start:end]
+            self._trim_offsets = (start, end)
         self._samples = samples
         self._sample_rate = sample_rate
         if self._samples.ndim >= 2:
@@ -75,7 +83,14 @@ class AudioSegment(object):
 
     @classmethod
     def from_file(
-        cls, audio_file, target_sr=None, int_values=False, offset=0, duration=0, trim=False,
+        cls,
+        audio_file,
+        target_sr=None,
+        int_values=False,
+        offset=0,
+        duration=0,
+        trim=False,
+        resample_type='kaiser_best',
     ):
         """
         Load a file supported by librosa and return as an AudioSegment.
@@ -84,6 +99,7 @@ class AudioSegment(object):
         :param int_values: if true, load samples as 32-bit integers
         :param offset: offset in seconds when loading audio
         :param duration: duration in seconds when loading audio
+        :param resample_type: resampling method, see resample.resample
         :return: numpy array of samples
         """
         with sf.SoundFile(audio_file, 'r') as f:
@@ -97,10 +113,10 @@ class AudioSegment(object):
                 samples = f.read(dtype=dtype)
 
         samples = samples.transpose()
-        return cls(samples, sample_rate, target_sr=target_sr, trim=trim)
+        return cls(samples, sample_rate, target_sr=target_sr, trim=trim, resample_type=resample_type)
 
     @classmethod
-    def segment_from_file(cls, audio_file, target_sr=None, n_segments=0, trim=False):
+    def segment_from_file(cls, audio_file, target_sr=None, n_segments=0, trim=False, resample_type='kaiser_best'):
         """Grabs n_segments number of samples from audio_file randomly from the
         file as opposed to at a specified offset.
 
@@ -117,7 +133,7 @@ class AudioSegment(object):
                 samples = f.read(dtype='float32')
 
         samples = samples.transpose()
-        return cls(samples, sample_rate, target_sr=target_sr, trim=trim)
+        return cls(samples, sample_rate, target_sr=target_sr, trim=trim, resample_type=resample_type)
 
     @property
     def samples(self):
@@ -127,6 +143,11 @@ class AudioSegment(object):
     def sample_rate(self):
         return self._sample_rate
 
+    @property
+    def trim_offsets(self):
+        """Start and end sample of the kept audio if silence was trimmed, else None."""
+        return self._trim_offsets
+
     @property
     def num_samples(self):
         return self._samples.shape[0]
@@ -0,0 +1,98 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Energy based trimming of leading and trailing silence, for single utterances and padded batches.
+
+`silence_trim_offsets` follows `librosa.effects.trim`: the mean power of centered, reflect padded frames is compared
+to the loudest frame of the utterance, and frames more than `top_db` below it are silent. Squared samples are summed
+once per block of `gcd(frame_length, hop_length)` samples and frame powers are differences of the cumulative sum of
+the blocks at strided frame boundaries, so every sample is squared and summed once no matter the frame overlap. All
+utterances of a padded batch are processed at once.
+"""
+import math
+
+import torch
+import torch.nn.functional as F
+
+__all__ = ['silence_trim_offsets', 'trim_batch']
+
+# Lower bound of frame powers, as librosa.power_to_db
+AMIN = 1e-10
+
+
+def silence_trim_offsets(samples, lengths=None, top_db=60, frame_length=2048, hop_length=512):
+    """Finds the non-silent part of audio, as `librosa.effects.trim(samples, top_db, ...)[1]`.
+
+    Args:
+        samples: Audio (T) or padded batch of audio (B, T), numpy array or tensor.
+        lengths: Number of valid samples of every utterance (B) of a batch. Defaults to T for all of them.
+        top_db: Frames with a mean power this many dB below the loudest frame are silent.
+        frame_length: Number of samples per frame.
+        hop_length: Number of samples between frames.
+
+    Returns:
+        Start and end sample of the non-silent audio, as ints for a single utterance or long tensors (B) for a batch.
+        As in librosa, silence is relative to the loudest frame, so audio that is silent everywhere, e.g. all zeros,
+        is kept whole. Both are 0 only for empty utterances.
+    """
+    samples = torch.as_tensor(samples)
+    single = samples.dim() == 1
+    if single:
+        samples = samples.unsqueeze(0)
+    batch_size, max_len = samples.shape
+    device = samples.device
+    if lengths is None:
+        lengths = torch.full((batch_size,), max_len, dtype=torch.long, device=device)
+    lengths = torch.as_tensor(lengths, device=device).long()
+
+    # Reflect padding at the length of every utterance, as the centered frames of librosa
+    pad = frame_length // 2
+    k = torch.arange(pad, device=device).unsqueeze(0)
+    last = (lengths - 1).clamp(min=0).unsqueeze(1)
+    padded = F.pad(samples, (pad, pad))
+    padded[:, :pad] = samples.gather(1, torch.min(pad - k, last))
+    padded.scatter_(1, lengths.unsqueeze(1) + pad + k, samples.gather(1, (last - 1 - k).clamp(min=0)))
+
+    # Frames are sums of blocks of gcd(frame_length, hop_length) samples
+    block = math.gcd(frame_length, hop_length)
+    num_blocks = -(-padded.shape[1] // block)
+    blocks = F.pad(padded.pow(2), (0, num_blocks * block - padded.shape[1])).view(batch_size, num_blocks, block)
+    cumulative = F.pad(blocks.sum(dim=2).double().cumsum(dim=1), (1, 0))
+    num_frames = max(1 + (max_len + 2 * pad - frame_length) // hop_length, 1)
+    starts = torch.arange(num_frames, device=device) * (hop_length // block)
+    ends = (starts + frame_length // block).clamp(max=num_blocks)
+    power = (cumulative[:, ends] - cumulative[:, starts]) / frame_length
+    valid = torch.arange(num_frames, device=device).unsqueeze(0) < (
+        1 + (lengths + 2 * pad - frame_length) // hop_length
+    ).unsqueeze(1)
+    power = power.clamp(min=AMIN).masked_fill(~valid, AMIN)
+
+    reference = power.max(dim=1, keepdim=True)[0]
+    non_silent = (power > reference * 10.0 ** (-top_db / 10.0)) & valid
+    any_non_silent = non_silent.any(dim=1)
+    # First and last non-silent frames, argmax returns the first maximum
+    first = non_silent.long().argmax(dim=1)
+    last_frame = num_frames - 1 - non_silent.long().flip(1).argmax(dim=1)
+    start = torch.where(any_non_silent, first * hop_length, torch.zeros_like(first))
+    end = torch.where(any_non_silent, torch.min((last_frame + 1) * hop_length, lengths), torch.zeros_like(first))
+    if single:
+        return int(start[0]), int(end[0])
+    return start, end
+
+
+def trim_batch(audio, audio_len, top_db=60, frame_length=2048, hop_length=512):
+    """Trims leading and trailing silence of a padded batch of audio, see `silence_trim_offsets`.
+
+    Args:
+        audio: Padded audio (B, T).
+        audio_len: Number of valid samples of every utterance (B).
+
+    Returns:
+        Trimmed audio (B, T') shifted to the start and padded with zeros, its lengths (B), and the start of the
+        trimmed audio in the original audio (B), to shift alignments and durations by.
+    """
+    start, end = silence_trim_offsets(audio, audio_len, top_db, frame_length, hop_length)
+    trimmed_len = end - start
+    max_len = int(trimmed_len.max()) if len(trimmed_len) > 0 else 0
+    positions = torch.arange(max_len, device=audio.device).unsqueeze(0)
+    index = (positions + start.unsqueeze(1)).clamp(max=max(audio.shape[1] - 1, 0))
+    trimmed = audio.gather(1, index) * (positions < trimmed_len.unsqueeze(1)).to(audio.dtype)
+    return trimmed, trimmed_len, start
@@ -0,0 +1,375 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Memory-mapped nearest neighbour index of speaker embeddings, for speaker identification.
+
+Embeddings, e.g. the x-vectors of `JasperDecoderForSpkrClass` saved by `spkr_get_emb.py`, are L2 normalized and
+stored as a flat float32 matrix that is memory-mapped, so that an index of millions of enrolled embeddings opens
+instantly and is shared between processes. Queries are scored by cosine similarity:
+
+* exactly, by a blocked matrix product over the whole matrix that keeps a running top-k per query;
+* approximately, after `train_ivf`, with an inverted file (IVF) of k-means lists and residuals compressed by product
+  quantization (PQ). Only the `nprobe` lists closest to a query are scored, from the PQ codes with one lookup table
+  per query, and the best `rerank` candidates are optionally rescored exactly. Recall grows with `nprobe` and
+  `rerank`, and so does latency.
+
+New speakers can be enrolled at any time with `add`, which appends to the files and encodes the new embeddings with
+the trained IVF/PQ quantizers.
+
+Index directory layout (raw little-endian binaries, `meta.json` holds the number of valid entries)::
+
+    meta.json          # format version, dimension, number of entries, IVF/PQ settings
+    embeddings.bin     # float32[N, D], L2 normalized
+    labels.bin         # uint8 blob with utf-8 encoded labels
+    labels_idx.bin     # int64[N + 1], start of each label in the blob
+    ivf_centroids.bin  # float32[L, D], k-means centroids of the inverted lists
+    pq_codebooks.bin   # float32[M, C, D / M], codebooks of the residuals of every subvector
+    assignments.bin    # int32[N], inverted list of every entry
+    codes.bin          # uint8[N, M], PQ codes of the residuals
+
+Example, with the outputs of spkr_get_emb.py::
+
+    embeddings, labels = speaker_scoring.load_embeddings('embeddings/enrollment.npy')
+    index = build_speaker_index('speaker_index', embeddings, labels)
+    index.train_ivf(num_lists=1024, num_subvectors=32)
+    scores, ids = index.search(queries, k=5, nprobe=16, rerank=100)
+    speakers = index.labels(ids[:, 0])
+"""
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from nemo.utils import logging
+
+__all__ = ['build_speaker_index', 'SpeakerIndex']
+
+INDEX_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[None]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def _top_k(scores, indices, k):
+    # Best k scores of every row, in decreasing order
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, indices = np.take_along_axis(scores, best, 1), np.take_along_axis(indices, best, 1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, 1), np.take_along_axis(indices, order, 1)
+
+
+def _pad(scores, indices, k):
+    # Fills missing neighbours with index -1 and score -inf
+    missing = k - scores.shape[1]
+    if missing > 0:
+        scores = np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf)
+        indices = np.pad(indices, ((0, 0), (0, missing)), constant_values=-1)
+    return scores, indices
+
+
+def _nearest(x, centroids, block_size=65536):
+    # Index of the nearest centroid in L2 distance of every row of x
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    return np.concatenate(
+        [
+            np.argmax(x[start : start + block_size] @ centroids.T - half_norms, axis=1)
+            for start in range(0, len(x), block_size)
+        ]
+    ).astype(np.int32)
+
+
+def _kmeans(x, num_clusters, iterations, rng):
+    centroids = x[rng.choice(len(x), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(x, centroids)
+        clusters, starts, counts = np.unique(np.sort(assignments), return_index=True, return_counts=True)
+        order = np.argsort(assignments, kind='stable')
+        centroids[clusters] = np.add.reduceat(x[order], starts, axis=0) / counts[:, None]
+        # Empty clusters restart from random points
+        empty = np.setdiff1d(np.arange(num_clusters), clusters)
+        if len(empty) > 0:
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def build_speaker_index(index_dir: str, embeddings: np.ndarray, labels: List[str]) -> 'SpeakerIndex':
+    """Writes a new index of embeddings to `index_dir`, replacing any index in it.
+
+    Args:
+        index_dir: Directory to write the index to. Created if it does not exist.
+        embeddings: (N, D) embeddings to enroll.
+        labels: (N) labels of the embeddings, e.g. speaker ids or file names.
+
+    Returns:
+        Opened `SpeakerIndex`.
+    """
+    embeddings = np.asarray(embeddings)
+    os.makedirs(index_dir, exist_ok=True)
+    # Truncates the files of any previous index
+    for name in ('embeddings', 'labels', 'ivf_centroids', 'pq_codebooks', 'assignments', 'codes'):
+        open(os.path.join(index_dir, name + '.bin'), 'wb').close()
+    with open(os.path.join(index_dir, 'labels_idx.bin'), 'wb') as f:
+        np.zeros(1, dtype=np.int64).tofile(f)
+    SpeakerIndex._write_meta(index_dir, dict(version=INDEX_VERSION, dim=embeddings.shape[1], num_entries=0, ivf=None))
+
+    index = SpeakerIndex(index_dir)
+    index.add(embeddings, labels)
+    return index
+
+
+class SpeakerIndex:
+    """Nearest neighbour index over an index directory written by `build_speaker_index`."""
+
+    def __init__(self, index_dir: str):
+        """Opens the index.
+
+        Args:
+            index_dir: Directory the index was written to.
+
+        Raises:
+            ValueError: If index is missing or of a different version.
+        """
+        meta_path = os.path.join(index_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise ValueError(f"{index_dir} does not contain a speaker index, build it with `build_speaker_index`.")
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(
+                f"Speaker index in {index_dir} has version {self.meta['version']}, expected {INDEX_VERSION}. "
+                f"Rebuild the index."
+            )
+        self.index_dir = index_dir
+        self._open()
+
+    @staticmethod
+    def _write_meta(index_dir, meta):
+        # Written last and atomically, the files may hold more than the entries of meta after an interruption
+        tmp_path = os.path.join(index_dir, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(index_dir, META_FILE))
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name + '.bin')
+
+    def _map(self, name, dtype, shape):
+        # np.memmap cannot map empty files
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode='r', shape=shape)
+
+    def _open(self):
+        num_entries, dim, ivf = len(self), self.dim, self.meta['ivf']
+        self._embeddings = self._map('embeddings', np.float32, (num_entries, dim))
+        self._labels_idx = self._map('labels_idx', np.int64, (num_entries + 1,))
+        self._labels = self._map('labels', np.uint8, (int(self._labels_idx[-1]),))
+        if ivf is None:
+            return
+        num_lists, num_subvectors, codebook_size = ivf['num_lists'], ivf['num_subvectors'], ivf['codebook_size']
+        self._centroids = np.array(self._map('ivf_centroids', np.float32, (num_lists, dim)))
+        self._codebooks = np.array(
+            self._map('pq_codebooks', np.float32, (num_subvectors, codebook_size, dim // num_subvectors))
+        )
+        self._assignments = self._map('assignments', np.int32, (num_entries,))
+        self._codes = self._map('codes', np.uint8, (num_entries, num_subvectors))
+        # Inverted lists: entries sorted by list, and the start of every list
+        self._list_ids = np.argsort(self._assignments, kind='stable')
+        self._list_starts = np.searchsorted(self._assignments[self._list_ids], np.arange(num_lists + 1))
+
+    def __len__(self):
+        return self.meta['num_entries']
+
+    @property
+    def dim(self) -> int:
+        return self.meta['dim']
+
+    @property
+    def has_ivf(self) -> bool:
+        return self.meta['ivf'] is not None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Normalized embeddings (N, D), memory-mapped."""
+        return self._embeddings
+
+    def label(self, i: int) -> str:
+        return self._labels[self._labels_idx[i] : self._labels_idx[i + 1]].tobytes().decode('utf-8')
+
+    def labels(self, indices) -> np.ndarray:
+        """Labels of an array of entry indices, None for the -1 of missing neighbours."""
+        indices = np.asarray(indices)
+        labels = [self.label(i) if i >= 0 else None for i in indices.reshape(-1)]
+        return np.array(labels, dtype=object).reshape(indices.shape)
+
+    def _truncate(self, name, num_bytes):
+        # Drops data of an interrupted add beyond the entries of meta
+        if os.path.getsize(self._path(name)) != num_bytes:
+            os.truncate(self._path(name), num_bytes)
+
+    def add(self, embeddings: np.ndarray, labels: List[str]):
+        """Enrolls new embeddings, which are encoded with the trained IVF/PQ quantizers if any.
+
+        Args:
+            embeddings: (N', D) embeddings.
+            labels: (N') labels of the embeddings.
+        """
+        embeddings = _normalize(embeddings)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embeddings have size {embeddings.shape[1]}, the index has size {self.dim}")
+        if len(embeddings) != len(labels):
+            raise ValueError(f"{len(embeddings)} embeddings but {len(labels)} labels")
+        num_entries, ivf = len(self), self.meta['ivf']
+
+        self._truncate('embeddings', num_entries * self.dim * 4)
+        self._truncate('labels_idx', (num_entries + 1) * 8)
+        self._truncate('labels', int(self._labels_idx[-1]))
+        encoded = [label.encode('utf-8') for label in labels]
+        with open(self._path('embeddings'), 'ab') as f:
+            embeddings.tofile(f)
+        with open(self._path('labels'), 'ab') as f:
+            f.write(b''.join(encoded))
+        with open(self._path('labels_idx'), 'ab') as f:
+            (self._labels_idx[-1] + np.cumsum([len(label) for label in encoded], dtype=np.int64)).tofile(f)
+        if ivf is not None:
+            self._truncate('assignments', num_entries * 4)
+            self._truncate('codes', num_entries * ivf['num_subvectors'])
+            assignments, codes = self._encode(embeddings)
+            with open(self._path('assignments'), 'ab') as f:
+                assignments.tofile(f)
+            with open(self._path('codes'), 'ab') as f:
+                codes.tofile(f)
+
+        self.meta['num_entries'] = num_entries + len(embeddings)
+        self._write_meta(self.index_dir, self.meta)
+        self._open()
+
+    def _encode(self, embeddings, block_size=65536):
+        # Inverted list of every embedding and PQ codes of the residuals to the list centroids
+        num_subvectors = self.meta['ivf']['num_subvectors']
+        assignments = _nearest(embeddings, self._centroids, block_size)
+        codes = np.empty((len(embeddings), num_subvectors), dtype=np.uint8)
+        for start in range(0, len(embeddings), block_size):
+            block = slice(start, start + block_size)
+            residuals = embeddings[block] - self._centroids[assignments[block]]
+            subvectors = residuals.reshape(len(residuals), num_subvectors, -1)
+            for m in range(num_subvectors):
+                codes[block, m] = _nearest(subvectors[:, m], self._codebooks[m])
+        return assignments, codes
+
+    def train_ivf(
+        self,
+        num_lists: int = 1024,
+        num_subvectors: int = 32,
+        num_train: int = 65536,
+        iterations: int = 10,
+        seed: Optional[int] = None,
+    ):
+        """Trains the IVF and PQ quantizers on a sample of the enrolled embeddings and encodes all of them.
+
+        Args:
+            num_lists: Number of inverted lists, e.g. about sqrt(N) to 4 * sqrt(N).
+            num_subvectors: Number of PQ subvectors, must divide the embedding size. Every entry is compressed to
+                this many bytes.
+            num_train: Number of embeddings to train the quantizers on.
+            iterations: Number of k-means iterations.
+            seed: Seed of the sampling and k-means initialization.
+        """
+        if self.dim % num_subvectors != 0:
+            raise ValueError(f"num_subvectors ({num_subvectors}) must divide the embedding size ({self.dim})")
+        if num_lists > len(self):
+            raise ValueError(f"num_lists ({num_lists}) can't exceed the number of entries ({len(self)})")
+        # The index stays valid, without IVF, if training is interrupted
+        self.meta['ivf'] = None
+        self._write_meta(self.index_dir, self.meta)
+        rng = np.random.RandomState(seed)
+        sample = np.sort(rng.choice(len(self), min(max(num_train, num_lists), len(self)), replace=False))
+        train = np.asarray(self._embeddings[sample])
+
+        self._centroids = _kmeans(train, num_lists, iterations, rng)
+        residuals = train - self._centroids[_nearest(train, self._centroids)]
+        subvectors = residuals.reshape(len(train), num_subvectors, -1)
+        codebook_size = min(256, len(train))
+        self._codebooks = np.stack(
+            [
+                _kmeans(np.ascontiguousarray(subvectors[:, m]), codebook_size, iterations, rng)
+                for m in range(num_subvectors)
+            ]
+        )
+        self._centroids.tofile(self._path('ivf_centroids'))
+        self._codebooks.tofile(self._path('pq_codebooks'))
+
+        self.meta['ivf'] = dict(num_lists=num_lists, num_subvectors=num_subvectors, codebook_size=codebook_size)
+        with open(self._path('assignments'), 'wb') as assignments_file, open(self._path('codes'), 'wb') as codes_file:
+            for start in range(0, len(self), 65536):
+                assignments, codes = self._encode(np.asarray(self._embeddings[start : start + 65536]))
+                assignments.tofile(assignments_file)
+                codes.tofile(codes_file)
+        self._write_meta(self.index_dir, self.meta)
+        self._open()
+        logging.info("Trained IVF index with %d lists and %d PQ subvectors", num_lists, num_subvectors)
+
+    def search(self, queries: np.ndarray, k: int = 1, nprobe: int = 0, rerank: int = 0, block_size: int = 65536):
+        """Finds the k enrolled embeddings of highest cosine similarity to every query.
+
+        Args:
+            queries: (Q, D) or (D) query embeddings.
+            k: Number of neighbours.
+            nprobe: Number of inverted lists to search per query. 0 searches exactly, otherwise the IVF must be
+                trained.
+            rerank: Number of best PQ candidates per query that are rescored with the exact embeddings, 0 returns
+                the PQ scores.
+            block_size: Number of enrolled embeddings scored at once by exact search.
+
+        Returns:
+            Cosine similarities (Q, k) in decreasing order and indices (Q, k) of the neighbours, -1 if there are less
+            than k candidates.
+        """
+        queries = _normalize(queries)
+        if nprobe > 0:
+            if not self.has_ivf:
+                raise ValueError("Approximate search needs an IVF index, see `train_ivf`")
+            return self._search_ivf(queries, k, nprobe, rerank)
+
+        scores = np.empty((len(queries), 0), dtype=np.float32)
+        indices = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), block_size):
+            block_scores = queries @ self._embeddings[start : start + block_size].T
+            block_indices = np.broadcast_to(np.arange(start, start + block_scores.shape[1]), block_scores.shape)
+            scores, indices = _top_k(
+                np.concatenate([scores, block_scores], axis=1), np.concatenate([indices, block_indices], axis=1), k
+            )
+        return _pad(scores, indices, k)
+
+    def _search_ivf(self, queries, k, nprobe, rerank):
+        num_lists, num_subvectors = self.meta['ivf']['num_lists'], self.meta['ivf']['num_subvectors']
+        nprobe = min(nprobe, num_lists)
+        coarse = queries @ self._centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        # Inner products of the query subvectors with all codewords, q . x ~ q . centroid + sum of lookups
+        lookups = np.einsum('qmd,mcd->qmc', queries.reshape(len(queries), num_subvectors, -1), self._codebooks)
+        subvector_ids = np.arange(num_subvectors)
+
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            candidates = np.concatenate(
+                [self._list_ids[self._list_starts[l] : self._list_starts[l + 1]] for l in probes[q]]
+            )
+            if len(candidates) == 0:
+                continue
+            residual_scores = lookups[q][subvector_ids, self._codes[candidates]].sum(axis=1)
+            scores = coarse[q, self._assignments[candidates]] + residual_scores
+            if rerank > 0:
+                scores, candidates = _top_k(scores[None], candidates[None], max(rerank, k))
+                candidates = np.sort(candidates[0])
+                scores = self._embeddings[candidates] @ query
+            scores, candidates = _pad(*_top_k(scores[None], candidates[None], k), k)
+            all_scores[q], all_indices[q] = scores[0], candidates[0]
+        return all_scores, all_indices
@@ -0,0 +1,160 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Cosine scoring of speaker verification trials and EER / minDCF of the scores.
+
+Embeddings are the `.npy` files written by `examples/speaker_recognition/spkr_get_emb.py`: an (N, D) array of
+embeddings and an (N) array of the audio file names they were extracted from. Every speaker is represented by the
+mean of its embeddings, computed once, and trials are scored as the cosine similarity of the normalized speaker
+centroids, with one matrix product or in chunks of trials so that memory stays bounded for millions of trials. The
+error rates of all thresholds are computed at once from the sorted scores.
+"""
+import numpy as np
+
+__all__ = [
+    'speaker_from_filename',
+    'load_embeddings',
+    'speaker_centroids',
+    'read_trials',
+    'score_trials',
+    'roc_curve',
+    'equal_error_rate',
+    'min_dcf',
+]
+
+
+def speaker_from_filename(filename):
+    """Speaker id of an audio file name, as in HI-MIA: the name up to the first '.' or '_'."""
+    return filename.strip().split('.')[0].split('_')[0]
+
+
+def load_embeddings(emb_path, labels_path=None):
+    """Loads the embeddings and file names saved by spkr_get_emb.py.
+
+    Args:
+        emb_path: Path of the (N, D) embeddings.
+        labels_path: Path of the (N) file names, defaults to emb_path with a '_labels' suffix.
+    """
+    if labels_path is None:
+        labels_path = emb_path[: -len('.npy')] + '_labels.npy' if emb_path.endswith('.npy') else emb_path + '_labels'
+    embeddings = np.load(emb_path)
+    labels = np.load(labels_path)
+    if len(embeddings) != len(labels):
+        raise ValueError(f"{len(embeddings)} embeddings but {len(labels)} labels")
+    return embeddings, labels
+
+
+def speaker_centroids(embeddings, labels, speaker_fn=speaker_from_filename):
+    """Mean embedding of every speaker.
+
+    Args:
+        embeddings: (N, D) embeddings.
+        labels: (N) labels of the embeddings, e.g. file names.
+        speaker_fn: Maps a label to its speaker id, or None if labels are speaker ids.
+
+    Returns:
+        Speaker ids (S) in sorted order and their mean embeddings (S, D), in float64.
+    """
+    speakers = np.asarray([speaker_fn(label) for label in labels] if speaker_fn is not None else labels)
+    speaker_ids, inverse, counts = np.unique(speakers, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sums = np.add.reduceat(np.asarray(embeddings, dtype=np.float64)[order], starts, axis=0)
+    return speaker_ids, sums / counts[:, None]
+
+
+def read_trials(trials_path, speaker_ids):
+    """Reads trials of lines '<speaker> <speaker> target|nontarget'.
+
+    Args:
+        trials_path: Path of the trial list, e.g. HI-MIA trials_1m.
+        speaker_ids: Speaker ids of the centroids, see speaker_centroids.
+
+    Returns:
+        Indices in speaker_ids of the enrollment and test speakers (T), trial labels (T), 1 for targets, and the
+        original lines.
+    """
+    index = {speaker: i for i, speaker in enumerate(speaker_ids)}
+    with open(trials_path, 'r') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    fields = [line.split(' ') for line in lines]
+    x = np.fromiter((index[f[0]] for f in fields), dtype=np.int64, count=len(fields))
+    y = np.fromiter((index[f[1]] for f in fields), dtype=np.int64, count=len(fields))
+    labels = np.fromiter((f[-1] != 'nontarget' for f in fields), dtype=np.int64, count=len(fields))
+    return x, y, labels, lines
+
+
+def score_trials(centroids, x, y, chunk_size=65536):
+    """Cosine similarity of trials between speaker centroids, scaled to [0, 1].
+
+    Args:
+        centroids: (S, D) speaker embeddings.
+        x: Indices of the enrollment speakers of the trials (T).
+        y: Indices of the test speakers of the trials (T).
+        chunk_size: Number of trials scored at once, bounds memory to 2 * chunk_size * D floats. Trials are
+            scored with one (S, S) similarity matrix instead if there are fewer speaker pairs than trials.
+
+    Returns:
+        Scores (T), (cos + 1) / 2.
+    """
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    normalized = centroids / np.maximum(norms, np.finfo(centroids.dtype).tiny)
+    if len(normalized) ** 2 <= len(x):
+        # Fewer speaker pairs than trials, e.g. HI-MIA: all similarities at once in one matrix product
+        return (normalized @ normalized.T + 1)[x, y] / 2
+    scores = np.empty(len(x), dtype=normalized.dtype)
+    for start in range(0, len(x), chunk_size):
+        end = start + chunk_size
+        scores[start:end] = np.einsum('ij,ij->i', normalized[x[start:end]], normalized[y[start:end]])
+    return (scores + 1) / 2
+
+
+def roc_curve(scores, labels):
+    """False positive and false negative rates of all distinct thresholds.
+
+    Args:
+        scores: Trial scores (T), higher for targets.
+        labels: Trial labels (T), 1 for targets and 0 for non-targets.
+
+    Returns:
+        False positive rates, false negative rates and thresholds in decreasing order, with a first point of
+        threshold inf that accepts no trial.
+    """
+    scores = np.asarray(scores)
+    labels = np.asarray(labels)
+    order = np.argsort(-scores, kind='mergesort')
+    scores, labels = scores[order], labels[order]
+    # Last index of every distinct score
+    last = np.concatenate([np.nonzero(np.diff(scores))[0], [len(scores) - 1]])
+    true_positives = np.cumsum(labels)[last]
+    false_positives = last + 1 - true_positives
+    num_targets = max(labels.sum(), 1)
+    num_nontargets = max(len(labels) - labels.sum(), 1)
+    fpr = np.concatenate([[0.0], false_positives / num_nontargets])
+    fnr = np.concatenate([[1.0], 1 - true_positives / num_targets])
+    return fpr, fnr, np.concatenate([[np.inf], scores[last]])
+
+
+def equal_error_rate(scores, labels):
+    """Equal error rate of the linearly interpolated ROC curve, where the false positive and negative rates are
+    equal.
+
+    Returns:
+        The EER and the threshold of the ROC point at or just past it.
+    """
+    fpr, fnr, thresholds = roc_curve(scores, labels)
+    difference = fnr - fpr
+    k = max(int(np.argmax(difference <= 0)), 1)
+    step = difference[k - 1] - difference[k]
+    t = difference[k - 1] / step if step > 0 else 0.0
+    return fpr[k - 1] + t * (fpr[k] - fpr[k - 1]), thresholds[k]
+
+
+def min_dcf(scores, labels, p_target=0.01, c_miss=1.0, c_fa=1.0):
+    """Minimum normalized detection cost over all thresholds, as in the NIST SRE evaluations.
+
+    Returns:
+        The minimum detection cost, normalized by the cost of the best trivial system, and its threshold.
+    """
+    fpr, fnr, thresholds = roc_curve(scores, labels)
+    costs = c_miss * p_target * fnr + c_fa * (1 - p_target) * fpr
+    best = int(np.argmin(costs))
+    return costs[best] / min(c_miss * p_target, c_fa * (1 - p_target)), thresholds[best]
@@ -4,12 +4,58 @@ import torch
 import torch.nn as nn
 
 
-class SpecAugment(nn.Module):
+class _MaskGenerator(nn.Module):
+    """Base of spectrogram augmentations that draw their masks on the device of the input
+    from a generator of their own. Masks are reproducible only with an explicit seed, else
+    the generator is seeded from OS entropy, so that every instance, e.g. on every
+    distributed rank, draws different masks.
+    """
+
+    def __init__(self, rng=None, seed=None):
+        super(_MaskGenerator, self).__init__()
+
+        # Kept for backward compatibility, a random.Random only seeds the generator now
+        if seed is None and rng is not None:
+            seed = rng.randrange(2 ** 63)
+        self.seed = seed
+        self._generator_seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 63)
+        self._generator = None
+
+    def _get_generator(self, device):
+        if self._generator is None or self._generator.device != device:
+            self._generator = torch.Generator(device=device)
+            self._generator.manual_seed(self._generator_seed)
+        return self._generator
+
+    @staticmethod
+    def _draw(high, num_masks, generator, device):
+        """Draws `int(uniform(0, high))` for every utterance and mask, `high` is a float tensor of shape (B)."""
+        uniform = torch.rand(high.shape[0], num_masks, generator=generator, device=device)
+        return (uniform * high.clamp(min=0)[:, None]).long()
+
+    @staticmethod
+    def _ranges(starts, widths, size):
+        """Marks ranges [start, start + width) of every mask in a (B, masks, size) boolean tensor."""
+        positions = torch.arange(size, device=starts.device)
+        return (positions >= starts[..., None]) & (positions < (starts + widths)[..., None])
+
+    @staticmethod
+    def _lengths(x, length):
+        if length is None:
+            return torch.full((x.shape[0],), x.shape[2], dtype=torch.long, device=x.device)
+        return length.to(device=x.device, dtype=torch.long)
+
+
+class SpecAugment(_MaskGenerator):
     """
     Zeroes out(cuts) random continuous horisontal or
     vertical segments of the spectrogram as described in
     SpecAugment (https://arxiv.org/abs/1904.08779).
 
+    Masks are drawn for the whole batch at once on the device of the
+    spectrogram. If lengths are given, time masks and the time range of
+    frequency masks stay within the length of every utterance.
+
     params:
     freq_masks - how many frequency segments should be cut
     time_masks - how many time segments should be cut
@@ -20,14 +66,15 @@ class SpecAugment(nn.Module):
         to be cut in one segment.
         If a float value, defines maximum percentage of timesteps that
         are cut adaptively.
+    rng - random.Random used to seed the mask generator
+    seed - seed of the mask generator. Masks are reproducible only if seed
+        or rng is given, else the generator is seeded from OS entropy
     """
 
     def __init__(
-        self, freq_masks=0, time_masks=0, freq_width=10, time_width=10, rng=None,
+        self, freq_masks=0, time_masks=0, freq_width=10, time_width=10, rng=None, seed=None,
     ):
-        super(SpecAugment, self).__init__()
-
-        self._rng = random.Random() if rng is None else rng
+        super(SpecAugment, self).__init__(rng=rng, seed=seed)
 
         self.freq_masks = freq_masks
         self.time_masks = time_masks
@@ -44,72 +91,73 @@ class SpecAugment(nn.Module):
             self.adaptive_temporal_width = True
 
     @torch.no_grad()
-    def forward(self, x):
-        sh = x.shape
+    def forward(self, x, length=None):
+        batch_size, num_freqs, num_steps = x.shape
+        generator = self._get_generator(x.device)
+        length = self._lengths(x, length)
 
         if self.adaptive_temporal_width:
-            time_width = max(1, int(sh[2] * self.time_width))
+            time_width = (length.float() * self.time_width).long().clamp(min=1)
         else:
-            time_width = self.time_width
-
-        mask = torch.zeros(x.shape).byte()
-
-        for idx in range(sh[0]):
-            for i in range(self.freq_masks):
-                x_left = int(self._rng.uniform(0, sh[1] - self.freq_width))
-
-                w = int(self._rng.uniform(0, self.freq_width))
-
-                mask[idx, x_left : x_left + w, :] = 1
-
-            for i in range(self.time_masks):
-                y_left = int(self._rng.uniform(0, sh[2] - time_width))
+            time_width = torch.full_like(length, self.time_width)
+        time_width = torch.min(time_width, length)
 
-                w = int(self._rng.uniform(0, time_width))
+        freq_high = torch.full((batch_size,), float(num_freqs - self.freq_width), device=x.device)
+        freq_starts = self._draw(freq_high, self.freq_masks, generator, x.device)
+        freq_widths = self._draw(torch.full_like(freq_high, self.freq_width), self.freq_masks, generator, x.device)
+        time_starts = self._draw((length - time_width).float(), self.time_masks, generator, x.device)
+        time_widths = self._draw(time_width.float(), self.time_masks, generator, x.device)
 
-                mask[idx, :, y_left : y_left + w] = 1
+        freq_mask = self._ranges(freq_starts, freq_widths, num_freqs).any(dim=1)
+        time_mask = self._ranges(time_starts, time_widths, num_steps).any(dim=1)
+        valid = torch.arange(num_steps, device=x.device)[None, :] < length[:, None]
 
-        x = x.masked_fill(mask.type(torch.bool).to(device=x.device), 0)
+        mask = (freq_mask[:, :, None] | time_mask[:, None, :]) & valid[:, None, :]
+        return x.masked_fill(mask, 0)
 
-        return x
 
-
-class SpecCutout(nn.Module):
+class SpecCutout(_MaskGenerator):
     """
     Zeroes out(cuts) random rectangles in the spectrogram
     as described in (https://arxiv.org/abs/1708.04552).
 
+    Masks are drawn for the whole batch at once on the device of the
+    spectrogram. If lengths are given, rectangles stay within the length
+    of every utterance.
+
     params:
     rect_masks - how many rectangular masks should be cut
     rect_freq - maximum size of cut rectangles along the frequency dimension
     rect_time - maximum size of cut rectangles along the time dimension
+    rng - random.Random used to seed the mask generator
+    seed - seed of the mask generator. Masks are reproducible only if seed
+        or rng is given, else the generator is seeded from OS entropy
     """
 
-    def __init__(self, rect_masks=0, rect_time=5, rect_freq=20, rng=None):
-        super(SpecCutout, self).__init__()
-
-        self._rng = random.Random() if rng is None else rng
+    def __init__(self, rect_masks=0, rect_time=5, rect_freq=20, rng=None, seed=None):
+        super(SpecCutout, self).__init__(rng=rng, seed=seed)
 
         self.rect_masks = rect_masks
         self.rect_time = rect_time
         self.rect_freq = rect_freq
 
     @torch.no_grad()
-    def forward(self, x):
-        sh = x.shape
-
-        mask = torch.zeros(x.shape).byte()
-
-        for idx in range(sh[0]):
-            for i in range(self.rect_masks):
-                rect_x = int(self._rng.uniform(0, sh[1] - self.rect_freq))
-                rect_y = int(self._rng.uniform(0, sh[2] - self.rect_time))
-
-                w_x = int(self._rng.uniform(0, self.rect_time))
-                w_y = int(self._rng.uniform(0, self.rect_freq))
-
-                mask[idx, rect_x : rect_x + w_x, rect_y : rect_y + w_y] = 1
-
-        x = x.masked_fill(mask.type(torch.bool).to(device=x.device), 0)
-
-        return x
+    def forward(self, x, length=None):
+        batch_size, num_freqs, num_steps = x.shape
+        generator = self._get_generator(x.device)
+        length = self._lengths(x, length)
+
+        freq_high = torch.full((batch_size,), float(num_freqs - self.rect_freq), device=x.device)
+        freq_starts = self._draw(freq_high, self.rect_masks, generator, x.device)
+        time_starts = self._draw((length - self.rect_time).float(), self.rect_masks, generator, x.device)
+        freq_widths = self._draw(torch.full_like(freq_high, self.rect_freq), self.rect_masks, generator, x.device)
+        time_widths = self._draw(torch.full_like(freq_high, self.rect_time), self.rect_masks, generator, x.device)
+        time_widths = torch.min(time_widths, length[:, None] - time_starts)
+
+        freq_ranges = self._ranges(freq_starts, freq_widths, num_freqs)
+        time_ranges = self._ranges(time_starts, time_widths, num_steps)
+        mask = torch.zeros(x.shape, dtype=torch.bool, device=x.device)
+        for i in range(self.rect_masks):
+            mask |= freq_ranges[:, i, :, None] & time_ranges[:, i, None, :]
+
+        return x.masked_fill(mask, 0)
@@ -0,0 +1,166 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Streaming, chunked inference for AudioToMelSpectrogramPreprocessor -> JasperEncoder -> JasperDecoderForCTC.
+
+`StreamingInference` takes the audio of a batch of streams in consecutive chunks and keeps only as much audio and
+as many features as the next frames depend on. Every chunk is processed together with the buffered left context,
+and only the frames whose whole receptive field is available are emitted. The rest waits for the right context of
+the next chunk. Memory therefore stays bounded by the chunk size and the receptive field of the encoder, no matter
+how long the recording is.
+
+Emitted log-probs are those of offline inference over the whole recording, provided that:
+
+- the preprocessor does not dither (dither=0) and uses no normalization or a fixed one. "per_feature" and
+  "all_features" normalize with running statistics over the frames seen so far (see RunningFeatureStats), which
+  only approximates offline statistics of the whole utterance,
+- the encoder uses batch normalization, no squeeze-and-excitation and masked convolutions (conv_mask=True), so
+  that no layer looks at the whole utterance and the tail of the recording is padded as offline.
+"""
+import math
+
+import torch
+import torch.nn as nn
+
+from nemo.collections.asr.parts.features import FilterbankFeatures, RunningFeatureStats, normalize_batch
+from nemo.collections.asr.parts.jasper import MaskedConv1d, SqueezeExcite
+
+
+def jasper_receptive_field(blocks):
+    """Computes how encoder output frames of a stack of JasperBlocks map to input frames.
+
+    Output frame `t` depends on input frames `t * stride - left` to `t * stride + right`.
+
+    Args:
+        blocks: JasperBlocks, e.g. `JasperEncoder.encoder`.
+
+    Returns:
+        Tuple of total stride, left context and right context in input frames.
+    """
+    stride, left, right = 1, 0, 0
+    for block in blocks:
+        for layer in block.mconv:
+            if isinstance(layer, MaskedConv1d):
+                layer = layer.conv
+            if isinstance(layer, (SqueezeExcite, nn.GroupNorm)):
+                raise ValueError(f"{type(layer).__name__} uses the whole utterance and can not be streamed.")
+            if isinstance(layer, nn.Conv1d):
+                span = layer.dilation[0] * (layer.kernel_size[0] - 1)
+                left += layer.padding[0] * stride
+                right += (span - layer.padding[0]) * stride
+                stride *= layer.stride[0]
+    return stride, left, right
+
+
+class StreamingInference(object):
+    """Computes CTC log-probs of a batch of audio streams chunk by chunk.
+
+    The preprocessor featurizer, encoder and decoder are switched to eval mode. Streams of a batch advance in
+    lockstep, so all chunks passed to `process` have the same length for every stream.
+
+    Args:
+        preprocessor: AudioToMelSpectrogramPreprocessor.
+        encoder: JasperEncoder.
+        decoder: JasperDecoderForCTC.
+    """
+
+    def __init__(self, preprocessor, encoder, decoder):
+        featurizer = getattr(preprocessor, "featurizer", None)
+        if not isinstance(featurizer, FilterbankFeatures):
+            raise ValueError(f"Streaming requires an AudioToMelSpectrogramPreprocessor, got {preprocessor}.")
+        self.featurizer = featurizer
+        self.encoder = encoder
+        self.decoder = decoder
+        # The preprocessor is not an nn.Module, its featurizer is
+        for module in (featurizer, encoder, decoder):
+            module.eval()
+
+        self.hop_length = featurizer.hop_length
+        # STFT frames are centered, frame t covers samples t * hop_length +- n_fft // 2
+        self.half_window = featurizer.n_fft // 2
+        self.encoder_stride, self.left_context, self.right_context = jasper_receptive_field(encoder.encoder)
+        self.reset()
+
+    def reset(self):
+        """Starts new streams."""
+        self.audio = None
+        self.audio_start = 0
+        self.num_samples = 0
+        self.features = None
+        self.features_start = 0
+        self.num_features = 0
+        self.num_encoded = 0
+        self.running_stats = None
+        if self.featurizer.normalize in ("per_feature", "all_features"):
+            self.running_stats = RunningFeatureStats(self.featurizer.normalize)
+
+    @torch.no_grad()
+    def process(self, audio, last=False):
+        """Adds the next chunk of audio of every stream.
+
+        Args:
+            audio: Chunk of audio (B, T).
+            last: Whether this is the last chunk of the streams, which emits all remaining frames.
+
+        Returns:
+            Log-probs (B, T', C) of the encoder frames that became final with this chunk, or None if there are none
+            yet. Concatenated over all chunks they are the log-probs of the whole streams.
+        """
+        audio = audio.to(device=self.featurizer.fb.device, dtype=torch.float)
+        self.audio = audio if self.audio is None else torch.cat([self.audio, audio], dim=1)
+        self.num_samples += audio.shape[1]
+
+        self._update_features(last)
+        log_probs = self._update_log_probs(last)
+        if last:
+            self.reset()
+        return log_probs
+
+    def _update_features(self, last):
+        if last:
+            end = math.ceil(self.num_samples / self.hop_length)
+        else:
+            end = max((self.num_samples - self.half_window) // self.hop_length + 1, 0)
+        if end <= self.num_features or self.audio.shape[1] <= self.half_window:
+            return
+
+        # Dithering adds noise to its input in place, keep the buffered audio clean
+        audio = self.audio.clone() if self.featurizer.dither > 0 else self.audio
+        audio_len = torch.full((audio.shape[0],), audio.shape[1], dtype=torch.long, device=audio.device)
+        offset = self.audio_start // self.hop_length
+        features = self.featurizer(audio, audio_len, normalize=False)[:, :, self.num_features - offset : end - offset]
+
+        features_len = torch.full_like(audio_len, features.shape[2])
+        if self.running_stats is not None:
+            features = self.running_stats.normalize(features, features_len)
+        elif self.featurizer.normalize:
+            features = normalize_batch(features, features_len, self.featurizer.normalize)
+        self.features = features if self.features is None else torch.cat([self.features, features], dim=2)
+        self.num_features = end
+
+        # Keep the samples of the next frame and the one before it for preemphasis, aligned to frames
+        start = max(end * self.hop_length - self.half_window - 1, 0) // self.hop_length * self.hop_length
+        self.audio = self.audio[:, start - self.audio_start :]
+        self.audio_start = start
+
+    def _update_log_probs(self, last):
+        stride = self.encoder_stride
+        if last:
+            end = math.ceil(self.num_features / stride)
+        else:
+            end = max((self.num_features - 1 - self.right_context) // stride + 1, 0)
+        if end <= self.num_encoded:
+            return None
+
+        features_len = torch.full(
+            (self.features.shape[0],), self.features.shape[2], dtype=torch.long, device=self.features.device
+        )
+        encoded, _ = self.encoder.forward(self.features, features_len)
+        offset = self.features_start // stride
+        log_probs = self.decoder.forward(encoded[:, :, self.num_encoded - offset : end - offset])
+        self.num_encoded = end
+
+        # Keep the left context of the next frame, aligned to the encoder stride so that strided convolutions
+        # see the same frames as offline
+        start = max(end * stride - self.left_context, 0) // stride * stride
+        self.features = self.features[:, :, start - self.features_start :]
+        self.features_start = start
+        return log_probs
@@ -0,0 +1,77 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Member offset index of uncompressed tarballs.
+
+A tar archive stores every member as a header followed by the raw file contents, so a member of an uncompressed
+tarball can be read with a single `os.pread` once the offset of its data is known. `write_tar_index` records the
+data offset and size of all members of a tarball in a small json file next to it (`audio_0.tar` ->
+`audio_0.index`), `load_tar_index` reads it back, scanning the tar headers instead if the index is missing or out
+of date.
+"""
+import json
+import os
+import tarfile
+from typing import Dict, Optional, Tuple
+
+from nemo.utils import logging
+
+__all__ = ['tar_index_path', 'build_tar_index', 'write_tar_index', 'load_tar_index']
+
+TAR_INDEX_VERSION = 1
+
+
+def tar_index_path(tar_path: str) -> str:
+    """Returns path of the index file belonging to `tar_path`."""
+    return os.path.splitext(tar_path)[0] + '.index'
+
+
+def build_tar_index(tar_path: str) -> Dict[str, Tuple[int, int]]:
+    """Scans the headers of an uncompressed tarball.
+
+    Returns:
+        Mapping from member name to (data offset, size) in bytes, for all regular files of the tarball.
+
+    Raises:
+        ValueError: If the tarball is compressed, as compressed members can't be read at an offset.
+    """
+    try:
+        tar = tarfile.open(tar_path, mode='r:')
+    except tarfile.ReadError:
+        raise ValueError(f"{tar_path} is not an uncompressed tarball, its members can't be accessed at random.")
+
+    with tar:
+        return {member.name: (member.offset_data, member.size) for member in tar if member.isfile()}
+
+
+def write_tar_index(tar_path: str, members: Optional[Dict[str, Tuple[int, int]]] = None) -> str:
+    """Writes the member index of `tar_path` next to it.
+
+    Args:
+        tar_path: Path to the tarball.
+        members: Index as returned by `build_tar_index`. Built from the tarball if not given.
+
+    Returns:
+        Path of the written index.
+    """
+    if members is None:
+        members = build_tar_index(tar_path)
+
+    index = dict(version=TAR_INDEX_VERSION, tar_size=os.path.getsize(tar_path), members=members)
+    path = tar_index_path(tar_path)
+    with open(path, 'w') as f:
+        json.dump(index, f)
+    return path
+
+
+def load_tar_index(tar_path: str) -> Dict[str, Tuple[int, int]]:
+    """Reads the member index of `tar_path`, or builds it if there is no up to date index file."""
+    path = tar_index_path(tar_path)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            index = json.load(f)
+        if index['version'] == TAR_INDEX_VERSION and index['tar_size'] == os.path.getsize(tar_path):
+            return {name: tuple(location) for name, location in index['members'].items()}
+        logging.warning(f"Index {path} does not match {tar_path}, scanning the tarball instead.")
+    else:
+        logging.info(f"No index found for {tar_path}, scanning the tarball.")
+
+    return build_tar_index(tar_path)
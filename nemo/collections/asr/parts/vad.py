@@ -0,0 +1,303 @@
+# Copyright (c) 2020 NVIDIA Corporation
+"""Frame-level voice activity detection on long recordings with a segment classifier, e.g. the QuartzNet VAD of
+`examples/asr/quartznet_vad.py`.
+
+Recordings are streamed from disk and cut into overlapping windows of the segment length the classifier was trained
+on, one window centered on every frame of `shift_length_in_sec`. `SlidingWindowDataset` spreads the recordings over
+DataLoader workers, so that batches hold windows of many recordings at once. `VADInference` classifies the batches
+and collects the speech probability of every window. The probabilities of the overlapping windows are averaged into
+per-frame probabilities (`merge_overlapping_windows`), smoothed by a median filter and segmented with hysteresis
+thresholds (`speech_segments`). The segments are written as a manifest with `write_segments_manifest`.
+
+Frame `t` covers [t * shift, (t + 1) * shift) seconds of a recording, and its window is centered on it. Windows
+that extend past the start or the end of a recording are padded with zeros.
+"""
+import json
+import math
+from os.path import expanduser
+from typing import Dict, List, Tuple
+
+import numpy as np
+import soundfile as sf
+import torch
+from scipy import ndimage
+
+from nemo.collections.asr.parts import manifest
+from nemo.collections.asr.parts.segment import AudioSegment
+
+__all__ = [
+    'SlidingWindowDataset',
+    'VADInference',
+    'merge_overlapping_windows',
+    'speech_segments',
+    'write_segments_manifest',
+]
+
+
+def _parse_item(line, manifest_file):
+    item = json.loads(line)
+    if 'audio_filepath' not in item:
+        raise ValueError(
+            f"Manifest file {manifest_file} has invalid json line structure: {line} without audio_filepath."
+        )
+    return dict(
+        audio_file=expanduser(item['audio_filepath']),
+        offset=item.get('offset', None) or 0.0,
+        duration=item.get('duration', None),
+    )
+
+
+class SlidingWindowDataset(torch.utils.data.IterableDataset):
+    """Streams the recordings of a manifest as overlapping windows, one centered on every frame.
+
+    Recordings at the target sample rate are read block by block, other ones are loaded whole and resampled. Every
+    DataLoader worker streams its share of the recordings.
+
+    Args:
+        manifest_filepath: Manifest of recordings, with "audio_filepath" and optional "offset" and "duration" keys.
+        sample_rate: Sample rate of the classifier.
+        window_length_in_sec: Length of the windows, the segment length the classifier was trained on.
+        shift_length_in_sec: Shift between windows, the frame length of the speech probabilities.
+        block_length_in_sec: Length of the blocks recordings are read in.
+
+    Items are tuples of a window of samples, its length, the index of its recording in the manifest, the index of
+    the window in its recording and the number of windows of the recording.
+    """
+
+    def __init__(
+        self,
+        manifest_filepath: str,
+        sample_rate: int = 16000,
+        window_length_in_sec: float = 0.63,
+        shift_length_in_sec: float = 0.01,
+        block_length_in_sec: float = 30.0,
+    ):
+        super().__init__()
+        self.items = list(manifest.item_iter(manifest_filepath, parse_func=_parse_item))
+        self.sample_rate = sample_rate
+        self.window = int(round(window_length_in_sec * sample_rate))
+        self.shift = int(round(shift_length_in_sec * sample_rate))
+        self.block = max(int(block_length_in_sec * sample_rate) // self.shift, 1) * self.shift
+        if self.shift <= 0 or self.window < self.shift:
+            raise ValueError("Windows must be at least as long as their shift, which must be at least one sample")
+        # Window t starts that many samples before frame t
+        self.left_pad = (self.window - self.shift) // 2
+
+    def __len__(self):
+        return len(self.items)
+
+    def _blocks(self, item):
+        # Yields the number of samples of the recording, then its samples in blocks
+        start, duration = item['offset'], item['duration']
+        with sf.SoundFile(item['audio_file'], 'r') as f:
+            if f.samplerate == self.sample_rate:
+                first = int(start * f.samplerate)
+                available = max(len(f) - first, 0)
+                num_samples = min(int(duration * f.samplerate), available) if duration else available
+                yield num_samples
+                f.seek(first)
+                remaining = num_samples
+                while remaining > 0:
+                    samples = f.read(min(self.block, remaining), dtype='float32', always_2d=True)
+                    if len(samples) == 0:
+                        break
+                    remaining -= len(samples)
+                    yield samples.mean(axis=1)
+                return
+        segment = AudioSegment.from_file(
+            item['audio_file'],
+            target_sr=self.sample_rate,
+            offset=start,
+            duration=duration or 0,
+            resample_type='polyphase',
+        )
+        yield segment.num_samples
+        yield segment.samples
+
+    def windows(self, item):
+        """Yields (window index, window samples, number of windows) of a manifest item, see `__iter__`."""
+        blocks = self._blocks(item)
+        num_samples = next(blocks)
+        num_windows = max(math.ceil(num_samples / self.shift), 1)
+        buffer = np.zeros(self.left_pad, dtype=np.float32)
+        # Sample position of buffer[0] in the recording
+        buffer_start = -self.left_pad
+        t = 0
+        for samples in blocks:
+            buffer = np.concatenate([buffer, samples.astype(np.float32, copy=False)])
+            while t < num_windows and t * self.shift - self.left_pad + self.window <= buffer_start + len(buffer):
+                begin = t * self.shift - self.left_pad - buffer_start
+                yield t, buffer[begin : begin + self.window], num_windows
+                t += 1
+            # Keeps the samples of the next windows
+            keep = t * self.shift - self.left_pad - buffer_start
+            buffer, buffer_start = buffer[keep:], buffer_start + keep
+        buffer = np.concatenate([buffer, np.zeros(self.window, dtype=np.float32)])
+        while t < num_windows:
+            begin = t * self.shift - self.left_pad - buffer_start
+            yield t, buffer[begin : begin + self.window], num_windows
+            t += 1
+
+    def __iter__(self):
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        for i in range(worker_id, len(self.items), num_workers):
+            for t, window, num_windows in self.windows(self.items[i]):
+                yield torch.from_numpy(window.copy()), self.window, i, t, num_windows
+
+
+class VADInference(object):
+    """Computes the frame speech probabilities of the recordings of a SlidingWindowDataset.
+
+    Args:
+        preprocessor: Preprocessor of the classifier, e.g. AudioToMFCCPreprocessor.
+        encoder: JasperEncoder.
+        decoder: JasperDecoderForClassification.
+        crop_pad: Optional CropOrPadSpectrogramAugmentation of the classifier, which pads window features to the
+            length of training segments.
+        speech_index: Index of the speech class in the decoder logits.
+        batch_size: Number of windows classified at once.
+        num_workers: Number of DataLoader workers that read and window the recordings.
+    """
+
+    def __init__(
+        self, preprocessor, encoder, decoder, crop_pad=None, speech_index=1, batch_size=256, num_workers=0,
+    ):
+        self.preprocessor = preprocessor
+        self.encoder = encoder
+        self.decoder = decoder
+        self.crop_pad = crop_pad
+        self.speech_index = speech_index
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        encoder.eval()
+        decoder.eval()
+
+    @torch.no_grad()
+    def window_probs(self, audio, audio_len):
+        """Speech probabilities (B) of a batch of windows (B, T)."""
+        device = next(self.encoder.parameters()).device
+        audio, audio_len = audio.to(device), audio_len.to(device)
+        features, features_len = self.preprocessor.forward(audio, audio_len)
+        if self.crop_pad is not None:
+            features, features_len = self.crop_pad.forward(features, features_len)
+        encoded, _ = self.encoder.forward(features, features_len)
+        logits = self.decoder.forward(encoded)
+        return logits.float().softmax(dim=-1)[:, self.speech_index].cpu().numpy()
+
+    def __call__(self, dataset: SlidingWindowDataset):
+        """Yields (manifest index, window speech probabilities) of every recording of the dataset once all of its
+        windows are classified.
+        """
+        loader = torch.utils.data.DataLoader(dataset, batch_size=self.batch_size, num_workers=self.num_workers)
+        probs: Dict[int, np.ndarray] = {}
+        remaining: Dict[int, int] = {}
+        for audio, audio_len, items, windows, num_windows in loader:
+            batch_probs = self.window_probs(audio, audio_len)
+            items, windows, num_windows = items.numpy(), windows.numpy(), num_windows.numpy()
+            for item in np.unique(items):
+                if item not in probs:
+                    count = int(num_windows[items == item][0])
+                    probs[item] = np.empty(count, dtype=np.float32)
+                    remaining[item] = count
+                selected = items == item
+                probs[item][windows[selected]] = batch_probs[selected]
+                remaining[item] -= int(selected.sum())
+                if remaining[item] == 0:
+                    del remaining[item]
+                    yield int(item), probs.pop(item)
+
+
+def merge_overlapping_windows(window_probs, window_length_in_sec=0.63, shift_length_in_sec=0.01):
+    """Per-frame speech probabilities, the mean of the probabilities of all windows that overlap every frame.
+
+    Args:
+        window_probs: Speech probabilities (T) of the windows centered on every frame.
+
+    Returns:
+        Frame speech probabilities (T).
+    """
+    window_probs = np.asarray(window_probs, dtype=np.float64)
+    half = int(round(window_length_in_sec / shift_length_in_sec)) // 2
+    cumulative = np.concatenate([[0.0], np.cumsum(window_probs)])
+    frames = np.arange(len(window_probs))
+    start = np.maximum(frames - half, 0)
+    end = np.minimum(frames + half + 1, len(window_probs))
+    return ((cumulative[end] - cumulative[start]) / (end - start)).astype(np.float32)
+
+
+def speech_segments(
+    frame_probs,
+    shift_length_in_sec=0.01,
+    onset=0.5,
+    offset=0.3,
+    median_filter_in_sec=0.25,
+    min_duration_on=0.1,
+    min_duration_off=0.2,
+    duration=None,
+) -> List[Tuple[float, float]]:
+    """Segments frame speech probabilities into speech segments.
+
+    Probabilities are smoothed by a median filter. Speech starts at a frame of probability at least `onset` and
+    continues while the probability stays at least `offset` (hysteresis), gaps shorter than `min_duration_off` are
+    bridged and segments shorter than `min_duration_on` are dropped.
+
+    Args:
+        frame_probs: Frame speech probabilities (T).
+        shift_length_in_sec: Frame length.
+        median_filter_in_sec: Length of the median filter, 0 to disable it.
+        duration: Duration of the recording, to clip the end of the last segment to.
+
+    Returns:
+        List of (start, end) times of the speech segments, in seconds.
+    """
+    probs = np.asarray(frame_probs, dtype=np.float32)
+    if offset > onset:
+        raise ValueError(f"offset ({offset}) must not be larger than onset ({onset})")
+    filter_size = int(round(median_filter_in_sec / shift_length_in_sec))
+    if filter_size > 1:
+        probs = ndimage.median_filter(probs, size=filter_size, mode='nearest')
+
+    # Runs of frames above offset, kept if one of their frames is above onset
+    above = np.concatenate([[False], probs >= offset, [False]])
+    changes = np.flatnonzero(np.diff(above.astype(np.int8)))
+    starts, ends = changes[::2], changes[1::2]
+    onsets = np.concatenate([[0], np.cumsum(probs >= onset)])
+    keep = onsets[ends] > onsets[starts]
+    starts, ends = starts[keep] * shift_length_in_sec, ends[keep] * shift_length_in_sec
+
+    if len(starts) > 1:
+        # Bridges short gaps, a segment starts after every long gap
+        long_gaps = starts[1:] - ends[:-1] >= min_duration_off
+        starts = starts[np.concatenate([[True], long_gaps])]
+        ends = ends[np.concatenate([long_gaps, [True]])]
+    if duration is not None:
+        ends = np.minimum(ends, duration)
+    keep = ends - starts >= min_duration_on
+    return [(float(start), float(end)) for start, end in zip(starts[keep], ends[keep])]
+
+
+def write_segments_manifest(manifest_filepath, segments, label='speech'):
+    """Writes speech segments as a manifest of "audio_filepath", "offset", "duration" and "label" lines.
+
+    Args:
+        manifest_filepath: Path of the manifest to write.
+        segments: Iterable of (audio file, offset of the recording in the file, [(start, end)] segments).
+        label: Label of the segments.
+
+    Returns:
+        Number of segments written.
+    """
+    num_segments = 0
+    with open(manifest_filepath, 'w') as f:
+        for audio_file, file_offset, file_segments in segments:
+            for start, end in file_segments:
+                entry = dict(
+                    audio_filepath=audio_file,
+                    offset=round(file_offset + start, 6),
+                    duration=round(end - start, 6),
+                    label=label,
+                )
+                f.write(json.dumps(entry) + '\n')
+                num_segments += 1
+    return num_segments
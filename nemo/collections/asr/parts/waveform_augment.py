@@ -0,0 +1,220 @@
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from nemo.collections.asr.parts import collections, parsers
+from nemo.collections.asr.parts.segment import AudioSegment
+
+try:
+    import torch.fft
+
+    HAVE_TORCH_FFT = True
+except ModuleNotFoundError:
+    # torch < 1.7 has no torch.fft module, only the torch.rfft and torch.irfft functions
+    HAVE_TORCH_FFT = False
+
+
+def load_noise_bank(manifest_path, sample_rate, max_duration=600.0):
+    """Reads the recordings of a noise manifest, concatenated into a single 1D tensor.
+
+    Args:
+        manifest_path: Manifest of noise files.
+        sample_rate: Sample rate to resample the noise to.
+        max_duration: Maximum total duration of the bank in seconds, recordings beyond it are skipped.
+    """
+    manifest = collections.ASRAudioText(manifest_path, parser=parsers.make_parser([]))
+    noises, total_duration = [], 0.0
+    for record in manifest:
+        if total_duration >= max_duration:
+            break
+        duration = min(record.duration, max_duration - total_duration)
+        noises.append(AudioSegment.from_file(record.audio_file, target_sr=sample_rate, duration=duration).samples)
+        total_duration += duration
+    return torch.from_numpy(np.concatenate(noises))
+
+
+def load_impulse_bank(manifest_path, sample_rate, max_duration=1.0):
+    """Reads the room impulse responses (RIRs) of a manifest, normalized as in ImpulsePerturbation.
+
+    Args:
+        manifest_path: Manifest of RIR files.
+        sample_rate: Sample rate to resample the RIRs to.
+        max_duration: RIRs are truncated to this duration in seconds.
+
+    Returns:
+        Zero padded RIRs (N, L) and their lengths (N).
+    """
+    manifest = collections.ASRAudioText(manifest_path, parser=parsers.make_parser([]))
+    impulses = []
+    for record in manifest:
+        impulse = AudioSegment.from_file(record.audio_file, target_sr=sample_rate).samples
+        impulse = (impulse - impulse.min()) / (impulse.max() - impulse.min())
+        impulses.append(torch.from_numpy(impulse[: int(max_duration * sample_rate)]))
+    lengths = torch.tensor([len(impulse) for impulse in impulses], dtype=torch.long)
+    return nn.utils.rnn.pad_sequence(impulses, batch_first=True), lengths
+
+
+def _fft_convolve(x, impulses, n_fft):
+    """Full linear convolutions of the rows of `x` and `impulses`, zero padded to `n_fft` samples."""
+    if HAVE_TORCH_FFT:
+        return torch.fft.irfft(torch.fft.rfft(x, n_fft) * torch.fft.rfft(impulses, n_fft), n_fft)
+    # Spectra of torch.rfft hold (real, imaginary) pairs in their last dimension
+    x_spec = torch.rfft(F.pad(x, [0, n_fft - x.shape[1]]), 1)
+    impulse_spec = torch.rfft(F.pad(impulses, [0, n_fft - impulses.shape[1]]), 1)
+    x_re, x_im = x_spec.unbind(-1)
+    impulse_re, impulse_im = impulse_spec.unbind(-1)
+    product = torch.stack([x_re * impulse_re - x_im * impulse_im, x_re * impulse_im + x_im * impulse_re], dim=-1)
+    return torch.irfft(product, 1, signal_sizes=(n_fft,))
+
+
+class WaveformAugment(nn.Module):
+    """
+    Applies gain, shift, noise and RIR perturbations to a padded batch of waveforms, with random parameters drawn
+    independently for every sample. Samples past their length stay zero.
+
+    Perturbations are applied in the order: impulse, shift, gain, noise, white noise. RIRs are convolved through
+    FFTs, with torch.fft on torch >= 1.7 and torch.rfft on older versions.
+
+    params:
+    sample_rate - sample rate of the waveforms
+    gain_prob, min_gain_dbfs, max_gain_dbfs - probability and range of gain (see GainPerturbation)
+    shift_prob, min_shift_ms, max_shift_ms - probability and range of shifts (see ShiftPerturbation)
+    white_noise_prob, min_white_noise_level, max_white_noise_level - probability and range of the level
+        of white noise in dB (see WhiteNoisePerturbation)
+    noise_prob, min_snr_db, max_snr_db - probability and SNR range of noise drawn from noise_bank
+    noise_bank - 1D tensor of concatenated noise recordings (see load_noise_bank)
+    impulse_prob - probability of convolution with an RIR drawn from impulse_bank
+    impulse_bank - zero padded RIRs (N, L) and their lengths (N) (see load_impulse_bank)
+    seed - seed of the random number generator, the global generator is used if None
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        gain_prob=0.0,
+        min_gain_dbfs=-10.0,
+        max_gain_dbfs=10.0,
+        shift_prob=0.0,
+        min_shift_ms=-5.0,
+        max_shift_ms=5.0,
+        white_noise_prob=0.0,
+        min_white_noise_level=-90.0,
+        max_white_noise_level=-46.0,
+        noise_prob=0.0,
+        min_snr_db=10.0,
+        max_snr_db=50.0,
+        noise_bank=None,
+        impulse_prob=0.0,
+        impulse_bank=None,
+        seed=None,
+    ):
+        super(WaveformAugment, self).__init__()
+
+        if noise_prob > 0 and noise_bank is None:
+            raise ValueError("Noise perturbation requires a noise bank.")
+        if impulse_prob > 0 and impulse_bank is None:
+            raise ValueError("Impulse perturbation requires an impulse bank.")
+
+        self.sample_rate = sample_rate
+        self.gain_prob = gain_prob
+        self.min_gain_dbfs = min_gain_dbfs
+        self.max_gain_dbfs = max_gain_dbfs
+        self.shift_prob = shift_prob
+        self.min_shift_ms = min_shift_ms
+        self.max_shift_ms = max_shift_ms
+        self.white_noise_prob = white_noise_prob
+        self.min_white_noise_level = min_white_noise_level
+        self.max_white_noise_level = max_white_noise_level
+        self.noise_prob = noise_prob
+        self.min_snr_db = min_snr_db
+        self.max_snr_db = max_snr_db
+        self.impulse_prob = impulse_prob
+        self.seed = seed
+        self._generator = None
+
+        self.register_buffer('noise_bank', noise_bank)
+        impulses, impulse_lengths = impulse_bank if impulse_bank is not None else (None, None)
+        self.register_buffer('impulses', impulses)
+        self.register_buffer('impulse_lengths', impulse_lengths)
+
+    def _get_generator(self, device):
+        if self.seed is None:
+            return None
+        if self._generator is None or self._generator.device != device:
+            self._generator = torch.Generator(device=device)
+            self._generator.manual_seed(self.seed)
+        return self._generator
+
+    def _uniform(self, low, high, size, x, generator):
+        return low + (high - low) * torch.rand(size, device=x.device, generator=generator)
+
+    def _selected(self, prob, x, generator):
+        return torch.rand(x.shape[0], device=x.device, generator=generator) < prob
+
+    @staticmethod
+    def _power(x, length, mask):
+        return (x * x * mask).sum(dim=1) / length.clamp(min=1)
+
+    def _impulse(self, x, length, mask, selected, generator):
+        batch_size, max_len = x.shape
+        idx = torch.randint(len(self.impulses), (batch_size,), device=x.device, generator=generator)
+        impulses, impulse_lengths = self.impulses[idx], self.impulse_lengths[idx]
+
+        # Same as signal.fftconvolve(x, impulse, "same") for every sample
+        n_fft = 1 << (max_len + impulses.shape[1] - 2).bit_length()
+        convolved = _fft_convolve(x, impulses, n_fft)
+        start = (impulse_lengths - 1) // 2
+        positions = start[:, None] + torch.arange(max_len, device=x.device)
+        convolved = convolved.gather(1, positions) * mask
+        return torch.where(selected[:, None], convolved, x)
+
+    def _shift(self, x, length, mask, selected, generator):
+        shift_ms = self._uniform(self.min_shift_ms, self.max_shift_ms, x.shape[0], x, generator)
+        shift = torch.floor(shift_ms * self.sample_rate / 1000).long()
+        # Like ShiftPerturbation, shifts longer than the audio are ignored
+        selected = selected & (shift.abs() < length)
+
+        positions = torch.arange(x.shape[1], device=x.device) + shift[:, None]
+        valid = (positions >= 0) & (positions < length[:, None])
+        shifted = x.gather(1, positions.clamp(0, x.shape[1] - 1)) * valid * mask
+        return torch.where(selected[:, None], shifted, x)
+
+    def _gain(self, x, length, mask, selected, generator):
+        gain_db = self._uniform(self.min_gain_dbfs, self.max_gain_dbfs, x.shape[0], x, generator)
+        gain = torch.where(selected, 10.0 ** (gain_db / 20.0), torch.ones_like(gain_db))
+        return x * gain[:, None]
+
+    def _noise(self, x, length, mask, selected, generator):
+        batch_size, max_len = x.shape
+        snr_db = self._uniform(self.min_snr_db, self.max_snr_db, batch_size, x, generator)
+        start = torch.randint(len(self.noise_bank), (batch_size,), device=x.device, generator=generator)
+        positions = (start[:, None] + torch.arange(max_len, device=x.device)) % len(self.noise_bank)
+        noise = self.noise_bank[positions] * mask
+
+        signal_power = self._power(x, length, mask)
+        noise_power = self._power(noise, length, mask).clamp(min=1e-10)
+        scale = torch.sqrt(signal_power / (noise_power * 10.0 ** (snr_db / 10.0)))
+        return x + noise * (scale * selected)[:, None]
+
+    def _white_noise(self, x, length, mask, selected, generator):
+        level_db = self._uniform(self.min_white_noise_level, self.max_white_noise_level, x.shape[0], x, generator)
+        noise = torch.randn(x.shape, device=x.device, generator=generator) * mask
+        return x + noise * (10.0 ** (level_db / 20.0) * selected)[:, None]
+
+    @torch.no_grad()
+    def forward(self, x, length):
+        generator = self._get_generator(x.device)
+        mask = (torch.arange(x.shape[1], device=x.device)[None, :] < length[:, None]).to(x.dtype)
+
+        for prob, perturb in (
+            (self.impulse_prob, self._impulse),
+            (self.shift_prob, self._shift),
+            (self.gain_prob, self._gain),
+            (self.noise_prob, self._noise),
+            (self.white_noise_prob, self._white_noise),
+        ):
+            if prob > 0:
+                x = perturb(x, length, mask, self._selected(prob, x, generator), generator)
+
+        return x
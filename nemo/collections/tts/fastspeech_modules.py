@@ -78,6 +78,10 @@ class FastSpeechDataLayer(DataLayerNM):
         num_workers (int): See PyTorch DataLoader.
             Defaults to 0.
         perturb_config (dict): Currently disabled.
+        resample_type (str): Resampler of audio files at other sample rates
+            than sample_rate, 'polyphase' or a librosa res_type, see
+            `nemo.collections.asr.parts.resample.resample`.
+            Defaults to 'kaiser_best'.
 
     """
 
@@ -112,11 +116,14 @@ class FastSpeechDataLayer(DataLayerNM):
         drop_last=False,
         shuffle=True,
         num_workers=0,
+        resample_type='kaiser_best',
     ):
         super().__init__()
 
         # Set up dataset.
-        self._featurizer = WaveformFeaturizer(sample_rate=sample_rate, int_values=int_values, augmentor=None)
+        self._featurizer = WaveformFeaturizer(
+            sample_rate=sample_rate, int_values=int_values, augmentor=None, resample_type=resample_type
+        )
         dataset_params = {
             'manifest_filepath': manifest_filepath,
             'labels': labels,
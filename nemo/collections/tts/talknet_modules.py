@@ -339,6 +339,7 @@ class TalkNetDataLayer(DataLayerNM):
         num_workers: int = 0,
         sampler_type: str = 'default',
         bd_aug: bool = False,
+        resample_type: str = 'kaiser_best',
     ):
         """Creates TalkNet data iterator.
 
@@ -369,12 +370,16 @@ class TalkNetDataLayer(DataLayerNM):
             num_workers: See PyTorch DataLoader.
             sampler_type: String id of sampler type to use.
             bd_aug: True if use augmentation for blanks/durs.
+            resample_type: Resampler of audio files at other sample rates than sample_rate, 'polyphase' or a librosa
+                res_type, see `nemo.collections.asr.parts.resample.resample`.
         """
 
         super().__init__()
 
         # Set up dataset.
-        self._featurizer = WaveformFeaturizer(sample_rate=sample_rate, int_values=int_values, augmentor=None)
+        self._featurizer = WaveformFeaturizer(
+            sample_rate=sample_rate, int_values=int_values, augmentor=None, resample_type=resample_type
+        )
         dataset_params = {
             'manifest_filepath': data,
             'labels': labels,
@@ -0,0 +1,138 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Micro-benchmark of the ASR collate functions in nemo.collections.asr.parts.dataset
+# against the previous per-sample pad-and-stack implementation, on random batches
+# of variable length utterances. Outputs of both are checked to be identical.
+
+import argparse
+import timeit
+
+import torch
+
+from nemo.collections.asr.parts.dataset import fixed_seq_collate_fn, seq_collate_fn
+
+parser = argparse.ArgumentParser(description="Benchmark ASR collate functions.")
+parser.add_argument("--batch_sizes", default="8,32,128", type=str, help="Comma-separated batch sizes.")
+parser.add_argument("--min_duration", default=1.0, type=float, help="Minimum utterance duration in seconds.")
+parser.add_argument("--max_duration", default=16.7, type=float, help="Maximum utterance duration in seconds.")
+parser.add_argument("--sample_rate", default=16000, type=int)
+parser.add_argument("--max_tokens", default=250, type=int, help="Maximum transcript length.")
+parser.add_argument("--repeats", default=20, type=int, help="Number of timed collate calls per setting.")
+parser.add_argument("--pin_memory", action='store_true', help="Also benchmark allocation in pinned memory.")
+args = parser.parse_args()
+
+
+def reference_seq_collate_fn(batch, token_pad_value=0):
+    _, audio_lengths, _, tokens_lengths = zip(*batch)
+    max_audio_len = max(audio_lengths).item()
+    max_tokens_len = max(tokens_lengths).item()
+
+    audio_signal, tokens = [], []
+    for sig, sig_len, tokens_i, tokens_i_len in batch:
+        sig_len = sig_len.item()
+        if sig_len < max_audio_len:
+            sig = torch.nn.functional.pad(sig, (0, max_audio_len - sig_len))
+        audio_signal.append(sig)
+        tokens_i_len = tokens_i_len.item()
+        if tokens_i_len < max_tokens_len:
+            tokens_i = torch.nn.functional.pad(tokens_i, (0, max_tokens_len - tokens_i_len), value=token_pad_value)
+        tokens.append(tokens_i)
+
+    return torch.stack(audio_signal), torch.stack(audio_lengths), torch.stack(tokens), torch.stack(tokens_lengths)
+
+
+def reference_fixed_seq_collate_fn(batch, fixed_length=16000):
+    _, audio_lengths, _, tokens_lengths = zip(*batch)
+    fixed_length = min(fixed_length, max(audio_lengths))
+
+    audio_signal, tokens = [], []
+    for sig, sig_len, tokens_i, _ in batch:
+        sig_len = sig_len.item()
+        chunck_len = sig_len - fixed_length
+        if chunck_len < 0:
+            repeat = fixed_length // sig_len
+            rem = fixed_length % sig_len
+            sub = sig[-rem:] if rem > 0 else torch.tensor([])
+            signal = torch.cat((torch.cat(repeat * [sig]), sub))
+        else:
+            start_idx = torch.randint(0, chunck_len, (1,)) if chunck_len else torch.tensor(0)
+            signal = sig[start_idx : start_idx + fixed_length]
+        audio_signal.append(signal)
+        tokens.append(tokens_i)
+
+    return torch.stack(audio_signal), torch.stack(audio_lengths), torch.stack(tokens), torch.stack(tokens_lengths)
+
+
+def make_batch(batch_size, fixed_tokens=False):
+    batch = []
+    for _ in range(batch_size):
+        duration = args.min_duration + (args.max_duration - args.min_duration) * torch.rand(1).item()
+        num_samples = int(duration * args.sample_rate)
+        num_tokens = 1 if fixed_tokens else torch.randint(1, args.max_tokens, (1,)).item()
+        batch.append(
+            (
+                torch.randn(num_samples),
+                torch.tensor(num_samples).long(),
+                torch.randint(0, 28, (num_tokens,)),
+                torch.tensor(num_tokens).long(),
+            )
+        )
+    return batch
+
+
+def check_equal(a, b, name):
+    for x, y in zip(a, b):
+        if not torch.equal(x, y):
+            raise RuntimeError(f"{name} output differs from the reference implementation.")
+
+
+def bench(fn, batch):
+    return min(timeit.repeat(lambda: fn(batch), number=1, repeat=args.repeats)) * 1000
+
+
+def main():
+    print(f"{'function':<24}{'batch':>8}{'reference, ms':>16}{'new, ms':>12}{'speedup':>10}")
+    for batch_size in map(int, args.batch_sizes.split(',')):
+        candidates = [
+            ('seq_collate_fn', reference_seq_collate_fn, seq_collate_fn, make_batch(batch_size)),
+            (
+                'fixed_seq_collate_fn',
+                reference_fixed_seq_collate_fn,
+                fixed_seq_collate_fn,
+                make_batch(batch_size, fixed_tokens=True),
+            ),
+        ]
+        if args.pin_memory and torch.cuda.is_available():
+            candidates.append(
+                (
+                    'seq_collate_fn (pinned)',
+                    reference_seq_collate_fn,
+                    lambda b: seq_collate_fn(b, pin_memory=True),
+                    make_batch(batch_size),
+                )
+            )
+
+        for name, reference, fn, batch in candidates:
+            torch.manual_seed(0)
+            expected = reference(batch)
+            torch.manual_seed(0)
+            check_equal(fn(batch), expected, name)
+
+            reference_ms, new_ms = bench(reference, batch), bench(fn, batch)
+            print(f"{name:<24}{batch_size:>8}{reference_ms:>16.2f}{new_ms:>12.2f}{reference_ms / new_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Throughput benchmark of the CTC prefix beam search in nemo.collections.asr.parts.ctc_beam_search
+# against greedy decoding, on random peaked log-probs of a character vocabulary. Beam search is run
+# in the calling process and with a pool of worker processes, optionally with an ARPA language model.
+
+import argparse
+import string
+import time
+
+import torch
+
+from nemo.collections.asr.greedy_ctc_decoder import ctc_greedy_collapse
+from nemo.collections.asr.helpers import post_process_predictions
+from nemo.collections.asr.parts.ctc_beam_search import CTCPrefixBeamSearch, NGramLanguageModel
+
+parser = argparse.ArgumentParser(description="Benchmark CTC beam search against greedy decoding.")
+parser.add_argument("--batch_size", default=32, type=int, help="Number of utterances per batch.")
+parser.add_argument("--batches", default=4, type=int, help="Number of timed batches.")
+parser.add_argument("--frames", default=400, type=int, help="Number of frames per utterance.")
+parser.add_argument("--beam_width", default=16, type=int)
+parser.add_argument("--cutoff_prob", default=0.99, type=float)
+parser.add_argument("--cutoff_top_n", default=8, type=int)
+parser.add_argument("--num_workers", default=4, type=int, help="Number of worker processes of the pool.")
+parser.add_argument("--lm", default=None, type=str, help="Optional path to an ARPA language model.")
+parser.add_argument("--alpha", default=1.0, type=float)
+parser.add_argument("--beta", default=1.0, type=float)
+args = parser.parse_args()
+
+VOCAB = [" "] + list(string.ascii_lowercase) + ["'"]
+
+
+def random_log_probs():
+    # Scaled logits give peaked distributions with a blank majority, as acoustic models do
+    logits = torch.randn(args.batch_size, args.frames, len(VOCAB) + 1) * 4
+    logits[:, :, -1] += 4
+    return logits.log_softmax(dim=-1)
+
+
+def utterances_per_second(decode, batches):
+    start = time.perf_counter()
+    for log_probs in batches:
+        results = decode(log_probs)
+        # Waits for asynchronous results
+        list(results)
+    return len(batches) * args.batch_size / (time.perf_counter() - start)
+
+
+def main():
+    batches = [random_log_probs() for _ in range(args.batches)]
+    language_model = NGramLanguageModel(args.lm) if args.lm is not None else None
+
+    def greedy(log_probs):
+        tokens, lengths = ctc_greedy_collapse(log_probs.argmax(dim=-1), blank_id=len(VOCAB))
+        return post_process_predictions([tokens], VOCAB, [lengths])
+
+    print(f"{'decoder':<24}{'utterances/s':>14}")
+    print(f"{'greedy':<24}{utterances_per_second(greedy, batches):>14.1f}")
+    for num_workers in sorted({0, args.num_workers}):
+        search = CTCPrefixBeamSearch(
+            VOCAB,
+            args.beam_width,
+            alpha=args.alpha,
+            beta=args.beta,
+            language_model=language_model,
+            cutoff_prob=args.cutoff_prob,
+            cutoff_top_n=args.cutoff_top_n,
+            num_workers=num_workers,
+        )
+        # Starts the worker processes outside of the timed region
+        list(search.decode_batch([batches[0][0].numpy()]))
+        speed = utterances_per_second(lambda log_probs: search.decode_batch(list(log_probs.numpy())), batches)
+        print(f"{f'beam, {num_workers} workers':<24}{speed:>14.1f}")
+        search.close()
+
+
+if __name__ == "__main__":
+    main()
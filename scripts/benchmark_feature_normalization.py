@@ -0,0 +1,85 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Micro-benchmark of normalize_batch in nemo.collections.asr.parts.features
+# against the previous per-utterance loop, on random batches of log-mel features
+# of variable length. Outputs of both are checked to match within float rounding.
+
+import argparse
+import timeit
+
+import torch
+
+from nemo.collections.asr.parts.features import CONSTANT, normalize_batch
+
+parser = argparse.ArgumentParser(description="Benchmark ASR feature normalization.")
+parser.add_argument("--batch_sizes", default="1,8,32,64,128,256", type=str, help="Comma-separated batch sizes.")
+parser.add_argument("--features", default=64, type=int, help="Number of features per frame.")
+parser.add_argument("--min_frames", default=100, type=int, help="Minimum utterance length in frames.")
+parser.add_argument("--max_frames", default=1670, type=int, help="Maximum utterance length in frames.")
+parser.add_argument("--device", default='cuda' if torch.cuda.is_available() else 'cpu', type=str)
+parser.add_argument("--repeats", default=10, type=int, help="Number of timed calls per setting.")
+args = parser.parse_args()
+
+
+def reference_normalize_batch(x, seq_len, normalize_type):
+    if normalize_type == "per_feature":
+        x_mean = torch.zeros((seq_len.shape[0], x.shape[1]), dtype=x.dtype, device=x.device)
+        x_std = torch.zeros((seq_len.shape[0], x.shape[1]), dtype=x.dtype, device=x.device)
+        for i in range(x.shape[0]):
+            x_mean[i, :] = x[i, :, : seq_len[i]].mean(dim=1)
+            x_std[i, :] = x[i, :, : seq_len[i]].std(dim=1)
+        x_std += CONSTANT
+        return (x - x_mean.unsqueeze(2)) / x_std.unsqueeze(2)
+    else:
+        x_mean = torch.zeros(seq_len.shape, dtype=x.dtype, device=x.device)
+        x_std = torch.zeros(seq_len.shape, dtype=x.dtype, device=x.device)
+        for i in range(x.shape[0]):
+            x_mean[i] = x[i, :, : seq_len[i].item()].mean()
+            x_std[i] = x[i, :, : seq_len[i].item()].std()
+        x_std += CONSTANT
+        return (x - x_mean.view(-1, 1, 1)) / x_std.view(-1, 1, 1)
+
+
+def bench(fn):
+    def call():
+        fn()
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+
+    call()
+    return min(timeit.repeat(call, number=1, repeat=args.repeats)) * 1000
+
+
+def main():
+    print(f"{'normalize':<16}{'batch':>8}{'reference, ms':>16}{'new, ms':>12}{'speedup':>10}")
+    for batch_size in map(int, args.batch_sizes.split(',')):
+        seq_len = torch.randint(args.min_frames, args.max_frames + 1, (batch_size,), device=args.device)
+        x = torch.randn(batch_size, args.features, args.max_frames, device=args.device)
+
+        for normalize_type in ("per_feature", "all_features"):
+            expected = reference_normalize_batch(x, seq_len, normalize_type)
+            if not torch.allclose(normalize_batch(x, seq_len, normalize_type), expected, atol=1e-5):
+                raise RuntimeError(f"{normalize_type} output differs from the reference implementation.")
+
+            reference_ms = bench(lambda: reference_normalize_batch(x, seq_len, normalize_type))
+            new_ms = bench(lambda: normalize_batch(x, seq_len, normalize_type))
+            print(
+                f"{normalize_type:<16}{batch_size:>8}{reference_ms:>16.2f}"
+                f"{new_ms:>12.2f}{reference_ms / new_ms:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# CPU latency benchmark of JasperEncoder.optimize_for_inference on QuartzNet 15x5 (or any other encoder config),
+# on random log-mel features. The encoder has random weights and batch norm statistics, or those of a checkpoint,
+# and the outputs of the optimized encoder are checked against the original one.
+
+import argparse
+import time
+
+import torch
+from ruamel.yaml import YAML
+
+import nemo
+import nemo.collections.asr as nemo_asr
+
+parser = argparse.ArgumentParser(description="Benchmark CPU inference of JasperEncoder before and after optimization.")
+parser.add_argument("--model_config", default="examples/asr/configs/quartznet15x5.yaml", type=str)
+parser.add_argument("--encoder_checkpoint", default=None, type=str, help="Optional JasperEncoder checkpoint.")
+parser.add_argument("--batch_sizes", default="1,8", type=str, help="Comma-separated batch sizes.")
+parser.add_argument("--seconds", default=10.0, type=float, help="Audio duration of every utterance.")
+parser.add_argument("--threads", default=0, type=int, help="Number of CPU threads, 0 keeps the torch default.")
+parser.add_argument("--repeats", default=5, type=int, help="Number of timed calls per setting.")
+args = parser.parse_args()
+
+
+def create_encoder(encoder_params):
+    encoder = nemo_asr.JasperEncoder(**encoder_params)
+    if args.encoder_checkpoint is not None:
+        encoder.restore_from(args.encoder_checkpoint)
+    else:
+        # Random statistics, so that folding is checked with batch norms that are not the identity
+        for module in encoder.modules():
+            if isinstance(module, torch.nn.BatchNorm1d):
+                module.running_mean.normal_(0.0, 0.1)
+                module.running_var.uniform_(0.5, 2.0)
+    return encoder.to('cpu')
+
+
+def latency(encoder, features, lengths):
+    with torch.no_grad():
+        encoder.forward(features, lengths)
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            encoder.forward(features, lengths)
+    return (time.perf_counter() - start) / args.repeats
+
+
+def main():
+    nemo.core.NeuralModuleFactory(placement=nemo.core.DeviceType.CPU)
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    with open(args.model_config) as f:
+        config = YAML(typ="safe").load(f)
+    if 'init_params' in config:
+        encoder_params = config['init_params']['encoder_params']['init_params']
+    else:
+        encoder_params = config['JasperEncoder']
+
+    encoder = create_encoder(encoder_params)
+    encoder.eval()
+    optimized = create_encoder(encoder_params)
+    optimized.load_state_dict(encoder.state_dict())
+    optimized.optimize_for_inference()
+
+    num_frames = int(args.seconds * 100)
+    print(f"{'batch':>6}{'baseline ms':>14}{'optimized ms':>14}{'speedup':>10}{'max abs diff':>16}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        features = torch.randn(batch_size, encoder_params['feat_in'], num_frames)
+        lengths = torch.full((batch_size,), num_frames, dtype=torch.long)
+        with torch.no_grad():
+            difference = (encoder.forward(features, lengths)[0] - optimized.forward(features, lengths)[0]).abs().max()
+        baseline, fast = latency(encoder, features, lengths), latency(optimized, features, lengths)
+        print(
+            f"{batch_size:>6}{baseline * 1000:>14.1f}{fast * 1000:>14.1f}{baseline / fast:>10.2f}"
+            f"{difference.item():>16.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Query latency benchmark of nemo.collections.asr.parts.speaker_index at 1M enrolled embeddings. Embeddings are
+# random utterances of random speakers (a speaker direction plus noise), queries are new utterances of enrolled
+# speakers. Exact blocked search is compared with IVF/PQ search at several nprobe and rerank settings, with the
+# recall of the exact top-k neighbours and the top-1 speaker identification accuracy.
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from nemo.collections.asr.parts.speaker_index import SpeakerIndex, build_speaker_index
+
+parser = argparse.ArgumentParser(description="Benchmark exact and IVF/PQ speaker index search.")
+parser.add_argument("--num_embeddings", default=1000000, type=int, help="Number of enrolled embeddings.")
+parser.add_argument("--num_speakers", default=50000, type=int)
+parser.add_argument("--dim", default=256, type=int, help="Embedding size.")
+parser.add_argument("--noise", default=0.8, type=float, help="Utterance noise relative to the speaker direction.")
+parser.add_argument("--num_queries", default=200, type=int)
+parser.add_argument("--batch_size", default=1, type=int, help="Number of queries per search call.")
+parser.add_argument("--k", default=10, type=int)
+parser.add_argument("--num_lists", default=4096, type=int)
+parser.add_argument("--num_subvectors", default=32, type=int)
+parser.add_argument("--index_dir", default=None, type=str, help="Index directory, a temporary one by default.")
+parser.add_argument("--seed", default=0, type=int)
+args = parser.parse_args()
+
+
+def utterances(rng, speakers, directions):
+    noise = rng.randn(len(speakers), args.dim).astype(np.float32) * args.noise / np.sqrt(args.dim)
+    return directions[speakers] + noise
+
+
+def timed_search(index, queries, **kwargs):
+    scores, indices = [], []
+    start = time.perf_counter()
+    for i in range(0, len(queries), args.batch_size):
+        batch_scores, batch_indices = index.search(queries[i : i + args.batch_size], k=args.k, **kwargs)
+        scores.append(batch_scores)
+        indices.append(batch_indices)
+    latency = (time.perf_counter() - start) / len(queries) * args.batch_size
+    return np.concatenate(scores), np.concatenate(indices), latency
+
+
+def main():
+    rng = np.random.RandomState(args.seed)
+    directions = rng.randn(args.num_speakers, args.dim).astype(np.float32) / np.sqrt(args.dim)
+    index_dir = args.index_dir or tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        index = None
+        for begin in range(0, args.num_embeddings, 100000):
+            speakers = rng.randint(0, args.num_speakers, min(100000, args.num_embeddings - begin))
+            labels = [str(s) for s in speakers]
+            if index is None:
+                index = build_speaker_index(index_dir, utterances(rng, speakers, directions), labels)
+            else:
+                index.add(utterances(rng, speakers, directions), labels)
+        print(f"Enrolled {len(index)} embeddings in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        index.train_ivf(num_lists=args.num_lists, num_subvectors=args.num_subvectors, seed=args.seed)
+        print(f"Trained IVF/PQ in {time.perf_counter() - start:.1f} s")
+        index = SpeakerIndex(index_dir)
+
+        query_speakers = rng.randint(0, args.num_speakers, args.num_queries)
+        queries = utterances(rng, query_speakers, directions)
+        _, exact, latency = timed_search(index, queries)
+
+        def report(name, indices, latency):
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(indices, exact)])
+            top1 = index.labels(indices[:, 0]).astype(str) == query_speakers.astype(str)
+            print(f"{name:<22}{latency * 1000:>12.2f}{recall:>12.3f}{top1.mean():>12.3f}")
+
+        print(f"{'search':<22}{'ms/batch':>12}{'recall@k':>12}{'top-1 acc':>12}")
+        report("exact", exact, latency)
+        for nprobe in (1, 8, 32, 128):
+            for rerank in (0, 10 * args.k):
+                _, indices, latency = timed_search(index, queries, nprobe=nprobe, rerank=rerank)
+                report(f"nprobe={nprobe} rerank={rerank}", indices, latency)
+    finally:
+        if args.index_dir is None:
+            shutil.rmtree(index_dir)
+
+
+if __name__ == "__main__":
+    main()
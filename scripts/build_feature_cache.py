@@ -0,0 +1,77 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This script precomputes the log-mel features of ASR manifests into a feature cache,
+# which AudioToTextDataLayer reads when given the same `feature_cache_dir`.
+# Preprocessor parameters are taken from the AudioToMelSpectrogramPreprocessor section
+# of the model config, so the cache matches the features the model is trained with.
+
+import argparse
+
+from ruamel.yaml import YAML
+
+from nemo.collections.asr.parts.feature_cache import build_feature_cache, open_feature_cache
+
+parser = argparse.ArgumentParser(description="Precompute log-mel features of ASR manifests into a feature cache.")
+parser.add_argument(
+    "--manifest_path", type=str, required=True, help="Path to the manifest(s), can be comma-separated.",
+)
+parser.add_argument("--cache_dir", type=str, required=True, help="Directory to create the feature cache in.")
+parser.add_argument(
+    "--model_config",
+    type=str,
+    required=True,
+    help="Model yaml config with an AudioToMelSpectrogramPreprocessor section.",
+)
+parser.add_argument("--sample_rate", default=16000, type=int, help="Sample rate to load audio with.")
+parser.add_argument("--int_values", action='store_true', help="Load audio as int values.")
+parser.add_argument("--trim_silence", action='store_true', help="Trim silence from beginning and end of audio.")
+parser.add_argument(
+    "--resample_type",
+    default='kaiser_best',
+    type=str,
+    help="Resampler of audio at other sample rates, 'polyphase' or a librosa res_type.",
+)
+parser.add_argument("--batch_size", default=32, type=int, help="Number of utterances to featurize at once.")
+parser.add_argument("--device", default='cpu', type=str, help="Device to compute features on, e.g. `cuda`.")
+parser.add_argument("--overwrite", action='store_true', help="Rebuild the cache even if it already exists.")
+args = parser.parse_args()
+
+
+def main():
+    yaml = YAML(typ="safe")
+    with open(args.model_config) as f:
+        config = yaml.load(f)
+    preprocessor_config = config['AudioToMelSpectrogramPreprocessor'].get('init_params', {})
+
+    cache_params = {
+        'manifests_files': args.manifest_path,
+        'cache_root': args.cache_dir,
+        'preprocessor_config': preprocessor_config,
+        'sample_rate': args.sample_rate,
+        'int_values': args.int_values,
+        'trim': args.trim_silence,
+        'resample_type': args.resample_type,
+    }
+    cache = None if args.overwrite else open_feature_cache(**cache_params)
+    if cache is not None:
+        print(f"Feature cache is up to date in {cache.cache_dir}.")
+        return
+
+    cache = build_feature_cache(**cache_params, batch_size=args.batch_size, device=args.device)
+    print(f"Cached features of {len(cache)} entries in {cache.cache_dir}.")
+
+
+if __name__ == "__main__":
+    main()
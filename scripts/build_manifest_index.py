@@ -0,0 +1,60 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This script compiles ASR json manifests into a memory-mapped manifest index
+# that can be passed to AudioToTextDataLayer as `manifest_index`.
+# The labels and parser settings must match the ones used by the data layer.
+
+import argparse
+
+from ruamel.yaml import YAML
+
+from nemo.collections.asr.parts.manifest_index import build_manifest_index
+from nemo.collections.asr.parts.parsers import make_parser
+
+parser = argparse.ArgumentParser(description="Compile ASR manifests into a memory-mapped manifest index.")
+parser.add_argument(
+    "--manifest_path", type=str, required=True, help="Path to the manifest(s), can be comma-separated.",
+)
+parser.add_argument("--index_dir", type=str, required=True, help="Directory to write the index to.")
+parser.add_argument(
+    "--model_config",
+    type=str,
+    required=True,
+    help="Model yaml config to take labels from (`labels` key or the CTC decoder vocabulary).",
+)
+parser.add_argument("--parser", default='en', type=str, help="Transcript parser name, `en` or `base`.")
+parser.add_argument(
+    "--no_normalize_transcripts", action='store_true', help="Disable transcript normalization in the parser.",
+)
+args = parser.parse_args()
+
+
+def main():
+    yaml = YAML(typ="safe")
+    with open(args.model_config) as f:
+        config = yaml.load(f)
+
+    if 'labels' in config:
+        labels = config['labels']
+    else:
+        labels = config['init_params']['decoder_params']['init_params']['vocabulary']
+
+    text_parser = make_parser(labels=labels, name=args.parser, do_normalize=not args.no_normalize_transcripts)
+    index = build_manifest_index(args.manifest_path, args.index_dir, parser=text_parser)
+    print(f"Indexed {len(index)} entries into {args.index_dir}.")
+
+
+if __name__ == "__main__":
+    main()
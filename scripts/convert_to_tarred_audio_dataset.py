@@ -15,12 +15,30 @@
 # This script converts an existing audio dataset with a manifest to
 # a tarred and sharded audio dataset that can be read by the
 # TarredAudioToTextDataLayer.
+# Next to every tarball `audio_{i}.tar` it writes a member offset index
+# `audio_{i}.index`, used by TarredAudioToTextDataLayer(random_access=True),
+# and statistics of all shards into `shard_stats.json`.
+#
+# Shards are written in parallel by a pool of `--num_workers` processes.
+# Entries are split into shards of (nearly) equal total duration by default,
+# keeping their order, so that ranks reading different shards finish
+# at the same time. Audio can optionally be resampled and/or converted to
+# 16-bit PCM wav on the way into the tarballs.
 
 import argparse
+import io
 import json
+import multiprocessing
 import os
 import random
 import tarfile
+from functools import partial
+
+import numpy as np
+import soundfile as sf
+
+from nemo.collections.asr.parts.segment import AudioSegment
+from nemo.collections.asr.parts.tar_index import write_tar_index
 
 parser = argparse.ArgumentParser(
     description="Convert an existing ASR dataset to tarballs compatible with TarredAudioToTextDataLayer."
@@ -47,22 +65,66 @@ parser.add_argument(
     action='store_true',
     help="Whether or not to randomly shuffle the samples in the manifest before tarring/sharding.",
 )
+parser.add_argument(
+    "--balance_by",
+    default='duration',
+    choices=['duration', 'bytes', 'count'],
+    help="What to balance between shards: total audio duration, total file size or number of entries.",
+)
+parser.add_argument(
+    "--sort_in_shard", action='store_true', help="Whether to sort the entries of every shard by duration.",
+)
+parser.add_argument(
+    "--target_sr", default=None, type=int, help="If set, audio is resampled to this sample rate and stored as wav.",
+)
+parser.add_argument("--int16", action='store_true', help="Whether to store audio as 16-bit PCM wav.")
+parser.add_argument(
+    "--num_workers", default=os.cpu_count(), type=int, help="Number of processes writing shards in parallel.",
+)
 args = parser.parse_args()
 
 
-def create_shard(entries, target_dir, new_entries, shard_id):
-    """Creates a tarball containing the audio files from `entries`.
+def squash_filename(audio_filepath, ext=None):
+    """Flattens the path of an audio file into a name for the tarball, as directories are not preserved."""
+    base, orig_ext = os.path.splitext(audio_filepath)
+    base = base.replace('/', '_')
+    # Need the following replacement as long as WebDataset splits on first period
+    base = base.replace('.', '_')
+    return f'{base}{ext or orig_ext}'
+
+
+def transcode(audio_filepath, target_sr, int16):
+    """Reads an audio file and returns it as wav bytes with the given sample rate and sample format."""
+    segment = AudioSegment.from_file(audio_filepath, target_sr=target_sr)
+    buffer = io.BytesIO()
+    sf.write(buffer, segment.samples, segment.sample_rate, format='WAV', subtype='PCM_16' if int16 else 'FLOAT')
+    return buffer.getvalue()
+
+
+def create_shard(shard, target_dir, sort_in_shard=False, target_sr=None, int16=False):
+    """Creates a tarball containing the audio files from `entries`, along with its member offset index.
+
+    Returns:
+        The manifest entries of the shard and its statistics.
     """
-    tar = tarfile.open(os.path.join(target_dir, f'audio_{shard_id}.tar'), mode='w')
+    shard_id, entries = shard
+    if sort_in_shard:
+        entries = sorted(entries, key=lambda entry: entry['duration'])
+
+    tar_path = os.path.join(target_dir, f'audio_{shard_id}.tar')
+    tar = tarfile.open(tar_path, mode='w')
 
+    new_entries = []
     for entry in entries:
-        # We squash the filename since we do not preserve directory structure of audio files in the tarball.
-        base, ext = os.path.splitext(entry['audio_filepath'])
-        base = base.replace('/', '_')
-        # Need the following replacement as long as WebDataset splits on first period
-        base = base.replace('.', '_')
-        squashed_filename = f'{base}{ext}'
-        tar.add(entry['audio_filepath'], arcname=squashed_filename)
+        if target_sr is not None or int16:
+            squashed_filename = squash_filename(entry['audio_filepath'], ext='.wav')
+            audio = transcode(entry['audio_filepath'], target_sr, int16)
+            tarinfo = tarfile.TarInfo(squashed_filename)
+            tarinfo.size = len(audio)
+            tar.addfile(tarinfo, io.BytesIO(audio))
+        else:
+            squashed_filename = squash_filename(entry['audio_filepath'])
+            tar.add(entry['audio_filepath'], arcname=squashed_filename)
 
         new_entry = {
             'audio_filepath': squashed_filename,
@@ -73,6 +135,37 @@ def create_shard(entries, target_dir, new_entries, shard_id):
         new_entries.append(new_entry)
 
     tar.close()
+    write_tar_index(tar_path)
+
+    durations = [entry['duration'] for entry in entries]
+    stats = {
+        'shard_id': shard_id,
+        'num_entries': len(entries),
+        'duration': sum(durations),
+        'min_duration': min(durations, default=0.0),
+        'max_duration': max(durations, default=0.0),
+        'bytes': os.path.getsize(tar_path),
+    }
+    return new_entries, stats
+
+
+def split_entries(entries, num_shards, balance_by):
+    """Splits entries into `num_shards` consecutive chunks with (nearly) equal totals of the balanced quantity."""
+    if balance_by == 'count':
+        weights = np.ones(len(entries))
+    elif balance_by == 'duration':
+        weights = np.array([entry['duration'] for entry in entries], dtype=np.float64)
+    else:
+        weights = np.array([os.path.getsize(entry['audio_filepath']) for entry in entries], dtype=np.float64)
+
+    # Cut next to the entry whose running total is closest to each multiple of total / num_shards
+    cumulative = np.cumsum(weights)
+    targets = cumulative[-1] * np.arange(1, num_shards) / num_shards
+    idx = np.minimum(np.searchsorted(cumulative, targets), len(entries) - 1)
+    prev = np.where(idx > 0, cumulative[idx - 1], 0.0)
+    cuts = idx + (cumulative[idx] - targets < targets - prev)
+    bounds = [0] + cuts.tolist() + [len(entries)]
+    return [entries[bounds[i] : bounds[i + 1]] for i in range(num_shards)]
 
 
 def main():
@@ -94,16 +187,23 @@ def main():
         print("Shuffling...")
         random.shuffle(entries)
 
-    # Create shards and updated manifest entries
-    new_entries = []
-    for i in range(num_shards):
-        start_idx = (len(entries) // num_shards) * i
-        end_idx = start_idx + (len(entries) // num_shards)
-        if i == num_shards - 1:
-            end_idx = len(entries)  # Last shard gets the leftovers.
-        print(f"Shard {i} will have {end_idx - start_idx} entries.")
+    shards = split_entries(entries, num_shards, args.balance_by)
+    for i, shard_entries in enumerate(shards):
+        print(f"Shard {i} will have {len(shard_entries)} entries.")
 
-        create_shard(entries[start_idx:end_idx], target_dir, new_entries, i)
+    # Create shards and updated manifest entries
+    worker = partial(
+        create_shard,
+        target_dir=target_dir,
+        sort_in_shard=args.sort_in_shard,
+        target_sr=args.target_sr,
+        int16=args.int16,
+    )
+    with multiprocessing.Pool(max(1, min(args.num_workers, num_shards))) as pool:
+        results = pool.map(worker, enumerate(shards), chunksize=1)
+
+    new_entries = [entry for shard_entries, _ in results for entry in shard_entries]
+    stats = [shard_stats for _, shard_stats in results]
 
     # Write manifest
     new_manifest_path = os.path.join(target_dir, 'tarred_audio_manifest.json')
@@ -112,6 +212,14 @@ def main():
             json.dump(entry, m2)
             m2.write('\n')
 
+    with open(os.path.join(target_dir, 'shard_stats.json'), 'w') as f:
+        json.dump(stats, f, indent=2)
+
+    durations = [shard_stats['duration'] for shard_stats in stats]
+    sizes = [shard_stats['bytes'] for shard_stats in stats]
+    print(f"Shard durations: min {min(durations):.1f}s, max {max(durations):.1f}s.")
+    print(f"Shard sizes: min {min(sizes)} bytes, max {max(sizes)} bytes.")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,103 @@
+# Copyright 2020 NVIDIA. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Post-training int8 quantization of the encoder and decoder of a Jasper/QuartzNet model for CPU inference, see
+# nemo.collections.asr.parts.quantization. Activation ranges are calibrated on a manifest read by
+# AudioToTextDataLayer, the quantized checkpoints are written with save_to, and greedy WER and real-time factor
+# (processing time of the whole pipeline, data loading included, over audio duration) of the fp32, BatchNorm folded
+# and int8 models are reported on an evaluation manifest.
+
+import argparse
+import os
+import time
+
+import torch
+
+import nemo
+import nemo.collections.asr as nemo_asr
+from nemo.collections.asr.helpers import post_process_predictions, post_process_transcripts, word_error_rate
+from nemo.collections.asr.parts import quantization
+
+parser = argparse.ArgumentParser(description="Quantize an ASR model to int8 and compare it with fp32.")
+parser.add_argument("--asr_model", default="QuartzNet15x5-En", type=str, help="NGC model name or .nemo file.")
+parser.add_argument("--calibration_manifest", required=True, type=str, help="A few hundred utterances suffice.")
+parser.add_argument("--eval_manifest", required=True, type=str)
+parser.add_argument("--batch_size", default=8, type=int)
+parser.add_argument("--sample_rate", default=16000, type=int)
+parser.add_argument("--backend", default="fbgemm", choices=["fbgemm", "qnnpack"], help="Quantized engine.")
+parser.add_argument("--threads", default=0, type=int, help="Number of CPU threads, 0 keeps the torch default.")
+parser.add_argument("--output_dir", default="int8_checkpoints", type=str, help="Where to save the int8 modules.")
+args = parser.parse_args()
+
+
+def run(nf, preprocessor, encoder, decoder, manifest, vocabulary, return_predictions=True):
+    data_layer = nemo_asr.AudioToTextDataLayer(
+        manifest_filepath=manifest,
+        labels=vocabulary,
+        batch_size=args.batch_size,
+        sample_rate=args.sample_rate,
+        shuffle=False,
+    )
+    audio_signal, audio_signal_len, transcript, transcript_len = data_layer()
+    processed_signal, processed_signal_len = preprocessor(input_signal=audio_signal, length=audio_signal_len)
+    encoded, encoded_len = encoder(audio_signal=processed_signal, length=processed_signal_len)
+    log_probs = decoder(encoder_output=encoded)
+    if not return_predictions:
+        nf.infer(tensors=[log_probs], verbose=False)
+        return None
+    predictions = nemo_asr.GreedyCTCDecoder()(log_probs=log_probs)
+
+    start = time.perf_counter()
+    evaluated = nf.infer(tensors=[predictions, transcript, transcript_len, audio_signal_len], verbose=False)
+    elapsed = time.perf_counter() - start
+
+    hypotheses = post_process_predictions(evaluated[0], vocabulary)
+    references = post_process_transcripts(evaluated[1], evaluated[2], vocabulary)
+    duration = sum(lengths.sum().item() for lengths in evaluated[3]) / args.sample_rate
+    return word_error_rate(hypotheses=hypotheses, references=references), elapsed / duration
+
+
+def main():
+    nf = nemo.core.NeuralModuleFactory(placement=nemo.core.DeviceType.CPU)
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    asr_model = nemo_asr.models.ASRConvCTCModel.from_pretrained(model_info=args.asr_model)
+    asr_model.eval()
+    preprocessor, encoder, decoder = asr_model._preprocessor, asr_model._encoder, asr_model._decoder
+    vocabulary = asr_model.vocabulary
+
+    report = [("fp32", *run(nf, preprocessor, encoder, decoder, args.eval_manifest, vocabulary))]
+
+    encoder.optimize_for_inference()
+    report.append(("fp32 folded", *run(nf, preprocessor, encoder, decoder, args.eval_manifest, vocabulary)))
+
+    quantization.prepare_int8(encoder, backend=args.backend)
+    quantization.prepare_int8(decoder, backend=args.backend)
+    run(nf, preprocessor, encoder, decoder, args.calibration_manifest, vocabulary, return_predictions=False)
+    quantization.convert_int8(encoder)
+    quantization.convert_int8(decoder)
+    report.append(("int8", *run(nf, preprocessor, encoder, decoder, args.eval_manifest, vocabulary)))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    encoder.save_to(os.path.join(args.output_dir, "JasperEncoder-int8.pt"))
+    decoder.save_to(os.path.join(args.output_dir, "JasperDecoderForCTC-int8.pt"))
+
+    print(f"{'model':<14}{'WER %':>8}{'RTF':>10}")
+    for name, wer, rtf in report:
+        print(f"{name:<14}{wer * 100:>8.2f}{rtf:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
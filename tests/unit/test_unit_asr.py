@@ -16,18 +16,54 @@
 # limitations under the License.
 # =============================================================================
 
+import itertools
+import json
 import os
+import pickle
+import random
 import shutil
 import tarfile
+import tempfile
 import unittest
 from unittest import TestCase
 
+import kaldi_io
+import librosa
+import numpy as np
 import pytest
+import soundfile as sf
+import torch
 from ruamel.yaml import YAML
+from scipy import signal
 
 import nemo
 import nemo.collections.asr as nemo_asr
-from nemo.collections.asr.parts import AudioDataset, WaveformFeaturizer, collections, parsers
+from nemo.collections.asr.greedy_ctc_decoder import ctc_greedy_collapse
+from nemo.collections.asr.helpers import post_process_predictions, post_process_transcripts
+from nemo.collections.asr.metrics import WERAccumulator, word_error_rate
+from nemo.collections.asr.parts import (
+    AudioDataset,
+    WaveformFeaturizer,
+    audio_cache,
+    collections,
+    ctc_beam_search,
+    feature_cache,
+    features,
+    manifest_index,
+    parsers,
+    perturb,
+    quantization,
+    resample,
+    silence,
+    speaker_index,
+    speaker_scoring,
+    streaming,
+    tar_index,
+    vad,
+)
+from nemo.collections.asr.parts.dataset import KaldiFeatureDataset, fixed_seq_collate_fn, seq_collate_fn
+from nemo.collections.asr.parts.samplers import DurationBucketingBatchSampler, TarredShardSampler
+from nemo.collections.asr.parts.segment import AudioSegment
 from nemo.core import DeviceType
 from nemo.utils import logging
 
@@ -175,6 +211,55 @@ class TestUnitASRPytorch(TestCase):
             # logging.info(ds[i][0].shape)
             # self.assertEqual(freq, ds[i][0].shape[0])
 
+    @pytest.mark.unit
+    def test_manifest_index(self):
+        parser = parsers.make_parser(self.labels, 'en')
+        index_dir = tempfile.mkdtemp()
+        try:
+            manifest_index.build_manifest_index(self.manifest_filepath, index_dir, parser=parser)
+
+            for kwargs in (
+                {},
+                {'min_duration': 1.5, 'max_duration': 3.0},
+                {'max_number': 5},
+                {'do_sort_by_duration': True},
+            ):
+                expected = collections.ASRAudioText(manifests_files=self.manifest_filepath, parser=parser, **kwargs)
+                indexed = collections.IndexedASRAudioText(index_dir, parser=parser, **kwargs)
+                self.assertEqual(len(expected), len(indexed))
+                for e, i in zip(expected, indexed):
+                    self.assertEqual(e, i)
+
+            # Index must not be used with a parser producing different tokens
+            with self.assertRaises(ValueError):
+                collections.IndexedASRAudioText(index_dir, parser=parsers.make_parser(self.labels[:-1], 'en'))
+
+            # Pickles hold the index directory, not copies of the arrays
+            index = manifest_index.ManifestIndex(index_dir)
+            pickled = pickle.dumps(index)
+            array_bytes = sum(os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir))
+            self.assertLess(len(pickled), array_bytes / 4)
+            unpickled = pickle.loads(pickled)
+            self.assertIsInstance(unpickled.durations, np.memmap)
+            for i in range(len(index)):
+                self.assertEqual(unpickled.text(i), index.text(i))
+
+            featurizer = WaveformFeaturizer.from_config(self.featurizer_config)
+            ds = AudioDataset(
+                manifest_filepath=self.manifest_filepath,
+                labels=self.labels,
+                featurizer=featurizer,
+                manifest_index=index_dir,
+            )
+            ds_expected = AudioDataset(
+                manifest_filepath=self.manifest_filepath, labels=self.labels, featurizer=featurizer
+            )
+            self.assertEqual(len(ds), len(ds_expected))
+            for a, b in zip(ds[0], ds_expected[0]):
+                self.assertTrue(torch.equal(a, b))
+        finally:
+            shutil.rmtree(index_dir)
+
     @pytest.mark.unit
     def test_dataloader(self):
         batch_size = 4
@@ -200,6 +285,281 @@ class TestUnitASRPytorch(TestCase):
             self.assertTrue(data[2].size(0) == batch_size)
             self.assertTrue(data[3].size(0) == batch_size)
 
+    @pytest.mark.unit
+    def test_duration_bucketing_sampler(self):
+        durations = [0.5 + (i * 7 % 23) / 4 for i in range(100)]
+        max_batch_duration = 16.0
+
+        def make_sampler(**kwargs):
+            return DurationBucketingBatchSampler(
+                durations, max_batch_duration=max_batch_duration, num_buckets=4, **kwargs
+            )
+
+        # Batches stay within the padded audio budget and all ranks together cover the whole dataset
+        samplers = [make_sampler(num_replicas=3, rank=rank) for rank in range(3)]
+        seen = set()
+        for sampler in samplers:
+            batches = list(sampler)
+            self.assertEqual(len(batches), len(sampler))
+            for batch in batches:
+                if len(batch) > 1:
+                    self.assertLessEqual(len(batch) * max(durations[i] for i in batch), max_batch_duration)
+                seen.update(batch)
+        self.assertEqual(seen, set(range(len(durations))))
+        self.assertEqual(len({len(sampler) for sampler in samplers}), 1)
+
+        # Order changes between epochs, but is reproducible
+        sampler = make_sampler()
+        first_epoch = list(sampler)
+        sampler.set_epoch(1)
+        second_epoch = list(sampler)
+        self.assertNotEqual(first_epoch, second_epoch)
+        sampler.set_epoch(0)
+        self.assertEqual(list(sampler), first_epoch)
+
+        # Resume from the middle of an epoch
+        it = iter(sampler)
+        for _ in range(5):
+            next(it)
+        resumed = make_sampler()
+        resumed.load_state_dict(sampler.state_dict())
+        self.assertEqual(list(resumed), first_epoch[5:])
+
+        with self.assertRaises(ValueError):
+            DurationBucketingBatchSampler(durations)
+
+        # Data layer yields variable sized batches
+        dl = nemo_asr.AudioToTextDataLayer(
+            manifest_filepath=self.manifest_filepath, labels=self.labels, batch_size=4, max_batch_duration=20.0,
+        )
+        num_samples = 0
+        for audio, audio_len, _, _ in dl.data_iterator:
+            self.assertLessEqual(audio.size(0) * audio.size(1), 20.0 * freq)
+            num_samples += audio.size(0)
+        self.assertEqual(num_samples, len(dl))
+
+    @pytest.mark.unit
+    def test_seq_collate_fn(self):
+        lengths = [5, 3, 7]
+        batch = [
+            (torch.randn(n), torch.tensor(n).long(), torch.arange(1, n), torch.tensor(n - 1).long()) for n in lengths
+        ]
+        audio, audio_len, tokens, tokens_len = seq_collate_fn(batch, token_pad_value=-1)
+        self.assertEqual(audio.shape, (3, 7))
+        self.assertEqual(tokens.shape, (3, 6))
+        self.assertEqual(audio_len.tolist(), lengths)
+        self.assertEqual(tokens_len.tolist(), [n - 1 for n in lengths])
+        for i, n in enumerate(lengths):
+            self.assertTrue(torch.equal(audio[i, :n], batch[i][0]))
+            self.assertTrue(torch.all(audio[i, n:] == 0))
+            self.assertTrue(torch.equal(tokens[i, : n - 1], batch[i][2]))
+            self.assertTrue(torch.all(tokens[i, n - 1 :] == -1))
+
+        # Scalar labels and no audio
+        batch = [(None, None, torch.tensor(label).long(), torch.tensor(1).long()) for label in (2, 0, 1)]
+        audio, audio_len, labels, _ = seq_collate_fn(batch)
+        self.assertIsNone(audio)
+        self.assertIsNone(audio_len)
+        self.assertEqual(labels.tolist(), [2, 0, 1])
+
+        # Short signals are repeated, long ones are cropped
+        batch = [(torch.arange(n).float(), torch.tensor(n).long(), torch.tensor(0), torch.tensor(1)) for n in (3, 12)]
+        audio, _, _, _ = fixed_seq_collate_fn(batch, fixed_length=8)
+        self.assertEqual(audio[0].tolist(), [0, 1, 2, 0, 1, 2, 1, 2])
+        self.assertEqual(audio[1].tolist(), list(range(int(audio[1, 0]), int(audio[1, 0]) + 8)))
+
+    @pytest.mark.unit
+    def test_feature_cache(self):
+        preprocessor_config = {'stft_conv': True, 'dither': 0.0, 'n_fft': 512}
+        cache_root = tempfile.mkdtemp()
+        try:
+            cache = feature_cache.build_feature_cache(
+                self.manifest_filepath, cache_root, preprocessor_config, batch_size=1, shard_size=2 ** 16
+            )
+            self.assertGreater(cache.meta['num_shards'], 1)
+
+            featurizer = WaveformFeaturizer.from_config(self.featurizer_config)
+            filterbank = feature_cache._filterbank_features(
+                feature_cache._canonical_config(preprocessor_config, sample_rate=freq)
+            )
+            filterbank.eval()
+            collection = collections.ASRAudioText(
+                manifests_files=self.manifest_filepath, parser=parsers.make_parser(self.labels, 'en')
+            )
+            for sample in (collection[i] for i in range(3)):
+                audio = featurizer.process(sample.audio_file, duration=sample.duration)
+                with torch.no_grad():
+                    expected = filterbank(audio.unsqueeze(0), torch.tensor([len(audio)]))[0]
+                cached = torch.from_numpy(cache.features(sample.id).astype('float32'))
+                self.assertEqual(cached.shape[1], cache.num_frames(sample.id))
+                self.assertTrue(torch.allclose(cached, expected[:, : cached.shape[1]], atol=1e-2, rtol=1e-2))
+
+            # Same settings reuse the cache, changed settings get their own
+            key = feature_cache.feature_cache_key(self.manifest_filepath, preprocessor_config)
+            self.assertEqual(key, os.path.basename(cache.cache_dir))
+            self.assertEqual(key, feature_cache.feature_cache_key(self.manifest_filepath, dict(preprocessor_config)))
+            changed = dict(preprocessor_config, features=80)
+            self.assertNotEqual(key, feature_cache.feature_cache_key(self.manifest_filepath, changed))
+            self.assertIsNone(feature_cache.open_feature_cache(self.manifest_filepath, cache_root, changed))
+
+            dl = nemo_asr.AudioToTextDataLayer(
+                manifest_filepath=self.manifest_filepath,
+                labels=self.labels,
+                batch_size=4,
+                feature_cache_dir=cache_root,
+                preprocessor_config=preprocessor_config,
+            )
+            self.assertIn('processed_signal', dl.output_ports)
+            self.assertEqual(os.listdir(cache_root), [key])
+            for features, features_len, _, _ in dl.data_iterator:
+                self.assertEqual(features.shape[1], 64)
+                self.assertEqual(features.shape[2] % 16, 0)
+                self.assertEqual(features.shape[2] - 16 < features_len.max() <= features.shape[2], True)
+
+            with self.assertRaises(ValueError):
+                nemo_asr.AudioToTextDataLayer(
+                    manifest_filepath=self.manifest_filepath,
+                    labels=self.labels,
+                    batch_size=4,
+                    feature_cache_dir=cache_root,
+                    augmentor={'shift': {'prob': 1.0}},
+                )
+        finally:
+            shutil.rmtree(cache_root)
+
+    @pytest.mark.unit
+    def test_shared_audio_cache(self):
+        cache = audio_cache.SharedAudioCache(num_entries=4, max_bytes=4000)
+        try:
+            samples = np.arange(300, dtype=np.float32)
+            cache.put(0, samples)
+            self.assertTrue(np.array_equal(cache.get(0), samples))
+            self.assertIsNone(cache.get(1))
+
+            # Cached samples are visible to forked workers and the other way around
+            def put_in_worker():
+                cache.put(1, np.ones(400, dtype=np.float32))
+
+            worker = torch.multiprocessing.get_context('fork').Process(target=put_in_worker)
+            worker.start()
+            worker.join()
+            self.assertTrue(np.array_equal(cache.get(1), np.ones(400, dtype=np.float32)))
+
+            # Wrapping around the ring buffer evicts the oldest entries, too large samples are not cached
+            cache.put(2, np.zeros(600, dtype=np.float32))
+            self.assertIsNone(cache.get(0))
+            self.assertIsNone(cache.get(1))
+            self.assertEqual(len(cache.get(2)), 600)
+            cache.put(3, np.zeros(1001, dtype=np.float32))
+            self.assertIsNone(cache.get(3))
+        finally:
+            cache.close()
+        self.assertFalse(os.path.exists(cache.path))
+
+        # A cache larger than the free space of its directory is refused, writes past it would SIGBUS
+        directory = tempfile.mkdtemp()
+        try:
+            stats = os.statvfs(directory)
+            max_bytes = 2 * stats.f_blocks * stats.f_frsize
+            with self.assertRaises(ValueError):
+                audio_cache.SharedAudioCache(num_entries=4, max_bytes=max_bytes, directory=directory)
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
+        # Augmentation runs on a copy of the cached audio, which equals the decoded audio
+        augmentor = perturb.AudioAugmentor([(1.0, perturb.GainPerturbation())])
+        featurizer = WaveformFeaturizer(sample_rate=freq, augmentor=augmentor)
+        dataset = AudioDataset(
+            manifest_filepath=self.manifest_filepath,
+            labels=self.labels,
+            featurizer=featurizer,
+            audio_cache_max_bytes=2 ** 24,
+        )
+        plain_featurizer = WaveformFeaturizer(sample_rate=freq)
+        sample = dataset.collection[0]
+        expected = plain_featurizer.process(sample.audio_file, duration=sample.duration)
+        first, second = dataset[0][0], dataset[0][0]
+        self.assertTrue(np.array_equal(dataset.audio_cache.get(0), expected.numpy()))
+        self.assertEqual(first.shape, expected.shape)
+        self.assertFalse(torch.equal(first, second))
+        dataset.audio_cache.close()
+
+    @pytest.mark.unit
+    def test_polyphase_resample(self):
+        t = np.arange(2 * 8000) / 8000
+        samples = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * 1234 * t + 1)
+        samples = (samples + 0.2 * np.sin(2 * np.pi * 3000 * t)).astype(np.float32)
+        for target_sr in (16000, 7200):
+            expected = resample.resample(samples, 8000, target_sr, resample_type='kaiser_best')
+            resampled = resample.resample(samples, 8000, target_sr, resample_type='polyphase')
+            self.assertEqual(resampled.dtype, np.float32)
+            self.assertEqual(resampled.shape, expected.shape)
+            self.assertLess(np.abs(resampled - expected)[64:-64].max(), 1e-3)
+            self.assertLess(np.abs(resampled - expected).max(), 5e-2)
+
+        segment = AudioSegment(samples, 8000, target_sr=16000, resample_type='polyphase')
+        self.assertEqual(segment.sample_rate, 16000)
+        self.assertEqual(segment.num_samples, 2 * len(samples))
+        featurizer = WaveformFeaturizer.from_config(dict(self.featurizer_config, resample_type='polyphase'))
+        self.assertEqual(featurizer.resample_type, 'polyphase')
+        with self.assertRaises(ValueError):
+            resample.resample(samples, 8000, 16000, resample_type='linear')
+
+        # 8 kHz audio is resampled with the resampler of the data layer
+        data_dir = tempfile.mkdtemp()
+        try:
+            sf.write(os.path.join(data_dir, 'a.wav'), samples, 8000, subtype='FLOAT')
+            manifest_path = os.path.join(data_dir, 'manifest.json')
+            with open(manifest_path, 'w') as f:
+                item = {'audio_filepath': os.path.join(data_dir, 'a.wav'), 'duration': 2.0, 'text': 'a'}
+                f.write(json.dumps(item) + '\n')
+            dl = nemo_asr.AudioToTextDataLayer(
+                manifest_filepath=manifest_path,
+                labels=self.labels,
+                batch_size=1,
+                sample_rate=16000,
+                resample_type='polyphase',
+                shuffle=False,
+            )
+            audio, audio_len, _, _ = next(iter(dl.data_iterator))
+            self.assertEqual(int(audio_len[0]), 2 * len(samples))
+            expected = resample.resample(samples, 8000, 16000, resample_type='polyphase')
+            self.assertTrue(np.allclose(audio[0].numpy(), expected, atol=1e-6))
+        finally:
+            shutil.rmtree(data_dir)
+
+    @pytest.mark.unit
+    def test_silence_trim(self):
+        collection = collections.ASRAudioText(
+            manifests_files=self.manifest_filepath, parser=parsers.make_parser(self.labels, 'en')
+        )
+        segments = [AudioSegment.from_file(collection[i].audio_file) for i in range(4)]
+        silent = np.zeros(4000, dtype=np.float32)
+        for segment in segments:
+            # Same offsets as librosa, also with added leading and trailing silence
+            samples = np.concatenate([silent, segment.samples, silent])
+            _, expected = librosa.effects.trim(samples, 60)
+            trimmed = AudioSegment(samples, segment.sample_rate, trim=True)
+            self.assertEqual(trimmed.trim_offsets, tuple(expected))
+            self.assertEqual(trimmed.num_samples, expected[1] - expected[0])
+        # Silence is relative to the loudest frame, all-zero audio is kept whole as by librosa
+        self.assertEqual(silence.silence_trim_offsets(silent), tuple(librosa.effects.trim(silent, 60)[1]))
+        self.assertEqual(silence.silence_trim_offsets(silent), (0, len(silent)))
+        self.assertEqual(AudioSegment(silent, 16000, trim=True).trim_offsets, (0, len(silent)))
+
+        # Batches give the offsets of every utterance, whatever the padding
+        lengths = torch.tensor([segment.num_samples for segment in segments])
+        audio = torch.ones(len(segments), int(lengths.max()))
+        for i, segment in enumerate(segments):
+            audio[i, : lengths[i]] = torch.from_numpy(segment.samples)
+        trimmed, trimmed_len, start = silence.trim_batch(audio, lengths)
+        for i, segment in enumerate(segments):
+            offsets = silence.silence_trim_offsets(segment.samples)
+            self.assertEqual((int(start[i]), int(start[i] + trimmed_len[i])), offsets)
+            self.assertTrue(torch.equal(trimmed[i, : trimmed_len[i]], audio[i, offsets[0] : offsets[1]]))
+            self.assertEqual(trimmed[i, trimmed_len[i] :].abs().sum(), 0)
+
     @pytest.mark.unit
     def test_preprocessor_errors(self):
         def create_broken_preprocessor_1():
@@ -252,6 +612,18 @@ class TestUnitASRPytorch(TestCase):
         )
         self.assertTrue(len(dl_test_max) == 19)
 
+        # Matrices read on demand, with and without cache, are the ones of the whole scp
+        kaldi_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/asr/kaldi_an4/'))
+        id2feats = dict(kaldi_io.read_mat_scp(os.path.join(kaldi_dir, 'feats.scp')))
+        for cache_max_bytes in (0, 2 ** 20):
+            dataset = KaldiFeatureDataset(kaldi_dir=kaldi_dir, labels=self.labels, cache_max_bytes=cache_max_bytes)
+            for _ in range(2):
+                for i in range(len(dataset)):
+                    f, fl, _, _ = dataset[i]
+                    expected = id2feats[dataset.data[i]['utt_id']]
+                    self.assertTrue(np.array_equal(f.t().numpy(), expected))
+                    self.assertEqual(fl.item(), expected.shape[0])
+
     @pytest.mark.unit
     def test_tarred_dataloader(self):
         batch_size = 4
@@ -293,6 +665,733 @@ class TestUnitASRPytorch(TestCase):
             count += 1
         self.assertTrue(count == 65)
 
+    @pytest.mark.unit
+    def test_tarred_random_access(self):
+        target_dir = tempfile.mkdtemp()
+        try:
+            # Two shards of the test set, only the first one gets an index file
+            featurizer = WaveformFeaturizer.from_config(self.featurizer_config)
+            ds = AudioDataset(manifest_filepath=self.manifest_filepath, labels=self.labels, featurizer=featurizer)
+            manifest_path = os.path.join(target_dir, 'tarred_audio_manifest.json')
+            tar_paths = [os.path.join(target_dir, f'audio_{i}.tar') for i in range(2)]
+            with open(manifest_path, 'w') as m:
+                for i, tar_path in enumerate(tar_paths):
+                    with tarfile.open(tar_path, mode='w') as tar:
+                        for j in range(i, len(ds), 2):
+                            sample = ds.collection[j]
+                            name = f'sample_{sample.id}.wav'
+                            tar.add(sample.audio_file, arcname=name)
+                            entry = {'audio_filepath': name, 'duration': sample.duration, 'text': sample.text_raw}
+                            m.write(json.dumps(entry) + '\n')
+            tar_index.write_tar_index(tar_paths[0])
+
+            dl = nemo_asr.TarredAudioToTextDataLayer(
+                audio_tar_filepaths=os.path.join(target_dir, 'audio_{0..1}.tar'),
+                manifest_filepath=manifest_path,
+                labels=self.labels,
+                batch_size=4,
+                random_access=True,
+            )
+            self.assertEqual(len(dl), len(ds))
+            self.assertTrue(dl.shuffle)
+            expected = {f'sample_{ds.collection[i].id}.wav': ds[i] for i in range(len(ds))}
+            for i in reversed(range(len(dl))):
+                audio, _, tokens, _ = dl.dataset[i]
+                name = dl.dataset.collection[int(dl.dataset._manifest_idxs[i])].audio_file
+                expected_audio, _, expected_tokens, _ = expected[name]
+                self.assertTrue(torch.equal(audio, expected_audio))
+                self.assertTrue(torch.equal(tokens, expected_tokens))
+
+            # Samples missing from the tarballs are not part of the dataset
+            dl = nemo_asr.TarredAudioToTextDataLayer(
+                audio_tar_filepaths=tar_paths[:1],
+                manifest_filepath=manifest_path,
+                labels=self.labels,
+                batch_size=4,
+                random_access=True,
+                max_batch_duration=10.0,
+            )
+            self.assertEqual(len(dl), (len(ds) + 1) // 2)
+            self.assertIsNotNone(dl.batch_sampler)
+
+            with tarfile.open(os.path.join(target_dir, 'audio.tar.gz'), mode='w:gz') as tar:
+                tar.add(tar_paths[0], arcname='audio_0.tar')
+            with self.assertRaises(ValueError):
+                tar_index.build_tar_index(os.path.join(target_dir, 'audio.tar.gz'))
+        finally:
+            shutil.rmtree(target_dir)
+
+    @pytest.mark.unit
+    def test_tarred_shard_sampler(self):
+        num_shards, num_replicas, num_workers = 10, 2, 3
+        samplers = [
+            TarredShardSampler(num_workers=num_workers, num_replicas=num_replicas, rank=rank, seed=1)
+            for rank in range(num_replicas)
+        ]
+
+        def epoch_split():
+            return [
+                sampler.select(num_shards, worker_id=worker_id)
+                for sampler in samplers
+                for worker_id in range(num_workers)
+            ]
+
+        split = epoch_split()
+        # Every worker reads the same number of shards, shards are reused rather than dropped
+        self.assertEqual({len(shards) for shards in split}, {2})
+        read = [shard for shards in split for shard in shards]
+        self.assertEqual(set(read), set(range(num_shards)))
+        self.assertEqual(len(read) - len(set(read)), 2)
+        self.assertEqual(samplers[0].rank_shards(num_shards), split[0] + split[1] + split[2])
+
+        # Deterministic order, reshuffled every epoch
+        self.assertEqual(epoch_split(), split)
+        for sampler in samplers:
+            sampler.set_epoch(1)
+        self.assertNotEqual(epoch_split(), split)
+
+        # Without DataLoader workers, the whole rank share is read in order
+        sampler = TarredShardSampler(num_workers=0, shuffle=False, num_replicas=num_replicas, rank=1)
+        urls = [f'audio_{i}.tar' for i in range(num_shards)]
+        self.assertEqual(sampler(urls), urls[1::2])
+
+    @pytest.mark.unit
+    def test_noise_and_impulse_perturbation(self):
+        manifest = collections.ASRAudioText(self.manifest_filepath, parser=parsers.make_parser([]))
+        records = sorted(manifest.data, key=lambda record: record.duration)
+        data = AudioSegment.from_file(records[0].audio_file)
+
+        # Cached RIRs and their FFTs give the same result as a direct convolution
+        impulse_perturbation = perturb.ImpulsePerturbation(manifest_path=self.manifest_filepath, rng=random.Random(0))
+        impulse_perturbation._manifest.data = records[1:2]
+        impulse = AudioSegment.from_file(records[1].audio_file).samples
+        expected = signal.fftconvolve(
+            data.samples, (impulse - impulse.min()) / (impulse.max() - impulse.min()), "same"
+        )
+        for _ in range(2):
+            perturbed = AudioSegment(data.samples, data.sample_rate)
+            impulse_perturbation.perturb(perturbed)
+            self.assertEqual(perturbed.num_samples, data.num_samples)
+            self.assertTrue(np.allclose(perturbed.samples, expected, atol=1e-4))
+        self.assertEqual(len(impulse_perturbation._cache), 1)
+
+        # Noise recordings are read in segments, or cached whole if they are short
+        for cache_max_duration, cache_size in ((0.0, 0), (100.0, 1)):
+            noise_perturbation = perturb.NoisePerturbation(
+                manifest_path=self.manifest_filepath,
+                min_snr_db=10,
+                max_snr_db=10,
+                rng=random.Random(0),
+                cache_max_duration=cache_max_duration,
+            )
+            noise_perturbation._manifest.data = records[-1:]
+            perturbed = AudioSegment(data.samples, data.sample_rate)
+            noise_perturbation.perturb(perturbed)
+            self.assertEqual(perturbed.num_samples, data.num_samples)
+            noise_rms_db = 10 * np.log10(np.mean((perturbed.samples - data.samples) ** 2))
+            self.assertAlmostEqual(noise_rms_db, data.rms_db - 10, places=3)
+            self.assertEqual(len(noise_perturbation._cache), cache_size)
+
+        # A cache bounded by bytes evicts the least recently used entries
+        cache = perturb._AudioCache(max_bytes=100)
+        for key in range(3):
+            cache.get(key, lambda: {'samples': np.zeros(10, dtype=np.float32)})
+        cache.get(1, lambda: None)
+        cache.get(3, lambda: {'samples': np.zeros(10, dtype=np.float32)})
+        self.assertEqual(list(cache._entries), [1, 3])
+        self.assertEqual(cache.num_bytes, 80)
+
+    @pytest.mark.unit
+    def test_waveform_augmentation(self):
+        manifest = collections.ASRAudioText(self.manifest_filepath, parser=parsers.make_parser([]))
+        segments = [AudioSegment.from_file(manifest[i].audio_file) for i in range(4)]
+        length = torch.tensor([segment.num_samples for segment in segments])
+        signal_batch = torch.nn.utils.rnn.pad_sequence(
+            [torch.from_numpy(segment.samples) for segment in segments], batch_first=True
+        )
+        mask = torch.arange(signal_batch.shape[1])[None, :] < length[:, None]
+
+        def augment(seed=0, **kwargs):
+            augmentation = nemo_asr.WaveformAugmentation(seed=seed, **kwargs)
+            processed_signal, processed_length = augmentation.forward(signal_batch.clone(), length)
+            self.assertEqual(processed_signal.shape, signal_batch.shape)
+            self.assertTrue(torch.equal(processed_length, length))
+            self.assertFalse(processed_signal.masked_select(~mask).any())
+            return processed_signal
+
+        self.assertTrue(torch.equal(augment(), signal_batch))
+        gained = augment(gain_prob=1.0, min_gain_dbfs=-6.0, max_gain_dbfs=-6.0)
+        self.assertTrue(torch.allclose(gained, signal_batch * 10 ** (-6.0 / 20)))
+        self.assertTrue(torch.equal(augment(gain_prob=1.0, seed=1), augment(gain_prob=1.0, seed=1)))
+
+        # Shifts match ShiftPerturbation
+        shifted = augment(shift_prob=1.0, min_shift_ms=-2.0, max_shift_ms=-2.0)
+        for i, segment in enumerate(segments):
+            perturb.ShiftPerturbation(min_shift_ms=-2.0, max_shift_ms=-2.0).perturb(segment)
+            self.assertTrue(torch.equal(shifted[i, : length[i]], torch.from_numpy(segment.samples)))
+
+        # Noise is added at the requested SNR over the length of every sample
+        noisy = augment(noise_prob=1.0, noise_manifest=self.manifest_filepath, min_snr_db=10.0, max_snr_db=10.0)
+        noise = noisy - signal_batch
+        snr_db = 10 * torch.log10((signal_batch ** 2).sum(dim=1) / (noise ** 2).sum(dim=1))
+        self.assertTrue(torch.allclose(snr_db, torch.full_like(snr_db, 10.0), atol=1e-3))
+        white_noise = augment(white_noise_prob=1.0, min_white_noise_level=-40, max_white_noise_level=-40)
+        self.assertFalse(torch.equal(white_noise, signal_batch))
+
+        # RIR convolution matches ImpulsePerturbation
+        convolved = augment(impulse_prob=1.0, impulse_manifest=self.manifest_filepath, max_impulse_duration=100.0)
+        impulses = [AudioSegment.from_file(record.audio_file).samples for record in manifest]
+        for i in range(len(segments)):
+            samples = signal_batch[i, : length[i]].numpy()
+            candidates = [
+                signal.fftconvolve(samples, (impulse - impulse.min()) / (impulse.max() - impulse.min()), "same")
+                for impulse in impulses
+            ]
+            self.assertTrue(
+                any(np.allclose(convolved[i, : length[i]].numpy(), expected, atol=1e-3) for expected in candidates)
+            )
+
+    @pytest.mark.unit
+    def test_spectrogram_augmentation(self):
+        spec = torch.rand(8, 64, 200) + 1
+        length = torch.tensor([200, 150, 100, 50, 20, 10, 5, 1])
+        padding = torch.arange(200)[None, :] >= length[:, None]
+        spec.masked_fill_(padding[:, None, :], 0)
+
+        def augment(seed=0, **kwargs):
+            augmentation = nemo_asr.SpectrogramAugmentation(seed=seed, **kwargs)
+            return augmentation.forward(spec.clone(), length)
+
+        self.assertTrue(torch.equal(augment(), spec))
+        augmented = augment(freq_masks=2, time_masks=2, freq_width=15, time_width=0.1)
+        self.assertTrue(torch.equal(augmented, augment(freq_masks=2, time_masks=2, freq_width=15, time_width=0.1)))
+        self.assertFalse(torch.equal(augmented, augment(seed=1, freq_masks=2, time_masks=2, time_width=0.1)))
+
+        # Time masks are no wider than the adaptive width, masks stay out of the padding
+        masked = (augmented == 0) & ~padding[:, None, :]
+        masked_steps = masked.all(dim=1).sum(dim=1)
+        self.assertTrue((masked_steps <= 2 * (length.float() * 0.1).long().clamp(min=1)).all())
+        masked_freqs = masked.all(dim=2)
+        self.assertTrue((masked_freqs.sum(dim=1) <= 2 * 15).all())
+        self.assertTrue(masked.any())
+
+        augmented = augment(rect_masks=5, rect_time=10, rect_freq=20)
+        masked = augmented == 0
+        self.assertTrue(torch.equal(masked & padding[:, None, :], padding[:, None, :].expand_as(masked)))
+        self.assertTrue((masked & ~padding[:, None, :]).any())
+
+    @pytest.mark.unit
+    def test_normalize_batch(self):
+        x = torch.randn(6, 16, 120) * 3 - 5
+        seq_len = torch.tensor([120, 100, 64, 17, 5, 2])
+
+        per_feature = features.normalize_batch(x, seq_len, "per_feature")
+        all_features = features.normalize_batch(x, seq_len, "all_features")
+        for i in range(x.shape[0]):
+            valid = x[i, :, : seq_len[i]]
+            expected = (x[i] - valid.mean(dim=1, keepdim=True)) / (valid.std(dim=1, keepdim=True) + features.CONSTANT)
+            self.assertTrue(torch.allclose(per_feature[i], expected, atol=1e-5))
+            expected = (x[i] - valid.mean()) / (valid.std() + features.CONSTANT)
+            self.assertTrue(torch.allclose(all_features[i], expected, atol=1e-5))
+
+        # Running statistics of the last chunk of a stream match the offline ones
+        for normalize_type, offline in (("per_feature", per_feature), ("all_features", all_features)):
+            running_stats = features.RunningFeatureStats(normalize_type)
+            for start in range(0, 120, 40):
+                chunk_len = (seq_len - start).clamp(0, 40)
+                chunk = features.normalize_batch(x[:, :, start : start + 40], chunk_len, None, running_stats)
+            self.assertTrue(torch.allclose(chunk[0], offline[0, :, 80:], atol=1e-5))
+            self.assertTrue(torch.allclose(chunk[1, :, :20], offline[1, :, 80:100], atol=1e-5))
+        with self.assertRaises(ValueError):
+            features.RunningFeatureStats({"fixed_mean": 0.0, "fixed_std": 1.0})
+
+    @pytest.mark.unit
+    def test_streaming_inference(self):
+        block = {'repeat': 1, 'dropout': 0.0, 'residual': False}
+        preprocessor = nemo_asr.AudioToMelSpectrogramPreprocessor(features=32, dither=0.0, normalize=None)
+        encoder = nemo_asr.JasperEncoder(
+            jasper=[
+                {**block, 'filters': 32, 'kernel': [11], 'stride': [2], 'dilation': [1]},
+                {**block, 'filters': 32, 'kernel': [7], 'stride': [1], 'dilation': [1], 'residual': True},
+                {**block, 'filters': 32, 'kernel': [3], 'stride': [1], 'dilation': [2]},
+            ],
+            activation="relu",
+            feat_in=32,
+        )
+        decoder = nemo_asr.JasperDecoderForCTC(feat_in=32, num_classes=len(self.labels))
+        streamer = streaming.StreamingInference(preprocessor, encoder, decoder)
+        self.assertEqual(streamer.encoder_stride, 2)
+        self.assertEqual(streamer.left_context, 5 + 2 * 3 + 2 * 2)
+
+        audio = torch.randn(2, 16000 * 3 + 123)
+        with torch.no_grad():
+            features, features_len = preprocessor.forward(audio, torch.tensor([audio.shape[1]] * 2))
+            encoded, encoded_len = encoder.forward(features, features_len)
+            offline = decoder.forward(encoded)[:, : int(encoded_len[0])]
+
+        for chunk_size in (1600, 4000, 16000 * 4):
+            chunks = list(torch.split(audio, chunk_size, dim=1))
+            log_probs = [streamer.process(chunk, last=i == len(chunks) - 1) for i, chunk in enumerate(chunks)]
+            online = torch.cat([chunk for chunk in log_probs if chunk is not None], dim=1)
+            self.assertEqual(online.shape, offline.shape)
+            self.assertTrue(torch.allclose(online, offline, atol=1e-4))
+
+    @pytest.mark.unit
+    def test_jasper_encoder_masks(self):
+        block = {'repeat': 2, 'dropout': 0.0, 'residual': True}
+        jasper = [
+            {**block, 'filters': 32, 'kernel': [11], 'stride': [2], 'dilation': [1], 'residual': False},
+            {**block, 'filters': 32, 'kernel': [7], 'stride': [1], 'dilation': [1], 'separable': True},
+            {
+                **block,
+                'repeat': 1,
+                'filters': 48,
+                'kernel': [5],
+                'stride': [2],
+                'dilation': [1],
+                'residual_mode': 'stride_add',
+            },
+        ]
+        encoder = nemo_asr.JasperEncoder(jasper=jasper, activation="relu", feat_in=32)
+        skipping = nemo_asr.JasperEncoder(jasper=jasper, activation="relu", feat_in=32, skip_equal_length_masks=True)
+        skipping.load_state_dict(encoder.state_dict())
+        encoder.eval()
+        skipping.eval()
+
+        features = torch.randn(3, 32, 203)
+        with torch.no_grad():
+            # Padding is masked: every utterance gives the outputs it gives alone
+            lengths = torch.tensor([203, 150, 61])
+            encoded, encoded_len = encoder.forward(features, lengths)
+            for i, length in enumerate(lengths.tolist()):
+                alone, alone_len = encoder.forward(features[i : i + 1, :, :length], lengths[i : i + 1])
+                self.assertEqual(encoded_len[i], alone_len[0])
+                valid = encoded[i, :, : int(alone_len[0])]
+                self.assertTrue(torch.allclose(valid, alone[0, :, : int(alone_len[0])], atol=1e-5))
+
+            # Skipping the empty masks of equal lengths doesn't change outputs
+            lengths = torch.full((3,), 203)
+            encoded, encoded_len = encoder.forward(features, lengths)
+            skipped, skipped_len = skipping.forward(features, lengths)
+            self.assertTrue(torch.equal(encoded, skipped))
+            self.assertTrue(torch.equal(encoded_len, skipped_len))
+
+    @pytest.mark.unit
+    def test_jasper_encoder_optimize_for_inference(self):
+        block = {'repeat': 2, 'dropout': 0.2, 'residual': True, 'separable': True}
+        jasper = [
+            {**block, 'filters': 32, 'kernel': [11], 'stride': [2], 'dilation': [1], 'residual': False},
+            {**block, 'filters': 32, 'kernel': [7], 'stride': [1], 'dilation': [1], 'heads': 8},
+            {**block, 'filters': 48, 'kernel': [5], 'stride': [1], 'dilation': [1], 'groups': 2},
+            {**block, 'filters': 64, 'kernel': [1], 'stride': [1], 'dilation': [1], 'separable': False},
+        ]
+        encoder = nemo_asr.JasperEncoder(jasper=jasper, activation="relu", feat_in=32)
+        for module in encoder.modules():
+            if isinstance(module, torch.nn.BatchNorm1d):
+                module.running_mean.normal_()
+                module.running_var.uniform_(0.5, 2.0)
+                module.weight.data.uniform_(0.5, 1.5)
+                module.bias.data.normal_()
+        optimized = nemo_asr.JasperEncoder(jasper=jasper, activation="relu", feat_in=32)
+        optimized.load_state_dict(encoder.state_dict())
+        optimized.optimize_for_inference()
+        encoder.eval()
+
+        self.assertFalse(optimized.training)
+        self.assertFalse(any(isinstance(m, (torch.nn.BatchNorm1d, torch.nn.Dropout)) for m in optimized.modules()))
+        self.assertFalse(any(p.requires_grad for p in optimized.parameters()))
+        features = torch.randn(3, 32, 157)
+        with torch.no_grad():
+            for lengths in (torch.tensor([157, 100, 31]), torch.full((3,), 157)):
+                encoded, encoded_len = encoder.forward(features, lengths)
+                folded, folded_len = optimized.forward(features, lengths)
+                self.assertTrue(torch.equal(encoded_len, folded_len))
+                self.assertTrue(torch.allclose(encoded, folded, atol=1e-4, rtol=1e-4))
+
+    @pytest.mark.unit
+    def test_int8_quantization(self):
+        if self.nf.placement != DeviceType.CPU:
+            self.skipTest("Quantized modules run on CPU only")
+        block = {'repeat': 2, 'dropout': 0.0, 'residual': True, 'separable': True, 'dilation': [1]}
+        jasper = [
+            {**block, 'filters': 64, 'kernel': [11], 'stride': [2], 'residual': False},
+            {**block, 'filters': 64, 'kernel': [7], 'stride': [1]},
+        ]
+
+        def create_modules():
+            encoder = nemo_asr.JasperEncoder(jasper=jasper, activation="relu", feat_in=32)
+            decoder = nemo_asr.JasperDecoderForCTC(feat_in=64, num_classes=len(self.labels))
+            return encoder, decoder
+
+        def run(encoder, decoder, features, lengths):
+            encoded, encoded_len = encoder.forward(features, lengths)
+            return decoder.forward(encoded), encoded_len
+
+        encoder, decoder = create_modules()
+        encoder.optimize_for_inference()
+        decoder.eval()
+        quantized = create_modules()
+        quantized[0].optimize_for_inference()
+        for fp32, int8 in zip((encoder, decoder), quantized):
+            int8.load_state_dict(fp32.state_dict())
+            quantization.prepare_int8(int8)
+        self.assertRaises(ValueError, quantization.prepare_int8, quantized[0])
+
+        lengths = torch.tensor([200, 150, 90])
+        with torch.no_grad():
+            for _ in range(4):
+                run(*quantized, torch.randn(3, 32, 200), lengths)
+            for module in quantized:
+                quantization.convert_int8(module)
+            features = torch.randn(3, 32, 200)
+            log_probs, encoded_len = run(encoder, decoder, features, lengths)
+            int8_log_probs, int8_encoded_len = run(*quantized, features, lengths)
+        self.assertTrue(torch.equal(encoded_len, int8_encoded_len))
+        # Dense convolutions are int8, depthwise ones stay fp32
+        convs = [m for m in quantized[0].modules() if isinstance(m, torch.nn.Conv1d)]
+        self.assertTrue(convs and all(conv.groups > 1 for conv in convs))
+        self.assertLess((log_probs.exp() - int8_log_probs.exp()).abs().max().item(), 0.01)
+
+        checkpoint_dir = tempfile.mkdtemp()
+        try:
+            restored = create_modules()
+            restored[0].optimize_for_inference()
+            for i, (int8, module) in enumerate(zip(quantized, restored)):
+                path = os.path.join(checkpoint_dir, f"module{i}.pt")
+                int8.save_to(path)
+                quantization.convert_int8(quantization.prepare_int8(module))
+                module.restore_from(path)
+            with torch.no_grad():
+                restored_log_probs, _ = run(*restored, features, lengths)
+            self.assertTrue(torch.equal(int8_log_probs, restored_log_probs))
+        finally:
+            shutil.rmtree(checkpoint_dir)
+
+    @pytest.mark.unit
+    def test_ctc_greedy_collapse(self):
+        blank_id = len(self.labels)
+        predictions = torch.randint(0, blank_id + 1, (8, 50))
+        predictions[:, 10:20] = predictions[:, 10:11]
+        predictions[0] = blank_id
+        lengths = torch.tensor([50, 50, 49, 30, 10, 1, 0, 50])
+
+        tokens, tokens_len = ctc_greedy_collapse(predictions, blank_id, lengths)
+        for prediction, length, row, row_len in zip(predictions.tolist(), lengths, tokens, tokens_len):
+            expected, previous = [], blank_id
+            for p in prediction[:length]:
+                if p != previous and p != blank_id:
+                    expected.append(p)
+                previous = p
+            self.assertEqual(row[:row_len].tolist(), expected)
+            self.assertTrue((row[row_len:] == blank_id).all())
+
+        # Decoding collapsed predictions gives the same strings as collapsing on the fly
+        tokens, tokens_len = ctc_greedy_collapse(predictions, blank_id)
+        expected = post_process_predictions([predictions], self.labels)
+        self.assertEqual(post_process_predictions([tokens], self.labels, [tokens_len]), expected)
+        self.assertEqual(expected[0], "")
+
+        log_probs = torch.randn(4, 30, blank_id + 1).log_softmax(dim=-1)
+        decoder = nemo_asr.GreedyCTCDecoder(collapse=True)
+        tokens, tokens_len = decoder.forward(log_probs)
+        self.assertEqual(
+            post_process_predictions([tokens], self.labels, [tokens_len]),
+            post_process_predictions([nemo_asr.GreedyCTCDecoder().forward(log_probs)], self.labels),
+        )
+
+        # Padding outside of the labels is ignored past the transcript lengths
+        transcripts = torch.tensor([[0, 1, 2], [3, 4, 5]])
+        expected = post_process_transcripts([transcripts], [torch.tensor([3, 1])], self.labels)
+        for pad_id in (blank_id + 2, -1):
+            padded = transcripts.clone()
+            padded[1, 1:] = pad_id
+            self.assertEqual(post_process_transcripts([padded], [torch.tensor([3, 1])], self.labels), expected)
+
+    @pytest.mark.unit
+    def test_wer_accumulator(self):
+        rng = random.Random(0)
+        words = ["a", "bc", "def", "gh", "ijkl"]
+        references = [" ".join(rng.choices(words, k=rng.randint(1, 8))) for _ in range(100)]
+        hypotheses = [" ".join(rng.choices(words, k=rng.randint(0, 8))) for _ in range(100)]
+        wer = word_error_rate(hypotheses, references)
+        cer = word_error_rate(hypotheses, references, use_cer=True)
+
+        for num_workers in (0, 2):
+            accumulator = WERAccumulator(num_workers=num_workers, max_examples=5, seed=0)
+            for start in range(0, 100, 16):
+                accumulator.update(hypotheses[start : start + 16], references[start : start + 16])
+            accumulator.close()
+            self.assertAlmostEqual(accumulator.wer, wer)
+            self.assertAlmostEqual(accumulator.cer, cer)
+            self.assertEqual(accumulator.num_utterances, 100)
+            self.assertEqual(len(accumulator.examples), 5)
+            self.assertTrue(all(example in list(zip(hypotheses, references)) for example in accumulator.examples))
+
+        # Accumulators of parts of the data merge into the errors of all of it
+        first, second = WERAccumulator(max_examples=5), WERAccumulator(max_examples=5)
+        first.update(hypotheses[:30], references[:30])
+        second.update(hypotheses[30:], references[30:])
+        first.merge(second)
+        self.assertAlmostEqual(first.wer, wer)
+        self.assertAlmostEqual(first.cer, cer)
+        self.assertEqual(first.num_utterances, 100)
+        self.assertEqual(len(first.examples), 5)
+        with self.assertRaises(ValueError):
+            first.update(hypotheses[:2], references[:1])
+
+    @pytest.mark.unit
+    def test_ctc_beam_search(self):
+        arpa = "\n".join(
+            [
+                "\\data\\",
+                "ngram 1=5",
+                "ngram 2=2",
+                "",
+                "\\1-grams:",
+                "-1.0 <s> -0.5",
+                "-1.0 </s>",
+                "-0.7 ab -0.3",
+                "-1.5 ba",
+                "-2.0 <unk>",
+                "",
+                "\\2-grams:",
+                "-0.1 <s> ab",
+                "-0.2 ab ba",
+                "",
+                "\\end\\",
+            ]
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".arpa") as f:
+            f.write(arpa)
+            f.flush()
+            lm = ctc_beam_search.NGramLanguageModel(f.name)
+
+        ab, ba = lm.word_ids["ab"], lm.word_ids["ba"]
+        self.assertEqual(lm.order, 2)
+        self.assertAlmostEqual(lm.score(lm.start_state, ab)[0], -0.1 * np.log(10), places=5)
+        # Backs off from <s> to the unigram
+        log_prob, state = lm.score(lm.start_state, ba)
+        self.assertAlmostEqual(log_prob, -2.0 * np.log(10), places=5)
+        self.assertEqual(state, (ba,))
+        self.assertAlmostEqual(lm.score((ab,), None)[0], -2.0 * np.log(10), places=5)
+
+        # Without pruning and language model, the best beams are the most probable label sequences
+        vocab = [" ", "a", "b"]
+        log_probs = np.log(np.random.RandomState(0).dirichlet(np.ones(4), size=5))
+        totals = {}
+        for path in itertools.product(range(4), repeat=5):
+            text = "".join(vocab[c] for i, c in enumerate(path) if c != 3 and (i == 0 or c != path[i - 1]))
+            totals[text] = np.logaddexp(totals.get(text, -np.inf), log_probs[np.arange(5), path].sum())
+        expected = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:3]
+        results = ctc_beam_search.CTCPrefixBeamSearch(vocab, beam_width=1000).decode(log_probs)[:3]
+        self.assertEqual([text for _, text in results], [text for text, _ in expected])
+        self.assertTrue(np.allclose([score for score, _ in results], [score for _, score in expected]))
+
+        decoder = nemo_asr.CTCBeamSearchDecoder(
+            vocab, beam_width=8, alpha=1.0, beta=0.5, num_workers=2, cutoff_prob=0.99, cutoff_top_n=3
+        )
+        log_probs = torch.randn(3, 20, 4).log_softmax(dim=-1)
+        results = decoder.forward(log_probs, torch.tensor([20, 12, 1]))[0]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[1], decoder.search.decode(log_probs[1, :12].numpy()))
+        decoder.close()
+        self.assertIsNone(decoder.search._pool)
+
+    @pytest.mark.unit
+    def test_speaker_scoring(self):
+        rng = np.random.RandomState(0)
+        speakers = [f"spk{i}" for i in range(12)]
+        labels = np.array([f"{speakers[i % 12]}_{i}.wav" for i in range(60)])
+        embeddings = rng.randn(60, 16).astype(np.float32)
+        speaker_ids, centroids = speaker_scoring.speaker_centroids(embeddings, labels)
+        self.assertEqual(list(speaker_ids), sorted(speakers))
+        for speaker, centroid in zip(speaker_ids, centroids):
+            members = [speaker_scoring.speaker_from_filename(label) == speaker for label in labels]
+            self.assertTrue(np.allclose(centroid, embeddings[members].mean(axis=0)))
+
+        with tempfile.NamedTemporaryFile("w") as f:
+            trials = [(rng.choice(speakers), rng.choice(speakers)) for _ in range(200)]
+            f.write("".join(f"{x} {y} {'target' if x == y else 'nontarget'}\n" for x, y in trials))
+            f.flush()
+            x, y, trial_labels, lines = speaker_scoring.read_trials(f.name, speaker_ids)
+        self.assertEqual(len(lines), 200)
+        self.assertTrue(np.array_equal(trial_labels, [int(a == b) for a, b in trials]))
+        scores = speaker_scoring.score_trials(centroids, x, y, chunk_size=7)
+        for (a, b), score in zip(trials, scores):
+            u, v = centroids[list(speaker_ids).index(a)], centroids[list(speaker_ids).index(b)]
+            self.assertAlmostEqual(score, (u @ v / np.sqrt((u @ u) * (v @ v)) + 1) / 2)
+        # Fewer trials than speaker pairs are scored in chunks
+        chunked = speaker_scoring.score_trials(centroids, x[:100], y[:100], chunk_size=7)
+        self.assertTrue(np.allclose(chunked, scores[:100]))
+
+        # ROC of targets 0.9, 0.8, 0.6, 0.3 and non-targets 0.7, 0.5, 0.2, 0.1: the error rates cross at 1/4
+        scores = np.array([0.9, 0.8, 0.7, 0.6, 0.5, 0.3, 0.2, 0.1])
+        trial_labels = np.array([1, 1, 0, 1, 0, 1, 0, 0])
+        fpr, fnr, thresholds = speaker_scoring.roc_curve(scores, trial_labels)
+        self.assertTrue(np.allclose(fpr, [0, 0, 0, 0.25, 0.25, 0.5, 0.5, 0.75, 1]))
+        self.assertTrue(np.allclose(fnr, [1, 0.75, 0.5, 0.5, 0.25, 0.25, 0, 0, 0]))
+        self.assertTrue(np.array_equal(thresholds[1:], scores))
+        eer, threshold = speaker_scoring.equal_error_rate(scores, trial_labels)
+        self.assertAlmostEqual(eer, 0.25)
+        self.assertEqual(threshold, 0.6)
+        dcf, threshold = speaker_scoring.min_dcf(scores, trial_labels, p_target=0.5)
+        self.assertAlmostEqual(dcf, 0.5)
+        self.assertEqual(threshold, 0.8)
+
+    @pytest.mark.unit
+    def test_speaker_index(self):
+        rng = np.random.RandomState(0)
+        directions = rng.randn(20, 32).astype(np.float32)
+        speakers = rng.randint(0, 20, 500)
+        embeddings = directions[speakers] + 0.3 * rng.randn(500, 32).astype(np.float32)
+        labels = [f"spk{s}" for s in speakers]
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        queries = directions[:5] + 0.3 * rng.randn(5, 32).astype(np.float32)
+        expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :10]
+
+        index_dir = tempfile.mkdtemp()
+        try:
+            # Built in two parts, to enroll incrementally
+            index = speaker_index.build_speaker_index(index_dir, embeddings[:300], labels[:300])
+            index.add(embeddings[300:], labels[300:])
+            index = speaker_index.SpeakerIndex(index_dir)
+            self.assertEqual(len(index), 500)
+            self.assertTrue(np.allclose(index.embeddings, normalized, atol=1e-6))
+            self.assertEqual(list(index.labels(np.arange(500))), labels)
+
+            scores, indices = index.search(queries, k=10, block_size=64)
+            self.assertTrue(np.array_equal(indices, expected))
+            self.assertTrue(np.all(np.diff(scores, axis=1) <= 0))
+            self.assertEqual(list(index.labels(indices[:, 0])), [f"spk{s}" for s in range(5)])
+            with self.assertRaises(ValueError):
+                index.search(queries, k=10, nprobe=4)
+
+            index.train_ivf(num_lists=8, num_subvectors=8, seed=0)
+            # Probing all lists with exact reranking of all candidates is exact search
+            _, indices = index.search(queries, k=10, nprobe=8, rerank=500)
+            self.assertTrue(np.array_equal(indices, expected))
+            _, indices = index.search(queries, k=10, nprobe=2)
+            self.assertEqual(list(index.labels(indices[:, 0])), [f"spk{s}" for s in range(5)])
+
+            # Enrollment after training encodes the new entries
+            index.add(directions[5:6], ["new"])
+            _, indices = speaker_index.SpeakerIndex(index_dir).search(directions[5], k=1, nprobe=2, rerank=50)
+            self.assertEqual(indices[0, 0], 500)
+            _, indices = index.search(queries, k=600)
+            self.assertEqual(list(indices[:, -1]), [-1] * 5)
+        finally:
+            shutil.rmtree(index_dir)
+
+    @pytest.mark.unit
+    def test_vad_sliding_windows(self):
+        sample_rate = 16000
+        rng = np.random.RandomState(0)
+        audio = [rng.uniform(-1, 1, 16080).astype(np.float32), rng.uniform(-1, 1, 4000).astype(np.float32)]
+        data_dir = tempfile.mkdtemp()
+        try:
+            manifest_path = os.path.join(data_dir, 'manifest.json')
+            with open(manifest_path, 'w') as f:
+                for i, samples in enumerate(audio):
+                    sf.write(os.path.join(data_dir, f'{i}.wav'), samples, sample_rate, subtype='FLOAT')
+                    f.write(json.dumps({'audio_filepath': os.path.join(data_dir, f'{i}.wav')}) + '\n')
+                item = {'audio_filepath': os.path.join(data_dir, '0.wav'), 'offset': 0.5, 'duration': 0.2}
+                f.write(json.dumps(item) + '\n')
+
+            # Blocks shorter than windows, windows are centered on the frames and padded with zeros
+            dataset = vad.SlidingWindowDataset(
+                manifest_path,
+                sample_rate,
+                window_length_in_sec=0.05,
+                shift_length_in_sec=0.01,
+                block_length_in_sec=0.02,
+            )
+            items = list(dataset)
+            self.assertEqual(len(items), 101 + 25 + 20)
+            expected = ((audio[0], 0, 0, 101), (audio[1], 1, 101, 25), (audio[0][8000:11200], 2, 126, 20))
+            for samples, item, first, count in expected:
+                padded = np.concatenate([np.zeros(320, dtype=np.float32), samples, np.zeros(800, dtype=np.float32)])
+                for t in range(count):
+                    window, length, index, window_index, num_windows = items[first + t]
+                    self.assertEqual((length, index, window_index, num_windows), (800, item, t, count))
+                    self.assertTrue(np.array_equal(window.numpy(), padded[t * 160 : t * 160 + 800]))
+
+            class Preprocessor(torch.nn.Module):
+                def forward(self, audio, audio_len):
+                    return audio.mean(dim=1, keepdim=True), audio_len
+
+            class Encoder(torch.nn.Module):
+                def __init__(self):
+                    super().__init__()
+                    self.scale = torch.nn.Parameter(torch.tensor(10.0))
+
+                def forward(self, features, features_len):
+                    return features * self.scale, features_len
+
+            class Decoder(torch.nn.Module):
+                def forward(self, encoded):
+                    return torch.cat([-encoded, encoded], dim=1)
+
+            inference = vad.VADInference(Preprocessor(), Encoder(), Decoder(), batch_size=7)
+            probs = dict(inference(dataset))
+            self.assertEqual(sorted(probs), [0, 1, 2])
+            for item, first, count in ((0, 0, 101), (1, 101, 25), (2, 126, 20)):
+                means = torch.stack([items[first + t][0] for t in range(count)]).mean(dim=1)
+                self.assertTrue(np.allclose(probs[item], torch.sigmoid(20 * means).numpy(), atol=1e-6))
+        finally:
+            shutil.rmtree(data_dir)
+
+    @pytest.mark.unit
+    def test_vad_postprocessing(self):
+        merged = vad.merge_overlapping_windows(
+            np.eye(1, 10, 4)[0], window_length_in_sec=0.05, shift_length_in_sec=0.01
+        )
+        # Window 4 overlaps frames 2 to 6, whose means are over 5 windows, 4 at the edges
+        self.assertTrue(np.allclose(merged, [0, 0, 0.2, 0.2, 0.2, 0.2, 0.2, 0, 0, 0]))
+        self.assertTrue(np.allclose(vad.merge_overlapping_windows(np.full(10, 0.7), 0.05, 0.01), 0.7))
+
+        probs = np.concatenate(
+            [
+                np.zeros(100),
+                np.full(20, 0.4),  # Above offset next to speech
+                np.full(50, 0.9),
+                np.zeros(10),  # Gap shorter than min_duration_off
+                np.full(30, 0.9),
+                np.zeros(100),
+                np.full(5, 0.9),  # Shorter than min_duration_on
+                np.zeros(50),
+                np.full(30, 0.4),  # Above offset, never above onset
+                np.zeros(50),
+            ]
+        )
+        self.assertEqual(vad.speech_segments(probs, median_filter_in_sec=0), [(1.0, 2.1)])
+        self.assertEqual(
+            vad.speech_segments(probs, median_filter_in_sec=0, min_duration_off=0.05), [(1.0, 1.7), (1.8, 2.1)]
+        )
+        self.assertEqual(vad.speech_segments(probs[:205], median_filter_in_sec=0, duration=2.03), [(1.0, 2.03)])
+        # The median filter removes short bursts
+        self.assertEqual(vad.speech_segments(probs, median_filter_in_sec=0.11, min_duration_on=0), [(1.0, 2.1)])
+        with self.assertRaises(ValueError):
+            vad.speech_segments(probs, onset=0.3, offset=0.5)
+
+        data_dir = tempfile.mkdtemp()
+        try:
+            manifest_path = os.path.join(data_dir, 'segments.json')
+            segments = [('a.wav', 0.0, [(1.0, 2.1)]), ('b.wav', 3.0, [(0.5, 1.0), (2.0, 2.25)])]
+            count = vad.write_segments_manifest(manifest_path, segments)
+            self.assertEqual(count, 3)
+            with open(manifest_path) as f:
+                entries = [json.loads(line) for line in f]
+            self.assertEqual(
+                entries,
+                [
+                    {'audio_filepath': 'a.wav', 'offset': 1.0, 'duration': 1.1, 'label': 'speech'},
+                    {'audio_filepath': 'b.wav', 'offset': 3.5, 'duration': 0.5, 'label': 'speech'},
+                    {'audio_filepath': 'b.wav', 'offset': 5.0, 'duration': 0.25, 'label': 'speech'},
+                ],
+            )
+        finally:
+            shutil.rmtree(data_dir)
+
     @pytest.mark.unit
     def test_trim_silence(self):
         batch_size = 4